@@ -1,110 +1,135 @@
-import sqlite3
+import heapq
+import os
+import sys
+from collections import deque
 from datetime import datetime, timedelta
 import time
 import random
+import uuid
+
+from sqlalchemy import bindparam, text
+
+import metrics
+import storage
+from alert_dedup import raise_alerts
+from id_tail import IdTail
+from trajectory import Tracks, score_tracks
+
+INACTIVITY_LIMIT = timedelta(minutes=15)
+DEVIATION_WINDOW = timedelta(hours=1)
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+ALERT_LABELS = {'inactivity': 'INACTIVITY ALERT', 'deviation': 'ROUTE DEVIATION', 'speed_anomaly': 'SPEED ANOMALY'}
+
+def parse_db_time(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
 
 class AIAnomalyDetector:
-    def __init__(self, db_path='tourist.db'):
-        self.db_path = db_path
+    def __init__(self, engine=None):
+        # Same database, pragmas and pool settings as the web app
+        self.engine = engine or storage.get_engine()
     
     def get_db_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        return self.engine.connect()
     
     def detect_inactivity(self):
         """Detect tourists inactive for more than 15 minutes"""
+        started = time.perf_counter()
         conn = self.get_db_connection()
         
-        # Get latest location for each tourist
+        # Latest location per tourist is maintained by the ingestion path
         query = """
-        SELECT l.tourist_id, MAX(l.timestamp) as last_seen
-        FROM location l
-        GROUP BY l.tourist_id
-        HAVING datetime(last_seen) < datetime('now', '-15 minutes')
+        SELECT tourist_id, latitude, longitude
+        FROM latest_location
+        WHERE timestamp < :cutoff
         """
         
-        inactive_tourists = conn.execute(query).fetchall()
+        cutoff = datetime.utcnow() - INACTIVITY_LIMIT
+        inactive_tourists = conn.execute(text(query), {'cutoff': cutoff.strftime(TIMESTAMP_FORMAT)}).mappings().all()
         
-        for tourist in inactive_tourists:
-            # Check if alert already exists
-            existing_alert = conn.execute(
-                "SELECT id FROM alert WHERE tourist_id = ? AND alert_type = 'inactivity' AND resolved = 0",
-                (tourist['tourist_id'],)
-            ).fetchone()
-            
-            if not existing_alert:
-                conn.execute(
-                    "INSERT INTO alert (tourist_id, alert_type, message) VALUES (?, ?, ?)",
-                    (tourist['tourist_id'], 'inactivity', f"Tourist {tourist['tourist_id']} inactive for >15 minutes")
-                )
-                print(f"🚨 INACTIVITY ALERT: Tourist {tourist['tourist_id']} inactive since {tourist['last_seen']}")
+        # One set-based insert skips tourists that already have an open (or cooling down) alert
+        self.raise_alerts(conn, [
+            (tourist['tourist_id'], 'inactivity',
+             f"Tourist {tourist['tourist_id']} inactive for >15 minutes", tourist['latitude'], tourist['longitude'])
+            for tourist in inactive_tourists
+        ])
         
         conn.commit()
         conn.close()
+        metrics.observe_detector('inactivity', time.perf_counter() - started, len(inactive_tourists))
     
-    def detect_route_deviation(self):
-        """Simulate route deviation detection"""
+    def detect_trajectory_anomalies(self):
+        """Route deviation and speed anomalies over the last hour of fixes, scored in one vectorized pass"""
+        started = time.perf_counter()
         conn = self.get_db_connection()
         
-        # Get recent locations
-        query = """
-        SELECT tourist_id, latitude, longitude, timestamp
-        FROM location
-        WHERE datetime(timestamp) > datetime('now', '-1 hour')
-        ORDER BY tourist_id, timestamp DESC
-        """
-        
-        locations = conn.execute(query).fetchall()
-        
-        # Group by tourist
-        tourist_locations = {}
-        for loc in locations:
-            if loc['tourist_id'] not in tourist_locations:
-                tourist_locations[loc['tourist_id']] = []
-            tourist_locations[loc['tourist_id']].append(loc)
-        
-        for tourist_id, locs in tourist_locations.items():
-            if len(locs) >= 3:
-                # Simple deviation detection: if tourist moves >5km from starting point
-                start_lat, start_lng = locs[-1]['latitude'], locs[-1]['longitude']
-                current_lat, current_lng = locs[0]['latitude'], locs[0]['longitude']
-                
-                # Rough distance calculation (not precise, for demo)
-                distance = ((current_lat - start_lat) ** 2 + (current_lng - start_lng) ** 2) ** 0.5
-                
-                if distance > 0.05:  # Roughly 5km
-                    existing_alert = conn.execute(
-                        "SELECT id FROM alert WHERE tourist_id = ? AND alert_type = 'deviation' AND resolved = 0",
-                        (tourist_id,)
-                    ).fetchone()
-                    
-                    if not existing_alert:
-                        conn.execute(
-                            "INSERT INTO alert (tourist_id, alert_type, message, latitude, longitude) VALUES (?, ?, ?, ?, ?)",
-                            (tourist_id, 'deviation', f"Tourist {tourist_id} deviated from expected route", current_lat, current_lng)
-                        )
-                        print(f"🚨 ROUTE DEVIATION: Tourist {tourist_id} moved significantly from starting point")
+        tracks = Tracks.load(conn, datetime.utcnow() - DEVIATION_WINDOW)
+        self.emit_trajectory_alerts(conn, score_tracks(tracks))
         
         conn.commit()
         conn.close()
+        metrics.observe_detector('trajectory', time.perf_counter() - started, len(tracks))
+    
+    def emit_trajectory_alerts(self, conn, scores, skip_deviation=(), skip_speed=()):
+        """Raise deviation/speed_anomaly alerts for flagged tourists; returns (deviated, speeding) id sets"""
+        candidates = []
+        deviated = set()
+        for i in scores.deviations():
+            tourist_id = scores.tourist_ids[i]
+            deviated.add(tourist_id)
+            if tourist_id in skip_deviation:
+                continue
+            km = scores.displacement_m[i] / 1000
+            candidates.append((tourist_id, 'deviation',
+                               f"Tourist {tourist_id} deviated from expected route ({km:.1f} km from start of last hour)",
+                               scores.last_latitude[i], scores.last_longitude[i]))
+        
+        speeding = set()
+        for i in scores.speed_anomalies():
+            tourist_id = scores.tourist_ids[i]
+            speeding.add(tourist_id)
+            if tourist_id in skip_speed:
+                continue
+            kmh = scores.sustained_speed_kmh[i]
+            candidates.append((tourist_id, 'speed_anomaly',
+                               f"AI detected speed anomaly for tourist {tourist_id}: moving at {kmh:.0f} km/h",
+                               scores.last_latitude[i], scores.last_longitude[i]))
+        
+        self.raise_alerts(conn, candidates)
+        return deviated, speeding
+    
+    def raise_alerts(self, conn, candidates):
+        """Insert the candidates without an open alert of the same type (see alert_dedup.py)"""
+        raised = raise_alerts(conn, candidates)
+        for _, _, alert_type, message in raised:
+            print(f"🚨 {ALERT_LABELS.get(alert_type, alert_type.upper())}: {message}")
+        return raised
+    
+    def _insert_alert(self, conn, tourist_id, alert_type, message, latitude=None, longitude=None):
+        """Insert one alert as its own incident (fresh correlation id)"""
+        conn.execute(
+            text("INSERT INTO alert (tourist_id, alert_type, message, latitude, longitude, timestamp, resolved, correlation_id) "
+                 "VALUES (:tourist_id, :alert_type, :message, :latitude, :longitude, :timestamp, false, :correlation_id)"),
+            {'tourist_id': tourist_id, 'alert_type': alert_type, 'message': message,
+             'latitude': None if latitude is None else float(latitude),
+             'longitude': None if longitude is None else float(longitude),
+             'timestamp': datetime.utcnow().strftime(TIMESTAMP_FORMAT),
+             'correlation_id': uuid.uuid4().hex}
+        )
     
     def simulate_random_alerts(self):
         """Generate random alerts for demonstration"""
         conn = self.get_db_connection()
         
         # Get active tourists
-        tourists = conn.execute("SELECT tourist_id FROM tourist").fetchall()
+        tourists = conn.execute(text("SELECT tourist_id FROM tourist")).mappings().all()
         
         if tourists and random.random() < 0.3:  # 30% chance
             tourist = random.choice(tourists)
-            alert_types = ['suspicious_activity', 'geo_fence_breach', 'speed_anomaly']
+            alert_types = ['suspicious_activity']
             alert_type = random.choice(alert_types)
             
-            conn.execute(
-                "INSERT INTO alert (tourist_id, alert_type, message) VALUES (?, ?, ?)",
-                (tourist['tourist_id'], alert_type, f"AI detected {alert_type.replace('_', ' ')} for tourist {tourist['tourist_id']}")
-            )
+            self._insert_alert(conn, tourist['tourist_id'], alert_type,
+                               f"AI detected {alert_type.replace('_', ' ')} for tourist {tourist['tourist_id']}")
             print(f"🤖 AI ALERT: {alert_type} detected for tourist {tourist['tourist_id']}")
         
         conn.commit()
@@ -118,7 +143,7 @@ class AIAnomalyDetector:
         while True:
             try:
                 self.detect_inactivity()
-                self.detect_route_deviation()
+                self.detect_trajectory_anomalies()
                 self.simulate_random_alerts()
                 
                 print(f"✅ Monitoring cycle completed at {datetime.now().strftime('%H:%M:%S')}")
@@ -131,6 +156,232 @@ class AIAnomalyDetector:
                 print(f"❌ Error in AI engine: {e}")
                 time.sleep(30)
 
+class TouristState:
+    """Rolling per-tourist state kept by the incremental engine"""
+    __slots__ = ('last_seen', 'version', 'window', 'inactive_alerted', 'deviation_alerted', 'speed_alerted')
+
+    def __init__(self):
+        self.last_seen = None
+        self.version = 0
+        self.window = deque()  # (timestamp, latitude, longitude), oldest first
+        self.inactive_alerted = False
+        self.deviation_alerted = False
+        self.speed_alerted = False
+
+
+class IncrementalAnomalyEngine(AIAnomalyDetector):
+    """Event-driven detector that only reads location rows added since its high-water mark
+
+    The mark is an IdTail, so fixes committed out of id order (PostgreSQL)
+    are still read. Inactivity fires from a deadline heap instead of rescanning every tourist,
+    so the cost of a cycle scales with the number of new fixes
+    """
+
+    STATE_KEY = 'ai_engine.location_high_water'
+
+    def __init__(self, engine=None, poll_interval=5, batch_size=5000):
+        super().__init__(engine)
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.tail = IdTail('location')
+        self.tourists = {}
+        self.deadlines = []  # heap of (deadline, tourist_id, version)
+        self.rows_read = 0
+        self.stale = False  # set when a cycle failed after changing state its alerts never committed
+
+    def reset(self, conn):
+        """Rebuild the rolling state from committed rows after a failed cycle
+
+        A cycle pops deadlines, sets alert flags and advances the id tail
+        before its alerts commit; after a rollback that state would claim
+        alerts that were never written, and those tourists would not be
+        alerted again
+        """
+        self.tail = IdTail('location')
+        self.tourists = {}
+        self.deadlines = []
+        self.bootstrap(conn)
+        conn.rollback()
+        self.stale = False
+
+    def bootstrap(self, conn):
+        """Seed rolling state from latest_location and the last hour of fixes"""
+        row = conn.execute(text("SELECT value FROM engine_state WHERE key = :key"), {'key': self.STATE_KEY}).first()
+        # Ids missing just below the saved mark may still have been in flight at shutdown
+        self.tail.seed(conn, int(row.value) if row else None)
+
+        for latest in conn.execute(text("SELECT tourist_id, timestamp FROM latest_location")).mappings():
+            self._observe_time(latest['tourist_id'], parse_db_time(latest['timestamp']))
+
+        cutoff = datetime.utcnow() - DEVIATION_WINDOW
+        recent = conn.execute(
+            text("SELECT tourist_id, latitude, longitude, timestamp FROM location "
+                 "WHERE timestamp > :cutoff AND id <= :high_water ORDER BY timestamp, id"),
+            {'cutoff': cutoff.strftime(TIMESTAMP_FORMAT), 'high_water': self.tail.high_water}
+        ).mappings()
+        for fix in recent:
+            self._state(fix['tourist_id']).window.append(
+                (parse_db_time(fix['timestamp']), fix['latitude'], fix['longitude'])
+            )
+
+        # Tourists that already have an open inactivity alert should not get a duplicate
+        for alert in conn.execute(
+            text("SELECT tourist_id FROM alert WHERE resolved = false AND alert_type = 'inactivity'")
+        ).mappings():
+            self._state(alert['tourist_id']).inactive_alerted = True
+
+        print(f"🤖 Engine state loaded: {len(self.tourists)} tourists, high-water location id {self.tail.high_water}")
+
+    def _state(self, tourist_id):
+        state = self.tourists.get(tourist_id)
+        if state is None:
+            state = self.tourists[tourist_id] = TouristState()
+        return state
+
+    def _observe_time(self, tourist_id, timestamp):
+        state = self._state(tourist_id)
+        if state.last_seen is not None and timestamp <= state.last_seen:
+            return state
+        state.last_seen = timestamp
+        state.version += 1
+        state.inactive_alerted = False
+        heapq.heappush(self.deadlines, (timestamp + INACTIVITY_LIMIT, tourist_id, state.version))
+        return state
+
+    def consume_new_locations(self, conn):
+        """Fold location rows past the high-water mark into per-tourist state
+
+        Returns the set of tourists that received new fixes
+        """
+        touched = set()
+        self.rows_read = 0
+        while True:
+            rows = conn.execute(
+                text("SELECT id, tourist_id, latitude, longitude, timestamp FROM location "
+                     "WHERE id > :high_water OR id IN :gaps ORDER BY id LIMIT :batch_size")
+                .bindparams(bindparam('gaps', expanding=True)),
+                dict(self.tail.params(), batch_size=self.batch_size)
+            ).mappings().all()
+            self.rows_read += len(rows)
+            for fix in rows:
+                timestamp = parse_db_time(fix['timestamp'])
+                state = self._observe_time(fix['tourist_id'], timestamp)
+                state.window.append((timestamp, fix['latitude'], fix['longitude']))
+                touched.add(fix['tourist_id'])
+            self.tail.advance([fix['id'] for fix in rows])
+            if len(rows) < self.batch_size:
+                return touched
+
+    def check_trajectories(self, conn, tourist_ids):
+        """Score the rolling windows of tourists with new fixes in one vectorized pass"""
+        cutoff = datetime.utcnow() - DEVIATION_WINDOW
+        rows = []
+        for tourist_id in tourist_ids:
+            state = self.tourists[tourist_id]
+            window = state.window
+            if len(window) > 1 and window[-1][0] < window[-2][0]:
+                # Buffered batches can arrive out of time order
+                state.window = window = deque(sorted(window))
+            while window and window[0][0] <= cutoff:
+                window.popleft()
+            rows.extend((tourist_id, lat, lng, timestamp) for timestamp, lat, lng in window)
+        
+        scores = score_tracks(Tracks.from_rows(rows))
+        deviated, speeding = self.emit_trajectory_alerts(
+            conn, scores,
+            skip_deviation={t for t in tourist_ids if self.tourists[t].deviation_alerted},
+            skip_speed={t for t in tourist_ids if self.tourists[t].speed_alerted}
+        )
+        
+        # Flags mark an ongoing episode so the alert is not re-raised every cycle
+        for tourist_id in tourist_ids:
+            state = self.tourists[tourist_id]
+            state.deviation_alerted = tourist_id in deviated
+            state.speed_alerted = tourist_id in speeding
+    
+    def check_inactivity(self, conn):
+        """Pop expired deadlines; a deadline is stale if a newer fix bumped the version"""
+        now = datetime.utcnow()
+        candidates = []
+        while self.deadlines and self.deadlines[0][0] <= now:
+            _, tourist_id, version = heapq.heappop(self.deadlines)
+            state = self.tourists.get(tourist_id)
+            if state is None or state.version != version or state.inactive_alerted:
+                continue
+            state.inactive_alerted = True
+            # Drop the rolling window; nothing new will arrive until the tourist moves
+            state.window.clear()
+            candidates.append((tourist_id, 'inactivity',
+                               f"Tourist {tourist_id} inactive for >15 minutes", None, None))
+        self.raise_alerts(conn, candidates)
+
+    def run_cycle(self, conn):
+        started = time.perf_counter()
+        touched = self.consume_new_locations(conn)
+        self.check_trajectories(conn, touched)
+        self.check_inactivity(conn)
+        # Alerts and the high-water mark commit together, so a crash replays cleanly
+        conn.execute(
+            text("INSERT INTO engine_state (key, value, updated_at) VALUES (:key, :value, :updated_at) "
+                 "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at"),
+            {'key': self.STATE_KEY, 'value': str(self.tail.high_water),
+             'updated_at': datetime.utcnow().strftime(TIMESTAMP_FORMAT)}
+        )
+        conn.commit()
+        metrics.observe_detector('incremental', time.perf_counter() - started, self.rows_read)
+        return len(touched)
+
+    def run_monitoring(self):
+        """Main monitoring loop"""
+        print("🤖 AI Anomaly Detection Engine Started (incremental mode)")
+        print("Monitoring for inactivity, route deviations, and other anomalies...")
+        
+        conn = self.get_db_connection()
+        self.bootstrap(conn)
+        last_simulation = 0
+        
+        while True:
+            try:
+                if self.stale:
+                    self.reset(conn)
+                touched = self.run_cycle(conn)
+                if touched:
+                    print(f"✅ Processed fixes from {touched} tourists at {datetime.now().strftime('%H:%M:%S')}")
+                if time.monotonic() - last_simulation >= 60:
+                    self.simulate_random_alerts()
+                    last_simulation = time.monotonic()
+                time.sleep(self.poll_interval)
+                
+            except KeyboardInterrupt:
+                print("\n🛑 AI Engine stopped by user")
+                break
+            except Exception as e:
+                print(f"❌ Error in AI engine: {e}")
+                conn.rollback()
+                self.stale = True
+                time.sleep(self.poll_interval)
+        
+        conn.close()
+
 if __name__ == "__main__":
-    detector = AIAnomalyDetector()
-    detector.run_monitoring()
\ No newline at end of file
+    if '--full-scan' in sys.argv:
+        # Legacy mode: rescan everything every minute
+        detector = AIAnomalyDetector()
+    elif '--workers' in sys.argv:
+        # Full scans split by tourist shard over a process pool
+        from detectors import ShardedAnomalyEngine
+        args = sys.argv[1:]
+        detector = ShardedAnomalyEngine(
+            workers=int(args[args.index('--workers') + 1]),
+            shards=int(args[args.index('--shards') + 1]) if '--shards' in args else None
+        )
+    else:
+        detector = IncrementalAnomalyEngine()
+    if '--metrics-port' in sys.argv:
+        # Detector cycle metrics for Prometheus; this process has no web app of its own
+        metrics.serve(int(sys.argv[sys.argv.index('--metrics-port') + 1]))
+    if '--no-retention' not in sys.argv:
+        # Archives and downsamples old fixes on its own thread, in short chunked transactions
+        from retention import RetentionJob
+        RetentionJob(detector.engine).start(float(os.environ.get('RETENTION_INTERVAL', 3600)))
+    detector.run_monitoring()
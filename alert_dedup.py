@@ -0,0 +1,84 @@
+"""
+Set-based deduplication for detector alerts
+Detectors hand over a whole batch of candidates. One INSERT ... SELECT adds
+the candidates that have neither an unresolved alert of the same type nor
+one raised within that type's cooldown, so a tourist flapping in and out of
+an anomaly is not alerted every cycle. The partial unique index
+ix_alert_open_detector (one unresolved alert per tourist and detector type)
+backs this up when two engines race; the loser's rows are dropped by
+ON CONFLICT DO NOTHING.
+
+Geofence breaches go through here too, matched on the message as well (it
+names the zone), so every worker and every restart that sees a tourist
+inside a zone does not raise the same breach again.
+
+Each batch costs the same four statements however many candidates it has.
+"""
+
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import Boolean, Column, DateTime, Float, MetaData, String, Table, Text, bindparam, text
+
+import metrics
+from models import DETECTOR_ALERT_TYPES
+
+DEFAULT_COOLDOWN = timedelta(seconds=float(os.environ.get('ALERT_COOLDOWN_SECONDS', 900)))
+# No new alert of a type for a tourist within this long of the previous one, even if it was resolved
+COOLDOWNS = {alert_type: DEFAULT_COOLDOWN for alert_type in DETECTOR_ALERT_TYPES + ('geo_fence_breach',)}
+# Types deduplicated per message rather than per type (one breach alert per zone)
+PER_MESSAGE_TYPES = {'geo_fence_breach'}
+
+# Per-connection scratch table the batch is loaded into
+candidate_metadata = MetaData()
+alert_candidate = Table(
+    'alert_candidate', candidate_metadata,
+    Column('tourist_id', String(20)),
+    Column('alert_type', String(50)),
+    Column('message', Text),
+    Column('latitude', Float),
+    Column('longitude', Float),
+    Column('correlation_id', String(32)),
+    Column('suppress_after', DateTime),
+    Column('per_message', Boolean),
+    prefixes=['TEMPORARY']
+)
+
+INSERT_NEW = text(
+    "INSERT INTO alert (tourist_id, alert_type, message, latitude, longitude, timestamp, resolved, correlation_id) "
+    "SELECT c.tourist_id, c.alert_type, c.message, c.latitude, c.longitude, :timestamp, false, c.correlation_id "
+    "FROM alert_candidate c WHERE NOT EXISTS ("
+    "SELECT 1 FROM alert a WHERE a.tourist_id = c.tourist_id AND a.alert_type = c.alert_type "
+    "AND (c.per_message = false OR a.message = c.message) "
+    "AND (a.resolved = false OR a.timestamp > c.suppress_after)) "
+    "ON CONFLICT DO NOTHING "
+    "RETURNING id, tourist_id, alert_type, message"
+).bindparams(bindparam('timestamp', type_=DateTime))
+
+
+def raise_alerts(conn, candidates, now=None, cooldowns=COOLDOWNS):
+    """Insert the new ones of [(tourist_id, alert_type, message, latitude, longitude)]
+
+    Returns [(id, tourist_id, alert_type, message)] for the alerts inserted;
+    the caller commits
+    """
+    if not candidates:
+        return []
+    now = now or datetime.utcnow()
+    alert_candidate.create(conn, checkfirst=True)
+    conn.execute(alert_candidate.delete())
+    conn.execute(alert_candidate.insert(), [{
+        'tourist_id': tourist_id,
+        'alert_type': alert_type,
+        'message': message,
+        'latitude': None if latitude is None else float(latitude),
+        'longitude': None if longitude is None else float(longitude),
+        'correlation_id': uuid.uuid4().hex,
+        'suppress_after': now - cooldowns.get(alert_type, timedelta(0)),
+        'per_message': alert_type in PER_MESSAGE_TYPES
+    } for tourist_id, alert_type, message, latitude, longitude in candidates])
+    raised = [tuple(row) for row in conn.execute(INSERT_NEW, {'timestamp': now})]
+    for _, _, alert_type, _ in raised:
+        metrics.alerts_raised.inc(1, alert_type)
+    return raised
@@ -1,41 +1,86 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
-from models import db, Tourist, Location, Alert, Incident, Group, GroupMember
-import qrcode
-import io
-import base64
-import random
-import string
-from datetime import datetime
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, session, flash, stream_with_context
+from models import db, Tourist, Location, LatestLocation, Alert, Incident, Group, GroupMember, GeoFence, PanicDelivery, new_correlation_id
+from location_buffer import LocationWriteBuffer, parse_fix
+from positions import latest_positions
+from pagination import InvalidQuery, encode_cursor, decode_cursor, parse_limit, parse_time, parse_bbox
+from changes import changed_rows, changes_after, current_seq, decode_change_cursor, encode_change_cursor, is_change_cursor
+from events import EventHub, format_sse
+from geofence import geofence_monitor, import_geojson
+from alert_dedup import raise_alerts
+from proximity import position_grid
+from fanout import GroupFanout
+from response_cache import response_cache
+from qr import FORMATS, qr_payload, qr_store
+from bulk_import import InvalidGroupLeader, import_tourists, read_manifest
+from id_allocator import tourist_ids, group_codes, efir_numbers
+from storage import configure_app as configure_storage
+from track_store import encode_polyline, track_store
+import metrics
+import csv
+import json
+import time
+from datetime import datetime, timezone, timedelta
 from functools import wraps
+from sqlalchemy import update
 
 app = Flask(__name__)
 import os
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///tourist.db')
+configure_storage(app)  # SQLALCHEMY_DATABASE_URI and engine options from DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['LOCATION_BUFFER_ENABLED'] = os.environ.get('LOCATION_BUFFER_ENABLED', '1') != '0'
+app.config['LOCATION_BUFFER_MAX_ROWS'] = int(os.environ.get('LOCATION_BUFFER_MAX_ROWS', 500))
+app.config['LOCATION_BUFFER_FLUSH_MS'] = int(os.environ.get('LOCATION_BUFFER_FLUSH_MS', 250))
+app.config['LOCATION_BUFFER_CAPACITY'] = int(os.environ.get('LOCATION_BUFFER_CAPACITY', 50000))
+app.config['LATEST_CACHE_SIZE'] = int(os.environ.get('LATEST_CACHE_SIZE', 100000))
+app.config['LATEST_CACHE_TTL'] = float(os.environ.get('LATEST_CACHE_TTL', 5))
+app.config['SSE_MAX_SECONDS'] = int(os.environ.get('SSE_MAX_SECONDS', 300))
+app.config['SSE_MAX_STREAMS'] = int(os.environ.get('SSE_MAX_STREAMS', 16))
+app.config['ALERT_TAIL_INTERVAL'] = float(os.environ.get('ALERT_TAIL_INTERVAL', 1))
+app.config['GEOFENCE_RELOAD_SECONDS'] = int(os.environ.get('GEOFENCE_RELOAD_SECONDS', 60))
+app.config['PROXIMITY_SYNC_SECONDS'] = float(os.environ.get('PROXIMITY_SYNC_SECONDS', 2))
+app.config['PANIC_NEARBY_RADIUS_M'] = float(os.environ.get('PANIC_NEARBY_RADIUS_M', 500))
+app.config['PANIC_FANOUT_ASYNC'] = os.environ.get('PANIC_FANOUT_ASYNC', '1') != '0'
+app.config['PANIC_FANOUT_MAX_ATTEMPTS'] = int(os.environ.get('PANIC_FANOUT_MAX_ATTEMPTS', 5))
+app.config['RESPONSE_CACHE_ENABLED'] = os.environ.get('RESPONSE_CACHE_ENABLED', '1') != '0'
+app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get('RESPONSE_CACHE_SIZE', 512))
+app.config['RESPONSE_CACHE_TTL'] = float(os.environ.get('RESPONSE_CACHE_TTL', 30))
+# How often each cached namespace re-reads its change_counter row for writes made by other processes
+app.config['RESPONSE_CACHE_SHARED_INTERVAL'] = float(os.environ.get('RESPONSE_CACHE_SHARED_MS', 250)) / 1000
+app.config['QR_WORKERS'] = int(os.environ.get('QR_WORKERS', 2))
+app.config['TRACK_SYNC_SECONDS'] = float(os.environ.get('TRACK_SYNC_SECONDS', 2))
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') != '0'
+app.config['PROFILE_SLOW_MS'] = float(os.environ.get('PROFILE_SLOW_MS', 0))
+app.config['PROFILE_INTERVAL_MS'] = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR')
 
 db.init_app(app)
+location_buffer = LocationWriteBuffer(app)
+latest_positions.init_app(app)
+geofence_monitor.init_app(app)
+position_grid.init_app(app)
+location_buffer.listeners.append(position_grid.update)
+response_cache.init_app(app)
+# Writes from any process invalidate these through change_counter
+response_cache.track('alerts', lambda: current_seq(db.session, 'alert'))
+response_cache.track('locations', lambda: current_seq(db.session, 'latest_location'))
+response_cache.track('tourists', lambda: current_seq(db.session, 'tourist'))
+response_cache.track('incidents', lambda: current_seq(db.session, 'incident'))
+qr_store.init_app(app)
+track_store.init_app(app)
+if app.config['METRICS_ENABLED']:
+    metrics.init_app(app)
+location_buffer.listeners.append(lambda positions: response_cache.bump('locations'))
+event_hub = EventHub(max_listeners=app.config['SSE_MAX_STREAMS'])
+group_fanout = GroupFanout(app)
 
-def generate_tourist_id():
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
+# Indian timezone (UTC+5:30)
+INDIAN_TZ = timezone(timedelta(hours=5, minutes=30))
+POLICE_TOPIC = 'police'
 
-def generate_group_code():
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-
-def generate_qr_code(data):
-    try:
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(data)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        return base64.b64encode(buffer.getvalue()).decode()
-    except Exception as e:
-        print(f"QR Code generation error: {e}")
-        return None
+@app.errorhandler(InvalidQuery)
+def invalid_query(e):
+    return jsonify({'error': str(e)}), 400
 
 def police_required(f):
     @wraps(f)
@@ -45,6 +90,218 @@ def police_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def tourist_topic(tourist_id):
+    return f'tourist:{tourist_id}'
+
+def serialize_user_alert(a):
+    return {
+        'id': a.id,
+        'alert_type': a.alert_type,
+        'message': a.message,
+        'latitude': a.latitude,
+        'longitude': a.longitude,
+        'timestamp': a.timestamp.replace(tzinfo=timezone.utc).astimezone(INDIAN_TZ).strftime('%H:%M:%S')
+    }
+
+def serialize_police_alert(a, tourist):
+    return {
+        'id': a.id,
+        'tourist_id': a.tourist_id,
+        'tourist_name': tourist.name if tourist else 'Unknown',
+        'tourist_phone': tourist.phone if tourist else 'N/A',
+        'alert_type': a.alert_type,
+        'message': a.message,
+        'latitude': a.latitude,
+        'longitude': a.longitude,
+        'correlation_id': a.correlation_id,
+        'timestamp': a.timestamp.replace(tzinfo=timezone.utc).astimezone(INDIAN_TZ).strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+def change_cursor(table):
+    # Read before the data, so a change racing the read is sent again rather than missed
+    return encode_change_cursor(table, current_seq(db.session, table))
+
+def change_headers(cursor, more=False):
+    headers = {'X-Change-Cursor': cursor}
+    if more:
+        headers['X-More-Changes'] = '1'
+    return headers
+
+def delta_response(table, query, seq_column, serialize):
+    """Rows of `query` changed after ?since=<change cursor>, with the cursor to poll with next"""
+    since = decode_change_cursor(request.args['since'], table)
+    limit = parse_limit(request.args.get('limit'), default=1000)
+    rows, cursor, more = changed_rows(db.session, table, query, seq_column, since, limit)
+    return jsonify(serialize(rows)), change_headers(cursor, more)
+
+def add_nearby_tourists(alert_data, limit=10):
+    """Attach tourists near each panic alert's location (from the live position grid, never synced inline)"""
+    position_grid.start(app)
+    radius = app.config['PANIC_NEARBY_RADIUS_M']
+    nearby_by_alert = {}
+    for item in alert_data:
+        if item['alert_type'] == 'panic' and item['latitude'] is not None and item['longitude'] is not None:
+            found = position_grid.within_radius(item['latitude'], item['longitude'], radius)
+            nearby_by_alert[item['id']] = [f for f in found if f[1] != item['tourist_id']][:limit]
+    
+    # One name lookup for every nearby tourist across all alerts
+    nearby_ids = {f[1] for found in nearby_by_alert.values() for f in found}
+    names = {}
+    if nearby_ids:
+        names = dict(db.session.query(Tourist.tourist_id, Tourist.name).filter(Tourist.tourist_id.in_(nearby_ids)))
+    
+    for item in alert_data:
+        if item['id'] in nearby_by_alert:
+            item['nearby'] = [{
+                'tourist_id': tourist_id,
+                'name': names.get(tourist_id),
+                'distance_m': round(distance),
+                'latitude': lat,
+                'longitude': lng
+            } for distance, tourist_id, lat, lng, _ in nearby_by_alert[item['id']]]
+    return alert_data
+
+def publish_alerts(alerts, tourists=None):
+    """Push newly committed alerts to police and per-tourist subscribers"""
+    response_cache.bump('alerts')
+    police_alerts = [a for a in alerts if a.alert_type != 'user_alert']
+    if tourists is None and police_alerts:
+        ids = {a.tourist_id for a in police_alerts}
+        tourists = {t.tourist_id: t for t in Tourist.query.filter(Tourist.tourist_id.in_(ids))}
+    
+    police_data = add_nearby_tourists([serialize_police_alert(a, tourists.get(a.tourist_id)) for a in police_alerts])
+    for a, data in zip(police_alerts, police_data):
+        event_hub.publish([POLICE_TOPIC], 'alert', data, key=f'alert:{a.id}')
+    for a in alerts:
+        if a.alert_type == 'user_alert':
+            event_hub.publish([tourist_topic(a.tourist_id)], 'alert', serialize_user_alert(a), key=f'alert:{a.id}')
+
+def publish_resolved(alerts):
+    response_cache.bump('alerts')
+    for a in alerts:
+        topic = tourist_topic(a.tourist_id) if a.alert_type == 'user_alert' else POLICE_TOPIC
+        event_hub.publish([topic], 'resolved', {'id': a.id, 'tourist_id': a.tourist_id})
+
+def raise_geofence_breaches(fixes):
+    """Check fixes against the zone index; alert police when a tourist enters a zone
+
+    Zone membership is only remembered per process, so breaches are also
+    deduplicated against the alert table (see alert_dedup.py)
+    """
+    geofence_monitor.start(app)
+    breaches = geofence_monitor.check(fixes)
+    if not breaches:
+        return
+    raised = raise_alerts(db.session.connection(), [(
+        fix['tourist_id'],
+        'geo_fence_breach',
+        f"⛔ GEO-FENCE BREACH: {fix['tourist_id']} entered {zone.zone_type} zone '{zone.name}'",
+        fix['latitude'],
+        fix['longitude']
+    ) for fix, zone in breaches])
+    db.session.commit()
+    if raised:
+        publish_alerts(Alert.query.filter(Alert.id.in_([alert_id for alert_id, _, _, _ in raised])).all())
+
+def publish_fanout_alerts(alert_ids):
+    if alert_ids:
+        publish_alerts(Alert.query.filter(Alert.id.in_(alert_ids)).all())
+
+group_fanout.listeners.append(publish_fanout_alerts)
+
+_alert_tail = {'seq': None}
+
+def publish_new_alerts():
+    """Publish alerts committed by other processes (AI engine, other workers)
+
+    Follows alert.change_seq, which is handed out in commit order; alert ids
+    are not (on PostgreSQL a lower id can commit later and would be skipped)
+    """
+    if _alert_tail['seq'] is None:
+        _alert_tail['seq'] = current_seq(db.session, 'alert')
+        return
+    more = True
+    while more:
+        rows, _alert_tail['seq'], more = changes_after(db.session, 'alert', db.select(Alert), Alert.change_seq,
+                                                       _alert_tail['seq'], 500)
+        # Resolutions also bump change_seq; events are keyed by alert id, so ones already sent are skipped
+        alerts = [row.Alert for row in rows if not row.Alert.resolved]
+        if alerts:
+            publish_alerts(alerts)
+
+def parse_poll_timeout(value, default=25, maximum=55):
+    if value is None:
+        return default
+    try:
+        timeout = float(value)
+    except ValueError:
+        raise InvalidQuery('timeout must be a number')
+    if not timeout >= 0:
+        raise InvalidQuery('timeout must not be negative')
+    return min(timeout, maximum)
+
+def listeners_full():
+    """503 sent when SSE_MAX_STREAMS streams and long polls already hold this process's threads"""
+    return jsonify({'error': 'Too many open alert streams, retry later'}), 503, {'Retry-After': '5'}
+
+def stream_events(topics):
+    """Server-Sent Events response for the given topics, resumable via Last-Event-ID"""
+    event_hub.start_tailer(app, publish_new_alerts, app.config['ALERT_TAIL_INTERVAL'])
+    if not event_hub.add_listener():
+        return listeners_full()
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    deadline = time.monotonic() + app.config['SSE_MAX_SECONDS']
+    
+    def generate():
+        cursor = last_event_id
+        yield 'retry: 3000\n\n'
+        if cursor is None:
+            cursor = event_hub.current_id()
+            yield f'id: {cursor}\n\n'
+        # The connection is closed periodically so sync workers are recycled;
+        # EventSource reconnects and resumes from the last id it saw
+        while time.monotonic() < deadline:
+            events, resync = event_hub.wait(topics, cursor, min(15, max(deadline - time.monotonic(), 0)))
+            if resync:
+                cursor = event_hub.current_id()
+                yield format_sse(cursor, 'resync', {})
+            for event_id, event, data in events:
+                cursor = event_id
+                yield format_sse(event_id, event, data)
+            if not events and not resync:
+                yield ': keepalive\n\n'
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    # Runs however the stream ends, including before the generator starts
+    response.call_on_close(event_hub.remove_listener)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def long_poll_events(topics):
+    """Fallback for clients without EventSource: block until events arrive or timeout"""
+    event_hub.start_tailer(app, publish_new_alerts, app.config['ALERT_TAIL_INTERVAL'])
+    last_event_id = request.args.get('last_event_id')
+    timeout = parse_poll_timeout(request.args.get('timeout'))
+    if last_event_id is None:
+        return jsonify({'events': [], 'last_event_id': event_hub.current_id(), 'resync': False})
+    
+    if not event_hub.add_listener():
+        return listeners_full()
+    try:
+        events, resync = event_hub.wait(topics, last_event_id, timeout)
+    finally:
+        event_hub.remove_listener()
+    if resync:
+        last_event_id = event_hub.current_id()
+    elif events:
+        last_event_id = events[-1][0]
+    return jsonify({
+        'events': [{'id': event_id, 'event': event, 'data': data} for event_id, event, data in events],
+        'last_event_id': last_event_id,
+        'resync': resync
+    })
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -56,7 +313,7 @@ def tourist_portal():
 @app.route('/register', methods=['POST'])
 def register_tourist():
     data = request.get_json()
-    tourist_id = generate_tourist_id()
+    tourist_id = tourist_ids.next()
     
     tourist = Tourist(
         name=data['name'],
@@ -67,24 +324,56 @@ def register_tourist():
     
     db.session.add(tourist)
     db.session.commit()
+    response_cache.bump('tourists')
     
-    qr_data = f"Tourist ID: {tourist_id}\nName: {data['name']}\nPhone: {data['phone']}"
-    qr_code = generate_qr_code(qr_data)
-    
-    if qr_code is None:
-        return jsonify({
-            'success': True,
-            'tourist_id': tourist_id,
-            'qr_code': None,
-            'message': 'Tourist registered but QR code generation failed'
-        })
+    # The QR code renders in the background; the page loads it from qr_url
+    qr_store.submit(qr_payload(tourist))
     
     return jsonify({
         'success': True,
         'tourist_id': tourist_id,
-        'qr_code': qr_code
+        'qr_url': url_for('get_qr_code', tourist_id=tourist_id)
     })
 
+@app.route('/api/qr/<tourist_id>')
+def get_qr_code(tourist_id):
+    fmt = request.args.get('format', 'png')
+    if fmt not in FORMATS:
+        return jsonify({'error': 'format must be png or svg'}), 400
+    tourist = Tourist.query.filter_by(tourist_id=tourist_id).first()
+    if not tourist:
+        return jsonify({'error': 'Tourist not found'}), 404
+    
+    try:
+        key, data = qr_store.load(qr_payload(tourist), fmt)
+    except Exception as e:
+        print(f"QR Code generation error: {e}")
+        return jsonify({'error': 'QR code generation failed'}), 503
+    
+    response = Response(data, mimetype=FORMATS[fmt])
+    response.set_etag(key)
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response.make_conditional(request)
+
+@app.route('/api/tourists/bulk', methods=['POST'])
+@police_required
+def bulk_register_tourists():
+    """Manifest as text/csv or JSON; ?group_name= creates a group of everyone imported"""
+    fmt = 'csv' if request.mimetype in ('text/csv', 'application/csv') else 'json'
+    try:
+        summary = import_tourists(
+            read_manifest(request.stream, fmt),
+            group_name=request.args.get('group_name'),
+            created_by=request.args.get('created_by')
+        )
+    except InvalidGroupLeader as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except (ValueError, csv.Error) as e:
+        return jsonify({'success': False, 'error': f'Invalid manifest: {e}'}), 400
+    response_cache.bump('tourists')
+    # QR codes are rendered on first request to /api/qr/<tourist_id>
+    return jsonify(dict(summary, success=True))
+
 @app.route('/login', methods=['POST'])
 def login_tourist():
     data = request.get_json()
@@ -95,33 +384,75 @@ def login_tourist():
         return jsonify({'success': True, 'name': tourist.name})
     return jsonify({'success': False, 'message': 'Invalid Tourist ID'})
 
+# The tourist-facing write handlers below return (body, status) so the async
+# ingest server (ingest_server.py) can run them with the same semantics
+
+def accept_location(data):
+    fix = parse_fix(data)
+    if fix is None:
+        return {'success': False, 'message': 'Invalid location'}, 400
+    
+    # Queued for the write-behind buffer, which bulk-inserts fixes in batches
+    if not location_buffer.add([fix]):
+        return {'success': False, 'message': 'Location queue full, retry later'}, 503
+    raise_geofence_breaches([fix])
+    return {'success': True}, 200
+
+def accept_location_batch(data):
+    fixes = data.get('locations') if isinstance(data, dict) else data
+    if not isinstance(fixes, list):
+        return {'success': False, 'message': 'Expected a list of locations'}, 400
+    
+    rows = []
+    rejected = []
+    received_at = datetime.utcnow()
+    for index, item in enumerate(fixes):
+        fix = parse_fix(item, received_at)
+        if fix is None:
+            rejected.append(index)
+        else:
+            rows.append(fix)
+    
+    accepted = location_buffer.add(rows)
+    raise_geofence_breaches(rows[:accepted])
+    return {
+        'success': accepted == len(rows),
+        'accepted': accepted,
+        'dropped': len(rows) - accepted,
+        'rejected': rejected
+    }, 202 if accepted == len(rows) else 503
+
 @app.route('/update_location', methods=['POST'])
 def update_location():
-    data = request.get_json()
-    location = Location(
-        tourist_id=data['tourist_id'],
-        latitude=data['latitude'],
-        longitude=data['longitude']
-    )
-    db.session.add(location)
-    db.session.commit()
-    return jsonify({'success': True})
+    body, status = accept_location(request.get_json())
+    return jsonify(body), status
 
-@app.route('/panic_alert', methods=['POST'])
-def panic_alert():
-    data = request.get_json()
-    
+@app.route('/api/locations/batch', methods=['POST'])
+def update_locations_batch():
+    body, status = accept_location_batch(request.get_json())
+    return jsonify(body), status
+
+@app.route('/api/locations/stats')
+@police_required
+def get_location_ingest_stats():
+    return jsonify(location_buffer.stats())
+
+def raise_panic(data):
     # Get tourist name for better alert message
     tourist = Tourist.query.filter_by(tourist_id=data['tourist_id']).first()
     tourist_name = tourist.name if tourist else data['tourist_id']
     
+    # Every alert raised for this panic shares one correlation id
+    correlation_id = new_correlation_id()
+    
     # Main alert for police - always create this
     alert = Alert(
         tourist_id=data['tourist_id'],
         alert_type='panic',
         message=f"🆘 EMERGENCY: {tourist_name} ({data['tourist_id']}) pressed panic button!",
         latitude=data.get('latitude'),
-        longitude=data.get('longitude')
+        longitude=data.get('longitude'),
+        correlation_id=correlation_id
     )
     db.session.add(alert)
     
@@ -131,29 +462,51 @@ def panic_alert():
         alert_type='user_alert',
         message=f"✓ Your emergency alert has been sent to police! Help is on the way.",
         latitude=data.get('latitude'),
-        longitude=data.get('longitude')
+        longitude=data.get('longitude'),
+        correlation_id=correlation_id
     )
     db.session.add(sender_alert)
+    db.session.flush()
     
-    # Send alert to group members if in group
-    sender_group = GroupMember.query.filter_by(tourist_id=data['tourist_id']).first()
-    group_message = ""
-    if sender_group:
-        group_members = GroupMember.query.filter_by(group_id=sender_group.group_id).all()
-        for member in group_members:
-            if member.tourist_id != data['tourist_id']:  # Don't alert the sender
-                user_alert = Alert(
-                    tourist_id=member.tourist_id,
-                    alert_type='user_alert',
-                    message=f"🚨 GROUP EMERGENCY: {tourist_name} needs help! Location: {data.get('latitude', 'Unknown')}, {data.get('longitude', 'Unknown')}",
-                    latitude=data.get('latitude'),
-                    longitude=data.get('longitude')
-                )
-                db.session.add(user_alert)
-        group_message = " and group members"
-    
+    # Group members are alerted by the fan-out worker; the delivery row commits with the police alert
+    delivery = PanicDelivery(
+        alert_id=alert.id,
+        correlation_id=correlation_id,
+        tourist_id=data['tourist_id'],
+        message=f"🚨 GROUP EMERGENCY: {tourist_name} needs help! Location: {data.get('latitude', 'Unknown')}, {data.get('longitude', 'Unknown')}",
+        latitude=data.get('latitude'),
+        longitude=data.get('longitude')
+    )
+    db.session.add(delivery)
     db.session.commit()
-    return jsonify({'success': True, 'message': f'Emergency alert sent to police{group_message}!'})
+    
+    publish_alerts([alert, sender_alert], {data['tourist_id']: tourist})
+    group_fanout.submit(delivery.id)
+    return {
+        'success': True,
+        'message': 'Emergency alert sent to police! Group members are notified in the background.',
+        'delivery_id': delivery.id
+    }, 200
+
+@app.route('/panic_alert', methods=['POST'])
+def panic_alert():
+    body, status = raise_panic(request.get_json())
+    return jsonify(body), status
+
+@app.route('/api/panic_status/<int:delivery_id>')
+def panic_status(delivery_id):
+    delivery = db.session.get(PanicDelivery, delivery_id)
+    if not delivery:
+        return jsonify({'error': 'Delivery not found'}), 404
+    return jsonify({
+        'delivery_id': delivery.id,
+        'alert_id': delivery.alert_id,
+        'status': delivery.status,
+        'recipients': delivery.recipients,
+        'attempts': delivery.attempts,
+        'last_error': delivery.last_error,
+        'delivered_at': delivery.delivered_at.strftime('%Y-%m-%d %H:%M:%S') if delivery.delivered_at else None
+    })
 
 @app.route('/police_login')
 def police_login():
@@ -190,6 +543,7 @@ def alerts_monitor():
 
 @app.route('/api/tourists')
 @police_required
+@response_cache.cached('tourists')
 def get_tourists():
     tourists = Tourist.query.all()
     return jsonify([{
@@ -202,97 +556,229 @@ def get_tourists():
 
 @app.route('/api/locations')
 @police_required
+@response_cache.cached('locations')
 def get_locations():
-    locations = Location.query.all()
-    return jsonify([{
-        'tourist_id': l.tourist_id,
-        'latitude': l.latitude,
-        'longitude': l.longitude,
-        'timestamp': l.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-    } for l in locations])
-
-@app.route('/api/user_alerts/<tourist_id>')
-def get_user_alerts(tourist_id):
-    from datetime import timezone, timedelta
+    if is_change_cursor(request.args.get('since')):
+        return get_location_changes()
+    limit = parse_limit(request.args.get('limit'), default=None if request.args.get('format') == 'ndjson' else 1000)
+    since = parse_time(request.args.get('since'), 'since')
+    until = parse_time(request.args.get('until'), 'until')
+    bbox = parse_bbox(request.args.get('bbox'))
+    cursor = request.args.get('cursor')
+    
+    if request.args.get('latest') == '1':
+        # Current position per tourist, keyset on tourist_id
+        model = LatestLocation
+        query = db.select(LatestLocation.tourist_id, LatestLocation.latitude,
+                          LatestLocation.longitude, LatestLocation.timestamp)
+        if cursor:
+            (after_tourist,) = decode_cursor(cursor, str)
+            query = query.where(LatestLocation.tourist_id > after_tourist)
+        query = query.order_by(LatestLocation.tourist_id)
+        sort_key = lambda row: (row.tourist_id,)
+    else:
+        # Full history, keyset on (timestamp, id)
+        model = Location
+        query = db.select(Location.id, Location.tourist_id, Location.latitude,
+                          Location.longitude, Location.timestamp)
+        if cursor:
+            after_time, after_id = decode_cursor(cursor, datetime, int)
+            query = query.where(db.or_(
+                Location.timestamp > after_time,
+                db.and_(Location.timestamp == after_time, Location.id > after_id)
+            ))
+        query = query.order_by(Location.timestamp, Location.id)
+        sort_key = lambda row: (row.timestamp, row.id)
     
+    if since:
+        query = query.where(model.timestamp >= since)
+    if until:
+        query = query.where(model.timestamp < until)
+    if bbox:
+        min_lat, min_lng, max_lat, max_lng = bbox
+        query = query.where(model.latitude.between(min_lat, max_lat),
+                            model.longitude.between(min_lng, max_lng))
+    if limit:
+        # One extra row tells us whether there is a next page
+        query = query.limit(limit + 1)
+    
+    def serialize(row):
+        item = {
+            'tourist_id': row.tourist_id,
+            'latitude': row.latitude,
+            'longitude': row.longitude,
+            'timestamp': row.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+        }
+        if model is Location:
+            item['id'] = row.id
+        return item
+    
+    if request.args.get('format') == 'ndjson':
+        def generate():
+            # Rows are serialized as they come off the DB cursor
+            result = db.session.execute(query.execution_options(yield_per=500))
+            last = None
+            for count, row in enumerate(result):
+                if limit and count == limit:
+                    yield json.dumps({'next_cursor': encode_cursor(*sort_key(last))}) + '\n'
+                    break
+                last = row
+                yield json.dumps(serialize(row)) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+    cursor = change_cursor('latest_location') if model is LatestLocation else None
+    rows = db.session.execute(query).all()
+    response = jsonify([serialize(row) for row in rows[:limit]])
+    if len(rows) > limit:
+        response.headers['X-Next-Cursor'] = encode_cursor(*sort_key(rows[limit - 1]))
+    if cursor:
+        response.headers.update(change_headers(cursor))
+    return response
+
+def get_location_changes():
+    # ?since=<change cursor>: current positions of the tourists who moved since the cursor
+    if any(request.args.get(name) for name in ('cursor', 'until', 'bbox', 'format')):
+        raise InvalidQuery('since=<change cursor> cannot be combined with cursor, until, bbox or format')
+    query = db.select(LatestLocation.tourist_id, LatestLocation.latitude,
+                      LatestLocation.longitude, LatestLocation.timestamp)
+    return delta_response('latest_location', query, LatestLocation.change_seq, lambda rows: [{
+        'tourist_id': row.tourist_id,
+        'latitude': row.latitude,
+        'longitude': row.longitude,
+        'timestamp': row.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+    } for row in rows])
+
+@app.route('/api/cache/stats')
+@police_required
+def get_cache_stats():
+    return jsonify(response_cache.stats())
+
+@app.route('/metrics')
+def get_metrics():
+    # Prometheus scrape endpoint; counters are per process (one per gunicorn worker)
+    if not app.config['METRICS_ENABLED']:
+        return jsonify({'error': 'Metrics disabled'}), 404
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+def recent_user_alerts(tourist_id):
     alerts = Alert.query.filter_by(tourist_id=tourist_id, resolved=False).filter(
         Alert.alert_type.in_(['user_alert'])
     ).order_by(Alert.timestamp.desc()).limit(10).all()
     
-    # Indian timezone (UTC+5:30)
-    indian_tz = timezone(timedelta(hours=5, minutes=30))
-    
-    return jsonify([{
-        'id': a.id,
-        'alert_type': a.alert_type,
-        'message': a.message,
-        'latitude': a.latitude,
-        'longitude': a.longitude,
-        'timestamp': a.timestamp.replace(tzinfo=timezone.utc).astimezone(indian_tz).strftime('%H:%M:%S')
-    } for a in alerts])
+    return [serialize_user_alert(a) for a in alerts]
+
+def user_alert_feed(tourist_id, since=None, limit=None):
+    """(alerts, response headers) for /api/user_alerts; only new alerts and resolutions after `since` if given"""
+    if not since:
+        cursor = change_cursor('alert')
+        return recent_user_alerts(tourist_id), change_headers(cursor)
+    query = db.select(Alert).where(Alert.tourist_id == tourist_id, Alert.alert_type == 'user_alert')
+    rows, cursor, more = changed_rows(db.session, 'alert', query, Alert.change_seq,
+                                      decode_change_cursor(since, 'alert'), parse_limit(limit, default=100))
+    return [dict(serialize_user_alert(row.Alert), resolved=row.Alert.resolved) for row in rows], change_headers(cursor, more)
+
+@app.route('/api/user_alerts/<tourist_id>')
+def get_user_alerts(tourist_id):
+    alerts, headers = user_alert_feed(tourist_id, request.args.get('since'), request.args.get('limit'))
+    return jsonify(alerts), headers
 
 @app.route('/api/alerts')
 @police_required
+@response_cache.cached('alerts')
 def get_alerts():
     # Police see panic alerts and group emergency alerts
-    alerts = Alert.query.filter_by(resolved=False).filter(
+    # Tourist details are loaded in the same query
+    if request.args.get('since'):
+        query = db.select(Alert).options(db.joinedload(Alert.tourist)).where(Alert.alert_type.in_(['panic']))
+        
+        def serialize(rows):
+            # Resolved alerts are sent too, so clients can drop them
+            items = [dict(serialize_police_alert(row.Alert, row.Alert.tourist), resolved=row.Alert.resolved)
+                     for row in rows]
+            add_nearby_tourists([item for item in items if not item['resolved']])
+            return items
+        return delta_response('alert', query, Alert.change_seq, serialize)
+    
+    cursor = change_cursor('alert')
+    alerts = Alert.query.options(db.joinedload(Alert.tourist)).filter_by(resolved=False).filter(
         Alert.alert_type.in_(['panic'])
     ).order_by(Alert.timestamp.desc()).all()
-    alert_data = []
     
-    for a in alerts:
-        # Get tourist details for each alert
-        tourist = Tourist.query.filter_by(tourist_id=a.tourist_id).first()
-        tourist_name = tourist.name if tourist else 'Unknown'
-        tourist_phone = tourist.phone if tourist else 'N/A'
-        
-        # Indian timezone (UTC+5:30)
-        from datetime import timezone, timedelta
-        indian_tz = timezone(timedelta(hours=5, minutes=30))
-        indian_time = a.timestamp.replace(tzinfo=timezone.utc).astimezone(indian_tz)
-        
-        alert_data.append({
-            'id': a.id,
-            'tourist_id': a.tourist_id,
-            'tourist_name': tourist_name,
-            'tourist_phone': tourist_phone,
-            'alert_type': a.alert_type,
-            'message': a.message,
-            'latitude': a.latitude,
-            'longitude': a.longitude,
-            'timestamp': indian_time.strftime('%Y-%m-%d %H:%M:%S')
-        })
-    
-    return jsonify(alert_data)
+    return jsonify(add_nearby_tourists([serialize_police_alert(a, a.tourist) for a in alerts])), change_headers(cursor)
+
+@app.route('/api/stream/alerts')
+@police_required
+def stream_police_alerts():
+    return stream_events([POLICE_TOPIC])
+
+@app.route('/api/poll/alerts')
+@police_required
+def poll_police_alerts():
+    return long_poll_events([POLICE_TOPIC])
+
+@app.route('/api/stream/user_alerts/<tourist_id>')
+def stream_user_alerts(tourist_id):
+    return stream_events([tourist_topic(tourist_id)])
+
+@app.route('/api/poll/user_alerts/<tourist_id>')
+def poll_user_alerts(tourist_id):
+    return long_poll_events([tourist_topic(tourist_id)])
 
 @app.route('/api/resolve_alert/<int:alert_id>', methods=['POST'])
 @police_required
 def resolve_alert(alert_id):
     alert = db.session.get(Alert, alert_id)
     if alert:
-        alert.resolved = True
-        
-        # Also resolve related user alerts for the same incident
-        related_alerts = Alert.query.filter_by(
-            alert_type='user_alert',
-            latitude=alert.latitude,
-            longitude=alert.longitude,
-            resolved=False
-        ).all()
-        
-        for related_alert in related_alerts:
-            if alert.tourist_id in related_alert.message:
-                related_alert.resolved = True
-        
-        db.session.commit()
-        return jsonify({'success': True})
+        # The alert and every alert raised for the same incident, in one statement
+        if alert.correlation_id:
+            match = Alert.correlation_id == alert.correlation_id
+        else:
+            match = Alert.id == alert.id
+        resolved = resolve_matching(match)
+        publish_resolved(resolved)
+        return jsonify({'success': True, 'resolved': len(resolved)})
     return jsonify({'success': False})
 
+@app.route('/api/resolve_alerts', methods=['POST'])
+@police_required
+def resolve_alerts():
+    """Bulk resolve: {"alert_ids": [...]} and/or {"correlation_ids": [...]}; whole incidents are resolved"""
+    data = request.get_json(silent=True) or {}
+    alert_ids = data.get('alert_ids') or []
+    correlation_ids = data.get('correlation_ids') or []
+    if not isinstance(alert_ids, list) or not isinstance(correlation_ids, list) or not (alert_ids or correlation_ids):
+        return jsonify({'success': False, 'error': 'alert_ids or correlation_ids list required'}), 400
+    try:
+        alert_ids = [int(i) for i in alert_ids]
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'alert_ids must be integers'}), 400
+    
+    incidents = db.select(Alert.correlation_id).where(Alert.id.in_(alert_ids), Alert.correlation_id.isnot(None))
+    resolved = resolve_matching(db.or_(
+        Alert.id.in_(alert_ids),
+        Alert.correlation_id.in_(incidents),
+        Alert.correlation_id.in_([str(c) for c in correlation_ids])
+    ))
+    publish_resolved(resolved)
+    return jsonify({'success': True, 'resolved': len(resolved)})
+
+def resolve_matching(condition):
+    """Mark unresolved alerts matching condition resolved; returns (id, tourist_id, alert_type) rows"""
+    resolved = db.session.execute(
+        update(Alert)
+        .where(condition, Alert.resolved == False)
+        .values(resolved=True)
+        .returning(Alert.id, Alert.tourist_id, Alert.alert_type)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.session.commit()
+    return resolved
+
 @app.route('/api/create_incident', methods=['POST'])
 @police_required
 def create_incident():
     data = request.get_json()
-    efir_number = f"FIR{random.randint(100000, 999999)}"
+    efir_number = efir_numbers.next()
     
     incident = Incident(
         tourist_id=data['tourist_id'],
@@ -302,11 +788,13 @@ def create_incident():
     )
     db.session.add(incident)
     db.session.commit()
+    response_cache.bump('incidents')
     
     return jsonify({'success': True, 'efir_number': efir_number})
 
 @app.route('/api/incidents')
 @police_required
+@response_cache.cached('incidents')
 def get_incidents():
     incidents = Incident.query.order_by(Incident.timestamp.desc()).all()
     return jsonify([{
@@ -318,6 +806,71 @@ def get_incidents():
         'timestamp': i.timestamp.strftime('%Y-%m-%d %H:%M:%S')
     } for i in incidents])
 
+@app.route('/api/nearby')
+@police_required
+def get_nearby():
+    try:
+        lat = float(request.args['lat']) if 'lat' in request.args else None
+        lng = float(request.args['lng']) if 'lng' in request.args else None
+        radius = float(request.args.get('radius', 500))
+        k = int(request.args['k']) if 'k' in request.args else None
+        max_age = float(request.args['max_age']) if 'max_age' in request.args else None
+    except ValueError:
+        raise InvalidQuery('lat, lng, radius, k and max_age must be numbers')
+    bbox = parse_bbox(request.args.get('bbox'))
+    since = datetime.utcnow() - timedelta(minutes=max_age) if max_age is not None else None
+    
+    position_grid.start(app)
+    if bbox:
+        found = position_grid.in_box(*bbox, since=since)
+    elif lat is None or lng is None:
+        raise InvalidQuery('lat and lng (or bbox) are required')
+    elif k is not None:
+        found = position_grid.nearest(lat, lng, min(max(k, 1), 1000), max_radius_m=radius if 'radius' in request.args else 50000, since=since)
+    else:
+        found = position_grid.within_radius(lat, lng, radius, since=since)
+    
+    limit = parse_limit(request.args.get('limit'), default=1000)
+    found = found[:limit]
+    names = {}
+    if found:
+        ids = [f[1] for f in found]
+        names = dict(db.session.query(Tourist.tourist_id, Tourist.name).filter(Tourist.tourist_id.in_(ids)))
+    
+    return jsonify([{
+        'tourist_id': tourist_id,
+        'name': names.get(tourist_id),
+        'latitude': lat,
+        'longitude': lng,
+        'distance_m': round(distance, 1) if distance is not None else None,
+        'timestamp': ts.strftime('%Y-%m-%d %H:%M:%S')
+    } for distance, tourist_id, lat, lng, ts in found])
+
+@app.route('/api/geofences')
+@police_required
+def get_geofences():
+    fences = GeoFence.query.filter_by(active=True).order_by(GeoFence.id).all()
+    return jsonify([{
+        'id': f.id,
+        'name': f.name,
+        'zone_type': f.zone_type,
+        'shape': f.shape,
+        'coordinates': json.loads(f.coordinates) if f.coordinates else None,
+        'center_latitude': f.center_latitude,
+        'center_longitude': f.center_longitude,
+        'radius_m': f.radius_m
+    } for f in fences])
+
+@app.route('/api/geofences/import', methods=['POST'])
+@police_required
+def import_geofences():
+    try:
+        count = import_geojson(request.get_json(), replace=request.args.get('replace') == '1')
+    except (ValueError, KeyError, TypeError, IndexError) as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Invalid GeoJSON: {e}'}), 400
+    return jsonify({'success': True, 'imported': count})
+
 @app.route('/api/tourist_details/<tourist_id>')
 @police_required
 def get_tourist_details(tourist_id):
@@ -326,7 +879,7 @@ def get_tourist_details(tourist_id):
         return jsonify({'error': 'Tourist not found'}), 404
     
     # Get latest location
-    latest_location = Location.query.filter_by(tourist_id=tourist_id).order_by(Location.timestamp.desc()).first()
+    latest_location = latest_positions.get(tourist_id)
     
     return jsonify({
         'tourist_id': tourist.tourist_id,
@@ -335,12 +888,37 @@ def get_tourist_details(tourist_id):
         'phone': tourist.phone,
         'created_at': tourist.created_at.strftime('%Y-%m-%d %H:%M:%S'),
         'latest_location': {
-            'latitude': latest_location.latitude if latest_location else None,
-            'longitude': latest_location.longitude if latest_location else None,
-            'timestamp': latest_location.timestamp.strftime('%Y-%m-%d %H:%M:%S') if latest_location else None
-        }
+            'latitude': latest_location['latitude'] if latest_location else None,
+            'longitude': latest_location['longitude'] if latest_location else None,
+            'timestamp': latest_location['timestamp'].strftime('%Y-%m-%d %H:%M:%S') if latest_location else None
+        },
+        'track_url': url_for('get_track', tourist_id=tourist.tourist_id)
     })
 
+@app.route('/api/track/<tourist_id>')
+@police_required
+def get_track(tourist_id):
+    since = parse_time(request.args.get('from'), 'from')
+    until = parse_time(request.args.get('to'), 'to')
+    if not db.session.query(Tourist.id).filter_by(tourist_id=tourist_id).first():
+        return jsonify({'error': 'Tourist not found'}), 404
+    
+    track = track_store.track(tourist_id, db.session, since, until)
+    data = {
+        'tourist_id': tourist_id,
+        'count': len(track),
+        'start': datetime.utcfromtimestamp(int(track.seconds[0])).strftime('%Y-%m-%d %H:%M:%S') if len(track) else None,
+        'end': datetime.utcfromtimestamp(int(track.seconds[-1])).strftime('%Y-%m-%d %H:%M:%S') if len(track) else None,
+        # Epoch seconds, one per point
+        'timestamps': track.seconds.tolist()
+    }
+    if request.args.get('format') == 'polyline':
+        data['polyline'] = encode_polyline(track.latitude, track.longitude)
+    else:
+        data['latitude'] = track.latitude.tolist()
+        data['longitude'] = track.longitude.tolist()
+    return jsonify(data)
+
 # Group Management Routes
 @app.route('/create_group', methods=['POST'])
 def create_group():
@@ -351,7 +929,7 @@ def create_group():
     if existing_membership:
         return jsonify({'success': False, 'message': 'You must leave your current group first'})
     
-    group_code = generate_group_code()
+    group_code = group_codes.next()
     
     group = Group(
         name=data['name'],
@@ -396,55 +974,49 @@ def join_group():
 
 @app.route('/api/group_locations/<tourist_id>')
 def get_group_locations(tourist_id):
-    # Get user's group first
-    user_group = GroupMember.query.filter_by(tourist_id=tourist_id).first()
-    if not user_group:
-        return jsonify([])
-    
-    # Get all group members
-    group_members = GroupMember.query.filter_by(group_id=user_group.group_id).all()
-    locations = []
-    
-    for member in group_members:
-        tourist = Tourist.query.filter_by(tourist_id=member.tourist_id).first()
-        latest_location = Location.query.filter_by(tourist_id=member.tourist_id).order_by(Location.timestamp.desc()).first()
-        
-        if tourist and latest_location:
-            locations.append({
-                'tourist_id': member.tourist_id,
-                'name': tourist.name,
-                'latitude': latest_location.latitude,
-                'longitude': latest_location.longitude,
-                'timestamp': latest_location.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                'is_group_member': True
-            })
-    
-    return jsonify(locations)
+    # Members of the user's group with their name and current position, in one query
+    user_group = db.select(GroupMember.group_id).where(GroupMember.tourist_id == tourist_id).limit(1).scalar_subquery()
+    query = (db.select(GroupMember.tourist_id, Tourist.name, LatestLocation.latitude,
+                       LatestLocation.longitude, LatestLocation.timestamp)
+             .join(Tourist, Tourist.tourist_id == GroupMember.tourist_id)
+             .join(LatestLocation, LatestLocation.tourist_id == GroupMember.tourist_id)
+             .where(GroupMember.group_id == user_group))
+    
+    def serialize(rows):
+        return [{
+            'tourist_id': row.tourist_id,
+            'name': row.name,
+            'latitude': row.latitude,
+            'longitude': row.longitude,
+            'timestamp': row.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+            'is_group_member': True
+        } for row in rows]
+    
+    if request.args.get('since'):
+        # Members who moved since the cursor; joins and leaves need a full reload
+        return delta_response('latest_location', query, LatestLocation.change_seq, serialize)
+    cursor = change_cursor('latest_location')
+    return jsonify(serialize(db.session.execute(query.order_by(GroupMember.id)).all())), change_headers(cursor)
 
 @app.route('/api/my_group/<tourist_id>')
 def get_my_group(tourist_id):
-    group_member = GroupMember.query.filter_by(tourist_id=tourist_id).first()
+    group_member = GroupMember.query.options(db.joinedload(GroupMember.group)).filter_by(tourist_id=tourist_id).first()
     if not group_member:
         return jsonify({'has_group': False})
     
-    group = db.session.get(Group, group_member.group_id)
-    members = GroupMember.query.filter_by(group_id=group.id).all()
-    
-    member_list = []
-    for member in members:
-        tourist = Tourist.query.filter_by(tourist_id=member.tourist_id).first()
-        if tourist:
-            member_list.append({
-                'tourist_id': member.tourist_id,
-                'name': tourist.name,
-                'joined_at': member.joined_at.strftime('%Y-%m-%d %H:%M')
-            })
+    group = group_member.group
+    members = (GroupMember.query.options(db.joinedload(GroupMember.tourist, innerjoin=True))
+               .filter_by(group_id=group.id).order_by(GroupMember.id).all())
     
     return jsonify({
         'has_group': True,
         'group_name': group.name,
         'group_code': group.group_code,
-        'members': member_list
+        'members': [{
+            'tourist_id': member.tourist_id,
+            'name': member.tourist.name,
+            'joined_at': member.joined_at.strftime('%Y-%m-%d %H:%M')
+        } for member in members]
     })
 
 @app.route('/leave_group', methods=['POST'])
@@ -460,8 +1032,13 @@ def leave_group():
     return jsonify({'success': False, 'message': 'Not in any group'})
 
 if __name__ == '__main__':
+    from migrations import upgrade
     with app.app_context():
-        db.create_all()
+        # create_all() never adds columns to existing tables; migrations do
+        upgrade()
+    position_grid.start(app)  # Load positions before the first panic needs them
+    geofence_monitor.start(app)
+    group_fanout.start()  # Deliver panics a crashed process left pending
     import os
     port = int(os.environ.get('PORT', 5000))
     app.run(debug=True, host='0.0.0.0', port=port)
\ No newline at end of file
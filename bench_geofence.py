@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Geofence benchmark
+Checks N fixes against Z random zones around the synthetic destinations with
+the grid index and with a scan over every zone (the old way), and checks both
+find the same zones. Then raises breaches for the fixes through
+raise_geofence_breaches and again with a fresh monitor, as a second worker or
+a restart would, and checks the second round adds no alerts.
+
+Usage: python bench_geofence.py [fixes] [zones]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'geofence_bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_FILE}'
+os.environ['LOCATION_BUFFER_ENABLED'] = '0'
+
+import numpy as np
+
+import app as app_module
+from app import app
+from geofence import GeofenceMonitor, import_geojson
+from models import db, Alert
+from synthetic import DESTINATIONS
+
+
+def zone_features(count, rng):
+    """Circles and small squares within ~5 km of the destinations"""
+    features = []
+    for number in range(count):
+        lat, lng = DESTINATIONS[number % len(DESTINATIONS)]
+        lat += rng.normal(0, 0.03)
+        lng += rng.normal(0, 0.03)
+        if number % 2:
+            features.append({'type': 'Feature', 'properties': {'name': f'Zone {number}', 'radius_m': float(rng.uniform(50, 500))},
+                             'geometry': {'type': 'Point', 'coordinates': [lng, lat]}})
+        else:
+            d = float(rng.uniform(0.0005, 0.004))
+            ring = [[lng - d, lat - d], [lng + d, lat - d], [lng + d, lat + d], [lng - d, lat + d], [lng - d, lat - d]]
+            features.append({'type': 'Feature', 'properties': {'name': f'Zone {number}', 'zone_type': 'danger'},
+                             'geometry': {'type': 'Polygon', 'coordinates': [ring]}})
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def random_fixes(count, rng):
+    origin = np.array(DESTINATIONS)[rng.integers(len(DESTINATIONS), size=count)]
+    lat = origin[:, 0] + rng.normal(0, 0.03, count)
+    lng = origin[:, 1] + rng.normal(0, 0.03, count)
+    return [{'tourist_id': f'GEOBENCH{i % 5000:05d}', 'latitude': float(lat[i]), 'longitude': float(lng[i])}
+            for i in range(count)]
+
+
+def timed(label, fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    print(f'{label:36} {best * 1000:9.1f} ms')
+    return result
+
+
+def main():
+    fix_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    zone_count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    rng = np.random.default_rng(0)
+    fixes = random_fixes(fix_count, rng)
+    with app.app_context():
+        db.create_all()
+        import_geojson(zone_features(zone_count, rng))
+        app_module.geofence_monitor.reload()
+        index = app_module.geofence_monitor.index()
+        print(f'{fix_count} fixes against {zone_count} zones')
+
+        grid = timed('grid index', lambda: [sorted(z.id for z in index.zones_at(f['latitude'], f['longitude']))
+                                            for f in fixes])
+        scan = timed('scan every zone', lambda: [sorted(z.id for z in index.zones if z.contains(f['latitude'], f['longitude']))
+                                                 for f in fixes], repeat=1)
+        if grid != scan:
+            print('mismatch: the grid index and the full scan found different zones')
+            sys.exit(1)
+
+        timed('raise breaches (first worker)', lambda: app_module.raise_geofence_breaches(fixes), repeat=1)
+        first = Alert.query.filter_by(alert_type='geo_fence_breach').count()
+        # A second worker, or the same one after a restart, knows nothing of the first one's zone state
+        app_module.geofence_monitor = GeofenceMonitor()
+        app_module.geofence_monitor.init_app(app)
+        app_module.geofence_monitor.reload()
+        timed('raise breaches (restarted worker)', lambda: app_module.raise_geofence_breaches(fixes), repeat=1)
+        second = Alert.query.filter_by(alert_type='geo_fence_breach').count()
+        print(f'breach alerts: {first} after the first worker, {second} after the restart')
+        if second != first:
+            print(f'{second - first} duplicate breach alerts')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
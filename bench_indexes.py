@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Secondary index benchmark
+Generates a synthetic dataset with synthetic.py (default 100k tourists, 6
+fixes each), times the queries the indexes in migrations.QUERY_INDEXES were
+added for, drops those indexes and times the same queries again, then puts
+the indexes back. Each query's plan is printed both ways so the speedup can
+be traced to the index
+
+Usage: python bench_indexes.py [--tourists N] [--repeat 20] [--db PATH]
+       (--db reuses a dataset generated by an earlier run)
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# name -> (SQL, function of (rng, tourist ids, group ids, now) giving the parameters); the hot queries
+# of the AI engine, the dashboard and the tourist app
+QUERIES = {
+    'latest fix of a tourist': (
+        "SELECT latitude, longitude, timestamp FROM location WHERE tourist_id = :tourist_id "
+        "ORDER BY timestamp DESC LIMIT 1",
+        lambda rng, tourists, groups, now: {'tourist_id': rng.choice(tourists)}),
+    'fixes of the last 10 minutes': (
+        "SELECT tourist_id, latitude, longitude, timestamp FROM location WHERE timestamp > :since",
+        lambda rng, tourists, groups, now: {'since': (now - timedelta(minutes=10)).strftime(TIMESTAMP_FORMAT)}),
+    'open panic alerts, newest first': (
+        "SELECT id, tourist_id, timestamp FROM alert WHERE resolved = 0 AND alert_type = 'panic' "
+        "ORDER BY timestamp DESC LIMIT 50",
+        lambda rng, tourists, groups, now: {}),
+    'open alert of a tourist': (
+        "SELECT id FROM alert WHERE tourist_id = :tourist_id AND alert_type = 'inactivity' AND resolved = 0",
+        lambda rng, tourists, groups, now: {'tourist_id': rng.choice(tourists)}),
+    'members of a group': (
+        "SELECT tourist_id FROM group_member WHERE group_id = :group_id",
+        lambda rng, tourists, groups, now: {'group_id': rng.choice(groups)}),
+    'group of a tourist': (
+        "SELECT group_id FROM group_member WHERE tourist_id = :tourist_id",
+        lambda rng, tourists, groups, now: {'tourist_id': rng.choice(tourists)}),
+    'tourists quiet for 15 minutes': (
+        "SELECT tourist_id FROM latest_location WHERE timestamp < :cutoff AND timestamp > :since",
+        lambda rng, tourists, groups, now: {'cutoff': (now - timedelta(minutes=15)).strftime(TIMESTAMP_FORMAT),
+                                            'since': (now - timedelta(minutes=45)).strftime(TIMESTAMP_FORMAT)}),
+}
+
+
+def time_queries(conn, repeat, tourists, groups, now):
+    """Median milliseconds per query, with the same parameters for every run of the benchmark"""
+    from sqlalchemy import text
+
+    results = {}
+    for name, (sql, make_params) in QUERIES.items():
+        rng = random.Random(name)
+        latencies = []
+        for _ in range(repeat):
+            params = make_params(rng, tourists, groups, now)
+            started = time.perf_counter()
+            conn.execute(text(sql), params).all()
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        plan = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), make_params(rng, tourists, groups, now)).all()
+        results[name] = (latencies[len(latencies) // 2] * 1000, '; '.join(row[-1] for row in plan))
+    return results
+
+
+def main():
+    args = sys.argv[1:]
+    tourists = int(args[args.index('--tourists') + 1]) if '--tourists' in args else 100000
+    repeat = int(args[args.index('--repeat') + 1]) if '--repeat' in args else 20
+    path = args[args.index('--db') + 1] if '--db' in args else os.path.join(tempfile.mkdtemp(), 'indexes.db')
+    fresh = not os.path.exists(path)
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(path)}'
+
+    from sqlalchemy import text
+
+    from app import app
+    from migrations import QUERY_INDEXES, create_index
+    from models import db
+    from synthetic import generate
+
+    with app.app_context():
+        now_file = path + '.now'
+        if fresh:
+            now = datetime.utcnow()
+            generate(db.engine, tourists, now=now, fixes=6)
+            with open(now_file, 'w') as f:
+                f.write(now.isoformat())
+        else:
+            with open(now_file) as f:
+                now = datetime.fromisoformat(f.read())
+            print(f'reusing {path}')
+
+        for name in QUERY_INDEXES:
+            create_index(name)
+        with db.engine.connect() as conn:
+            conn.execute(text('ANALYZE'))
+            tourist_ids = conn.execute(text('SELECT tourist_id FROM tourist')).scalars().all()
+            group_ids = conn.execute(text('SELECT id FROM "group"')).scalars().all() or [0]
+            indexed = time_queries(conn, repeat, tourist_ids, group_ids, now)
+
+        with db.engine.begin() as conn:
+            for name in QUERY_INDEXES:
+                conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
+            conn.execute(text('ANALYZE'))
+        with db.engine.connect() as conn:
+            unindexed = time_queries(conn, repeat, tourist_ids, group_ids, now)
+
+        for name in QUERY_INDEXES:
+            create_index(name)
+
+    print(f'\n{"query":32} {"indexed ms":>11} {"no index ms":>12} {"speedup":>8}')
+    for name, (ms, plan) in indexed.items():
+        before, before_plan = unindexed[name]
+        print(f'{name:32} {ms:11.3f} {before:12.3f} {before / ms if ms else 0:7.1f}x')
+        print(f'    with:    {plan}\n    without: {before_plan}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Ingestion load test
+Starts the Flask app under gunicorn sync workers (the current deployment)
+and the async ingest server against one throwaway database, then opens N
+concurrent keep-alive connections to each and drives tourist traffic:
+location updates, with 5% user-alert polls and 0.2% panic alerts.
+Reports throughput, latency percentiles, 503s and failed connections per
+concurrency level.
+
+Usage: python bench_ingest.py [--connections 50,200,1000] [--seconds 10] [--flask-workers 4]
+"""
+
+import asyncio
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+TOURISTS = 1000
+REQUEST_TIMEOUT = 10
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with {process.returncode}')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server did not open port {port}')
+
+
+def start_servers(env, flask_workers):
+    here = os.path.dirname(os.path.abspath(__file__))
+    flask_port, ingest_port = free_port(), free_port()
+    if shutil.which('gunicorn'):
+        flask_name = f'flask ({flask_workers} sync workers)'
+        flask_cmd = ['gunicorn', '-w', str(flask_workers), '-b', f'127.0.0.1:{flask_port}', '--log-level', 'warning', 'app:app']
+    else:
+        flask_name = 'flask (threaded dev server)'
+        flask_cmd = [sys.executable, '-c', f'from app import app; app.run(port={flask_port}, threaded=True)']
+    ingest_cmd = [sys.executable, 'ingest_server.py', '--host', '127.0.0.1', '--port', str(ingest_port)]
+    servers = []
+    for name, cmd, port in ((flask_name, flask_cmd, flask_port), ('async ingest', ingest_cmd, ingest_port)):
+        process = subprocess.Popen(cmd, cwd=here, env=env, stdout=subprocess.DEVNULL)
+        servers.append((name, port, process))
+    for name, port, process in servers:
+        wait_for_port(port, process)
+    return servers
+
+
+async def client(session, base, deadline, results, seed):
+    rng = random.Random(seed)
+    while time.monotonic() < deadline:
+        roll = rng.random()
+        tourist_id = f'BENCH{rng.randrange(TOURISTS):05d}'
+        started = time.perf_counter()
+        try:
+            if roll < 0.002:
+                request = session.post(f'{base}/panic_alert', json={
+                    'tourist_id': tourist_id, 'latitude': 28.61, 'longitude': 77.20})
+            elif roll < 0.05:
+                request = session.get(f'{base}/api/user_alerts/{tourist_id}')
+            else:
+                request = session.post(f'{base}/update_location', json={
+                    'tourist_id': tourist_id,
+                    'latitude': 28.6 + rng.random() / 10,
+                    'longitude': 77.2 + rng.random() / 10})
+            async with request as response:
+                await response.read()
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            status = 'error'
+        results.append((status, time.perf_counter() - started))
+
+
+async def load(port, connections, seconds):
+    base = f'http://127.0.0.1:{port}'
+    results = []
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        deadline = time.monotonic() + seconds
+        await asyncio.gather(*(client(session, base, deadline, results, seed) for seed in range(connections)))
+    return results
+
+
+def report(name, connections, seconds, results):
+    ok = sorted(latency for status, latency in results if status in (200, 202))
+    busy = sum(1 for status, _ in results if status == 503)
+    errors = sum(1 for status, _ in results if status not in (200, 202, 503))
+
+    def percentile(p):
+        return ok[min(len(ok) - 1, int(len(ok) * p))] * 1000 if ok else float('nan')
+
+    print(f'{name:28} {connections:6} {len(ok) / seconds:9.0f} {percentile(0.5):9.1f} '
+          f'{percentile(0.99):9.1f} {busy:7} {errors:7}')
+
+
+def main():
+    args = sys.argv[1:]
+    levels = [int(n) for n in (args[args.index('--connections') + 1] if '--connections' in args else '50,200,1000').split(',')]
+    seconds = float(args[args.index('--seconds') + 1]) if '--seconds' in args else 10
+    flask_workers = int(args[args.index('--flask-workers') + 1]) if '--flask-workers' in args else 4
+
+    directory = tempfile.mkdtemp()
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{os.path.join(directory, "ingest_bench.db")}',
+               RESPONSE_CACHE_ENABLED='0', QR_WORKERS='0')
+    os.environ.update(env)
+    from app import app
+    from models import db
+    with app.app_context():
+        db.create_all()
+
+    servers = start_servers(env, flask_workers)
+    try:
+        print(f'{"server":28} {"conns":>6} {"ok req/s":>9} {"p50 ms":>9} {"p99 ms":>9} {"503s":>7} {"errors":>7}')
+        for connections in levels:
+            for name, port, _ in servers:
+                results = asyncio.run(load(port, connections, seconds))
+                report(name, connections, seconds, results)
+    finally:
+        for _, _, process in servers:
+            process.terminate()
+            process.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    main()
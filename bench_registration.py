@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Registration-burst benchmark
+Registers a burst of tourists against a throwaway database and reports
+request latency and the time until every QR code can be served
+
+Usage: QR_WORKERS=0 python bench_registration.py [count]   (render inline)
+       python bench_registration.py [count]                (process pool)
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+DB_DIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(DB_DIR, "bench.db")}'
+os.environ['LOCATION_BUFFER_ENABLED'] = '0'
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def main():
+    from app import app
+    from models import db
+    from qr import qr_store
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    # Fresh QR directory so nothing is served from an earlier run
+    qr_store.directory = tempfile.mkdtemp(dir=DB_DIR)
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+
+    latencies = []
+    urls = []
+    started = time.perf_counter()
+    for i in range(count):
+        t = time.perf_counter()
+        response = client.post('/register', json={
+            'name': f'Passenger {i}', 'email': f'passenger{i}@example.com', 'phone': f'+91{9000000000 + i}'
+        })
+        latencies.append(time.perf_counter() - t)
+        urls.append(response.get_json()['qr_url'])
+    registered = time.perf_counter() - started
+
+    for url in urls:
+        if client.get(url).status_code != 200:
+            raise SystemExit(f'{url} failed')
+    ready = time.perf_counter() - started
+
+    print(f'QR workers:        {app.config["QR_WORKERS"]}')
+    print(f'Registrations:     {count} in {registered:.2f}s ({count / registered:.0f}/s)')
+    print(f'Latency p50 / p99: {percentile(latencies, 0.5) * 1000:.1f} / {percentile(latencies, 0.99) * 1000:.1f} ms')
+    print(f'All QR codes ready after {ready:.2f}s')
+    qr_store.close()
+
+
+if __name__ == '__main__':
+    main()
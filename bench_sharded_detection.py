@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Sharded detection scaling benchmark
+Generates a synthetic dataset with synthetic.py (default 1M tourists, 3 fixes
+each in the last hour; 5% inactive, 1% far off route, 0.5% speeding), then
+times one full pass of every detector with 1, 2, 4, ... worker processes and
+checks that every worker count raises exactly the same alerts
+
+Usage: python bench_sharded_detection.py [--tourists N] [--workers 1,2,4,8] [--db PATH]
+       (--db reuses a dataset generated by an earlier run)
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+
+def main():
+    args = sys.argv[1:]
+    tourists = int(args[args.index('--tourists') + 1]) if '--tourists' in args else 1000000
+    levels = [int(n) for n in (args[args.index('--workers') + 1] if '--workers' in args else '1,2,4,8').split(',')]
+    path = args[args.index('--db') + 1] if '--db' in args else os.path.join(tempfile.mkdtemp(), 'detection.db')
+    fresh = not os.path.exists(path)
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(path)}'
+
+    import storage
+    from detectors import ShardedAnomalyEngine
+    from synthetic import generate
+
+    engine = storage.get_engine()
+    now_file = path + '.now'
+    if fresh:
+        now = datetime.utcnow()
+        generate(engine, tourists, now=now)
+        with open(now_file, 'w') as f:
+            f.write(now.isoformat())
+    else:
+        with open(now_file) as f:
+            now = datetime.fromisoformat(f.read())
+        with engine.connect() as conn:
+            tourists = conn.exec_driver_sql('SELECT COUNT(*) FROM latest_location').scalar()
+        print(f'reusing {path} ({tourists} tourists)')
+
+    print(f'cpus: {os.cpu_count()}')
+    print(f'{"workers":>7} {"seconds":>9} {"tourists/s":>11} {"speedup":>8} {"alerts":>8}')
+    baseline = reference = None
+    for workers in levels:
+        sharded = ShardedAnomalyEngine(engine, workers=workers)
+        sharded.run_detectors(now=now)  # warm up the pool processes
+        with engine.begin() as conn:
+            conn.exec_driver_sql('DELETE FROM alert')
+        started = time.perf_counter()
+        raised = sharded.run_detectors(now=now)
+        seconds = time.perf_counter() - started
+        sharded.close()
+        with engine.begin() as conn:
+            conn.exec_driver_sql('DELETE FROM alert')
+
+        baseline = baseline or seconds
+        raised = sorted(alert[1:] for alert in raised)  # ids differ between runs
+        if reference is None:
+            reference = raised
+        elif raised != reference:
+            print(f'{workers} workers raised different alerts than {levels[0]}')
+            sys.exit(1)
+        print(f'{workers:7} {seconds:9.2f} {tourists / seconds:11.0f} {baseline / seconds:8.2f} {len(raised):8}')
+
+
+if __name__ == '__main__':
+    main()
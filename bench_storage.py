@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Concurrent writer stress test
+Several processes commit small location inserts against the same database
+for a fixed time and report committed writes/sec and lock errors, for
+SQLite with default settings, SQLite tuned by storage.py and (optionally)
+PostgreSQL
+
+Usage: python bench_storage.py [--writers N] [--seconds S] [--postgres postgresql://user@localhost/test_db]
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy.exc import OperationalError
+
+BENCH_TABLE = 'storage_bench'
+
+
+def writer(url, seconds, worker):
+    """Runs in a fresh process; storage reads SQLITE_PRAGMAS from the environment on import"""
+    import storage
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(url, **storage.engine_options(url))
+    insert = text(f"INSERT INTO {BENCH_TABLE} (tourist_id, latitude, longitude, timestamp) "
+                  "VALUES (:tourist_id, :latitude, :longitude, :timestamp)")
+    committed = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert, {'tourist_id': f'W{worker}', 'latitude': 28.6, 'longitude': 77.2,
+                                      'timestamp': '2026-01-01 00:00:00'})
+            committed += 1
+        except OperationalError:
+            errors += 1
+    engine.dispose()
+    return committed, errors
+
+
+def prepare(url):
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+        id_column = 'SERIAL PRIMARY KEY' if url.startswith('postgresql') else 'INTEGER PRIMARY KEY AUTOINCREMENT'
+        conn.execute(text(f"CREATE TABLE {BENCH_TABLE} (id {id_column}, tourist_id VARCHAR(20), "
+                          "latitude FLOAT, longitude FLOAT, timestamp TIMESTAMP)"))
+    engine.dispose()
+
+
+def cleanup(url):
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+    engine.dispose()
+
+
+def run(name, url, writers, seconds, pragmas=True):
+    os.environ['SQLITE_PRAGMAS'] = '1' if pragmas else '0'
+    prepare(url)
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(writers) as pool:
+        results = pool.starmap(writer, [(url, seconds, worker) for worker in range(writers)])
+    cleanup(url)
+    committed = sum(r[0] for r in results)
+    errors = sum(r[1] for r in results)
+    print(f'{name:16} {committed / seconds:10.0f} writes/s {errors:8} lock errors')
+
+
+def main():
+    args = sys.argv[1:]
+    writers = int(args[args.index('--writers') + 1]) if '--writers' in args else 8
+    seconds = float(args[args.index('--seconds') + 1]) if '--seconds' in args else 5
+    postgres = args[args.index('--postgres') + 1] if '--postgres' in args else os.environ.get('BENCH_POSTGRES_URL')
+
+    directory = tempfile.mkdtemp()
+    print(f'{writers} writer processes, {seconds:g}s each')
+    run('sqlite default', f'sqlite:///{os.path.join(directory, "default.db")}', writers, seconds, pragmas=False)
+    run('sqlite tuned', f'sqlite:///{os.path.join(directory, "tuned.db")}', writers, seconds)
+    if postgres:
+        run('postgresql', postgres.replace('postgres://', 'postgresql://', 1), writers, seconds)
+    else:
+        print('postgresql       skipped (pass --postgres URL or set BENCH_POSTGRES_URL)')
+
+
+if __name__ == '__main__':
+    main()
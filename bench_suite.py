@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the request handlers and the AI detectors
+Builds a throwaway database from the seeded synthetic dataset (synthetic.py),
+times each endpoint through the Flask test client and each detector against
+the same data, replays a short walking-tourist simulation (simulator.py), and
+writes the results as JSON tagged with the git commit. Same seed and sizes
+give comparable numbers across commits:
+
+    python bench_suite.py --output before.json
+    (apply a change)
+    python bench_suite.py --compare before.json
+
+Usage: python bench_suite.py [--tourists 10000] [--repeat 200] [--detector-repeat 5] [--seed 42]
+                             [--only endpoint.,detector.inactivity] [--output PATH] [--compare OLD.json]
+       (runs offline; the response cache is off so handlers are measured, RESPONSE_CACHE_ENABLED=1 turns it on)
+"""
+
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+DB_DIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(DB_DIR, "bench_suite.db")}'
+os.environ.setdefault('QR_WORKERS', '0')
+os.environ.setdefault('RESPONSE_CACHE_ENABLED', '0')
+
+RESULTS_DIR = 'bench_results'
+WARMUP = 10
+BATCH_SIZE = 100
+NEW_FIXES_PER_CYCLE = 1000
+TRAJECTORY_TOURISTS = 100000  # Scoring benchmarks use in-memory tracks of this many tourists
+TRAJECTORY_FIXES = 6  # An hour of fixes at synthetic.FIX_INTERVAL
+
+benchmarks = []
+
+
+def benchmark(name):
+    """Register fn(suite) -> list of per-operation seconds"""
+    def register(fn):
+        benchmarks.append((name, fn))
+        return fn
+    return register
+
+
+class Suite:
+    def __init__(self, app, tourists, repeat, detector_repeat, seed):
+        self.app = app
+        self.tourists = tourists
+        self.repeat = repeat
+        self.detector_repeat = detector_repeat
+        self.rng = np.random.default_rng(seed)
+        self.seed = seed
+        self._trajectory_rows = None
+        self.client = app.test_client()
+        self.police = app.test_client()
+        with self.police.session_transaction() as session:
+            session['police_logged_in'] = True
+
+    def tourist(self):
+        from synthetic import tourist_id
+        return tourist_id(int(self.rng.integers(self.tourists)))
+
+    def fix(self):
+        return {'tourist_id': self.tourist(), 'latitude': 28.6 + self.rng.random() / 10,
+                'longitude': 77.2 + self.rng.random() / 10}
+
+    def time_requests(self, make_request, expected=(200, 202)):
+        latencies = []
+        for i in range(WARMUP + self.repeat):
+            started = time.perf_counter()
+            response = make_request()
+            elapsed = time.perf_counter() - started
+            if response.status_code not in expected:
+                raise RuntimeError(f'unexpected {response.status_code}: {response.get_data(as_text=True)[:200]}')
+            if i >= WARMUP:
+                latencies.append(elapsed)
+        return latencies
+
+    def trajectory_rows(self):
+        """(tourist_id, latitude, longitude, timestamp) rows of the last hour for TRAJECTORY_TOURISTS tourists"""
+        if self._trajectory_rows is None:
+            from synthetic import FIX_INTERVAL, tourist_id, walk
+            lat, lng, offsets = walk(np.random.default_rng(self.seed), TRAJECTORY_TOURISTS, TRAJECTORY_FIXES,
+                                     FIX_INTERVAL, 0.05, 0.01, 0.005)
+            now = datetime.utcnow()
+            self._trajectory_rows = [(tourist_id(k), float(lat[k, j]), float(lng[k, j]),
+                                      now - timedelta(seconds=float(offsets[k, j])))
+                                     for k in range(TRAJECTORY_TOURISTS) for j in range(TRAJECTORY_FIXES)]
+        return self._trajectory_rows
+
+    def time_calls(self, fn, repeat=None):
+        latencies = []
+        for _ in range(repeat or self.detector_repeat):
+            started = time.perf_counter()
+            # Detectors print a line per alert
+            with contextlib.redirect_stdout(io.StringIO()):
+                fn()
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+
+@benchmark('endpoint.update_location')
+def bench_update_location(suite):
+    return suite.time_requests(lambda: suite.client.post('/update_location', json=suite.fix()))
+
+
+@benchmark('endpoint.locations_batch')
+def bench_locations_batch(suite):
+    return suite.time_requests(lambda: suite.client.post(
+        '/api/locations/batch', json={'locations': [suite.fix() for _ in range(BATCH_SIZE)]}))
+
+
+@benchmark('endpoint.user_alerts')
+def bench_user_alerts(suite):
+    return suite.time_requests(lambda: suite.client.get(f'/api/user_alerts/{suite.tourist()}'))
+
+
+@benchmark('endpoint.user_alerts_delta')
+def bench_user_alerts_delta(suite):
+    """Polls with ?since= when nothing changed"""
+    cursor = suite.client.get(f'/api/user_alerts/{suite.tourist()}').headers['X-Change-Cursor']
+    return suite.time_requests(lambda: suite.client.get(f'/api/user_alerts/{suite.tourist()}?since={cursor}'))
+
+
+@benchmark('endpoint.panic_alert')
+def bench_panic_alert(suite):
+    return suite.time_requests(lambda: suite.client.post('/panic_alert', json=suite.fix()))
+
+
+@benchmark('endpoint.alerts')
+def bench_alerts(suite):
+    return suite.time_requests(lambda: suite.police.get('/api/alerts'))
+
+
+@benchmark('endpoint.locations')
+def bench_locations(suite):
+    return suite.time_requests(lambda: suite.police.get('/api/locations?limit=1000'))
+
+
+@benchmark('endpoint.latest_locations')
+def bench_latest_locations(suite):
+    return suite.time_requests(lambda: suite.police.get('/api/locations?latest=1&limit=1000'))
+
+
+@benchmark('endpoint.latest_locations_delta')
+def bench_latest_locations_delta(suite):
+    """Polls with ?since= after one batch of moves"""
+    cursor = suite.police.get('/api/locations?latest=1&limit=1').headers['X-Change-Cursor']
+    suite.client.post('/api/locations/batch', json={'locations': [suite.fix() for _ in range(BATCH_SIZE)]})
+    from app import location_buffer
+    location_buffer.flush()
+    return suite.time_requests(lambda: suite.police.get(f'/api/locations?since={cursor}'))
+
+
+@benchmark('endpoint.tourists')
+def bench_tourists(suite):
+    return suite.time_requests(lambda: suite.police.get('/api/tourists'))
+
+
+@benchmark('detector.inactivity')
+def bench_inactivity(suite):
+    from ai_engine import AIAnomalyDetector
+    return suite.time_calls(AIAnomalyDetector().detect_inactivity)
+
+
+@benchmark('detector.trajectory')
+def bench_trajectory(suite):
+    from ai_engine import AIAnomalyDetector
+    return suite.time_calls(AIAnomalyDetector().detect_trajectory_anomalies)
+
+
+def score_per_tourist(rows):
+    """The scoring the trajectory detector did before trajectory.py: group fixes per tourist, then a Python loop
+
+    Computes the same displacement and sustained speed as score_tracks; returns (deviated, speeding) id sets
+    """
+    from trajectory import DEVIATION_METERS, EARTH_RADIUS_M, MIN_SEGMENT_SECONDS, SPEED_LIMIT_KMH
+
+    def haversine(lat1, lng1, lat2, lng2):
+        lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+        return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(max(a, 0.0), 1.0)))
+
+    tourist_locations = {}
+    for row in rows:
+        tourist_locations.setdefault(row[0], []).append(row)
+    deviated, speeding = set(), set()
+    for tourist_id, locs in tourist_locations.items():
+        locs.sort(key=lambda loc: loc[3])
+        if len(locs) >= 3 and haversine(locs[0][1], locs[0][2], locs[-1][1], locs[-1][2]) > DEVIATION_METERS:
+            deviated.add(tourist_id)
+        speeds = [None]
+        for previous, loc in zip(locs, locs[1:]):
+            dt = (loc[3] - previous[3]).total_seconds()
+            speeds.append(haversine(previous[1], previous[2], loc[1], loc[2]) / dt if dt >= MIN_SEGMENT_SECONDS else None)
+        for i in range(2, len(locs)):
+            if speeds[i] is None or speeds[i - 1] is None:
+                continue
+            net = haversine(locs[i - 2][1], locs[i - 2][2], locs[i][1], locs[i][2]) / \
+                (locs[i][3] - locs[i - 2][3]).total_seconds()
+            if min(speeds[i], speeds[i - 1], net) * 3.6 > SPEED_LIMIT_KMH:
+                speeding.add(tourist_id)
+                break
+    return deviated, speeding
+
+
+@benchmark('detector.trajectory_scoring_100k')
+def bench_trajectory_scoring(suite):
+    """Vectorized scoring of TRAJECTORY_TOURISTS in-memory tracks, checked against the per-tourist loop"""
+    from trajectory import Tracks, score_tracks
+
+    rows = suite.trajectory_rows()
+    scores = score_tracks(Tracks.from_rows(rows))
+    flagged = (set(scores.tourist_ids[scores.deviations()]), set(scores.tourist_ids[scores.speed_anomalies()]))
+    if flagged != score_per_tourist(rows):
+        raise RuntimeError('vectorized scoring flagged different tourists than the per-tourist loop')
+    return suite.time_calls(lambda: score_tracks(Tracks.from_rows(rows)))
+
+
+@benchmark('detector.trajectory_loop_100k')
+def bench_trajectory_loop(suite):
+    """The per-tourist Python loop over the same tracks, for comparison"""
+    rows = suite.trajectory_rows()
+    return suite.time_calls(lambda: score_per_tourist(rows))
+
+
+@benchmark('detector.incremental_bootstrap')
+def bench_incremental_bootstrap(suite):
+    from ai_engine import IncrementalAnomalyEngine
+
+    def bootstrap():
+        engine = IncrementalAnomalyEngine()
+        with engine.get_db_connection() as conn:
+            engine.bootstrap(conn)
+    return suite.time_calls(bootstrap)
+
+
+@benchmark('detector.incremental_cycle')
+def bench_incremental_cycle(suite):
+    """One cycle over NEW_FIXES_PER_CYCLE fresh fixes (insert time excluded)"""
+    from ai_engine import IncrementalAnomalyEngine, TIMESTAMP_FORMAT
+    from synthetic import insert_rows
+
+    engine = IncrementalAnomalyEngine()
+    latencies = []
+    with engine.get_db_connection() as conn, contextlib.redirect_stdout(io.StringIO()):
+        engine.bootstrap(conn)
+        conn.commit()
+        for _ in range(suite.detector_repeat):
+            now = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+            insert_rows(conn, 'location', ('tourist_id', 'latitude', 'longitude', 'timestamp'),
+                        [(suite.tourist(), 28.6 + suite.rng.random() / 10, 77.2 + suite.rng.random() / 10, now)
+                         for _ in range(NEW_FIXES_PER_CYCLE)])
+            conn.commit()
+            started = time.perf_counter()
+            engine.run_cycle(conn)
+            latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+@benchmark('detector.alert_dedup')
+def bench_alert_dedup(suite):
+    """Every tourist as an inactivity candidate, rolled back after each run"""
+    import storage
+    from alert_dedup import raise_alerts
+    from synthetic import tourist_id
+
+    candidates = [(tourist_id(i), 'inactivity', 'benchmark', None, None) for i in range(suite.tourists)]
+    latencies = []
+    with storage.get_engine().connect() as conn:
+        for _ in range(suite.detector_repeat):
+            started = time.perf_counter()
+            raise_alerts(conn, candidates)
+            latencies.append(time.perf_counter() - started)
+            conn.rollback()
+    return latencies
+
+
+def run_simulation(suite, results):
+    """A short walking-tourist replay; one result per endpoint it hits"""
+    from simulator import Simulation, TestClientTarget
+    from synthetic import tourist_id
+
+    tourists = min(suite.tourists, 500)
+    simulation = Simulation(TestClientTarget(suite.app), [tourist_id(i) for i in range(tourists)],
+                            seed=suite.seed, panic_per_hour=1)
+    wall_seconds = simulation.run(5 * 60)
+    for kind, stats in simulation.summary(wall_seconds).items():
+        results[f'simulation.{kind}'] = stats
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def compare(old, new):
+    if old.get('params') != new['params']:
+        print(f"\n⚠️  Parameters differ from {old.get('commit', 'the old run')}: {old.get('params')}")
+    print(f'\n{"benchmark":36} {"old p50 ms":>11} {"new p50 ms":>11} {"change":>8}')
+    for name, stats in new['results'].items():
+        before = old['results'].get(name)
+        if not before or not before.get('n') or not stats.get('n'):
+            continue
+        change = (stats['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0.0
+        print(f'{name:36} {before["p50_ms"]:11.3f} {stats["p50_ms"]:11.3f} {change:+7.1f}%')
+
+
+def main():
+    args = sys.argv[1:]
+
+    def option(name, default, cast=int):
+        return cast(args[args.index(name) + 1]) if name in args else default
+
+    params = {
+        'tourists': option('--tourists', 10000),
+        'repeat': option('--repeat', 200),
+        'detector_repeat': option('--detector-repeat', 5),
+        'seed': option('--seed', 42),
+        'response_cache': os.environ['RESPONSE_CACHE_ENABLED'] != '0',
+    }
+    only = option('--only', None, lambda value: value.split(','))
+
+    from app import app, location_buffer
+    from models import db
+    from simulator import latency_stats
+    from synthetic import generate
+
+    with app.app_context():
+        dataset = generate(db.engine, params['tourists'], seed=params['seed'])
+    suite = Suite(app, params['tourists'], params['repeat'], params['detector_repeat'], params['seed'])
+
+    def selected(name):
+        return not only or any(name.startswith(prefix) for prefix in only)
+
+    results = {}
+    for name, fn in benchmarks:
+        if not selected(name):
+            continue
+        with app.app_context():
+            results[name] = latency_stats(fn(suite))
+        print(f'{name:36} p50 {results[name]["p50_ms"]:9.3f} ms   p99 {results[name]["p99_ms"]:9.3f} ms')
+    if selected('simulation.'):
+        run_simulation(suite, results)
+        for name in (name for name in results if name.startswith('simulation.')):
+            if results[name]['n']:
+                print(f'{name:36} {results[name]["ops_per_s"]:7.0f} req/s   p99 {results[name]["p99_ms"]:9.3f} ms')
+    location_buffer.close()
+
+    commit, dirty = git_commit()
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'created_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'database': 'sqlite',
+        'params': params,
+        'dataset': dataset,
+        'results': results,
+    }
+    output = option('--output', None, str)
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f'{(commit or "unknown")[:12]}{"-dirty" if dirty else ""}.json')
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nResults written to {output}')
+
+    if '--compare' in args:
+        with open(option('--compare', None, str)) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
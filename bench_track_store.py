@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Track replay benchmark
+Loads one tourist's track of N points from a throwaway database through the
+ORM (the old way) and through the track store, and checks both give the same
+points
+
+Usage: python bench_track_store.py [points]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'track_bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_FILE}'
+os.environ['LOCATION_BUFFER_ENABLED'] = '0'
+
+import numpy as np
+
+from app import app
+from models import db, Location, Tourist
+from track_store import encode_polyline, track_store
+
+TOURIST_ID = 'TRACKBENCH01'
+
+
+def seed(points):
+    rng = np.random.default_rng(0)
+    start = datetime.utcnow() - timedelta(seconds=10 * points)
+    lat = 28.6139 + np.cumsum(rng.normal(0, 2e-5, points))
+    lng = 77.2090 + np.cumsum(rng.normal(0, 2e-5, points))
+    db.session.add(Tourist(tourist_id=TOURIST_ID, name='Bench', email='bench@example.com', phone='0'))
+    db.session.execute(db.insert(Location), [
+        {'tourist_id': TOURIST_ID, 'latitude': float(lat[i]), 'longitude': float(lng[i]),
+         'timestamp': start + timedelta(seconds=10 * i)}
+        for i in range(points)
+    ])
+    db.session.commit()
+    return start
+
+
+def timed(label, fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    print(f'{label:32} {best * 1000:9.1f} ms')
+    return result
+
+
+def main():
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    track_store.directory = os.path.dirname(DB_FILE)
+    with app.app_context():
+        db.create_all()
+        start = seed(points)
+        print(f'{points} points for one tourist')
+
+        orm = timed('ORM Location objects', lambda: Location.query.filter_by(tourist_id=TOURIST_ID)
+                    .order_by(Location.timestamp).all(), repeat=1)
+        timed('track file build (first sync)', lambda: track_store.sync(TOURIST_ID, db.session), repeat=1)
+        track = timed('track store read', lambda: track_store.read(TOURIST_ID))
+        middle = start + timedelta(seconds=5 * points)
+        timed('track store read, second half', lambda: track_store.read(TOURIST_ID, since=middle))
+        timed('polyline encode', lambda: encode_polyline(track.latitude, track.longitude))
+
+        with app.test_client() as client:
+            with client.session_transaction() as session:
+                session['police_logged_in'] = True
+            timed('GET /api/track?format=polyline', lambda: client.get(f'/api/track/{TOURIST_ID}?format=polyline'))
+            timed('GET /api/track (JSON arrays)', lambda: client.get(f'/api/track/{TOURIST_ID}'))
+
+        size = os.path.getsize(track_store.path(TOURIST_ID))
+        print(f'track file: {size / 1e6:.2f} MB ({size / points:.1f} bytes/point)')
+        error = max(np.abs(track.latitude - [row.latitude for row in orm]).max(),
+                    np.abs(track.longitude - [row.longitude for row in orm]).max())
+        if len(track) != len(orm) or error > 1e-6:
+            print(f'mismatch: {len(track)} vs {len(orm)} points, max error {error:.2e} degrees')
+            sys.exit(1)
+        print(f'tracks match (max error {error:.1e} degrees)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Bulk tourist registration from tour operator manifests
+Rows are read in chunks; each chunk is validated, checked against existing
+emails with one query, given tourist IDs from the ID allocator, then
+written with a single executemany. An optional group and its members are
+created in the same transaction
+
+Usage: python bulk_import.py manifest.csv|manifest.json [--group "Group name"] [--created-by TOURIST_ID]
+"""
+
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import insert
+
+from id_allocator import tourist_ids, group_codes
+from models import db, Tourist, Group, GroupMember
+
+CHUNK_SIZE = 1000
+FIELD_LIMITS = {'name': 100, 'email': 100, 'phone': 20}
+
+
+class InvalidGroupLeader(ValueError):
+    """created_by is not a registered tourist, or is already in a group"""
+
+
+def read_manifest(stream, fmt):
+    """Yield row dicts from a binary stream; CSV is read lazily, JSON is a list or {"tourists": [...]}"""
+    if fmt == 'csv':
+        yield from csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+        return
+    data = json.load(stream)
+    if isinstance(data, dict):
+        data = data.get('tourists', [])
+    if not isinstance(data, list):
+        raise ValueError('JSON manifest must be a list of tourists')
+    yield from data
+
+
+def validate_row(row):
+    """(values, None) for a usable row, or (None, error message)"""
+    if not isinstance(row, dict):
+        return None, 'row must be an object'
+    values = {field: str(row.get(field) or '').strip() for field in FIELD_LIMITS}
+    missing = [field for field, value in values.items() if not value]
+    if missing:
+        return None, f"missing {', '.join(missing)}"
+    if '@' not in values['email']:
+        return None, 'invalid email'
+    for field, limit in FIELD_LIMITS.items():
+        if len(values[field]) > limit:
+            return None, f'{field} longer than {limit} characters'
+    return values, None
+
+
+def check_group_leader(tourist_id):
+    """Raise InvalidGroupLeader unless the tourist exists and is in no group (one group per tourist)"""
+    if db.session.query(Tourist.id).filter_by(tourist_id=tourist_id).first() is None:
+        raise InvalidGroupLeader(f'created_by {tourist_id} is not a registered tourist')
+    if db.session.query(GroupMember.id).filter_by(tourist_id=tourist_id).first() is not None:
+        raise InvalidGroupLeader(f'created_by {tourist_id} must leave their current group first')
+
+
+def import_tourists(rows, group_name=None, created_by=None, chunk_size=CHUNK_SIZE):
+    """Register every valid row in one transaction; returns per-row results
+
+    With group_name, a group led by created_by (default: the first imported
+    tourist) is created and every imported tourist becomes a member. An
+    invalid created_by rejects the whole import before any row is read
+    """
+    if group_name and created_by:
+        check_group_leader(created_by)
+    results = []
+    seen_emails = set()
+    group = None
+    imported = 0
+    rows = enumerate(rows, start=1)
+    try:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+
+            accepted = []
+            for number, row in chunk:
+                values, error = validate_row(row)
+                if error is None and values['email'] in seen_emails:
+                    error = 'duplicate email in manifest'
+                if error is not None:
+                    results.append({'row': number, 'success': False, 'error': error})
+                    continue
+                seen_emails.add(values['email'])
+                accepted.append((number, values))
+
+            # One query for emails that are already registered
+            emails = [values['email'] for _, values in accepted]
+            registered = {email for (email,) in db.session.query(Tourist.email).filter(Tourist.email.in_(emails))}
+            for number, values in accepted:
+                if values['email'] in registered:
+                    results.append({'row': number, 'success': False, 'error': 'email already registered'})
+            accepted = [(number, values) for number, values in accepted if values['email'] not in registered]
+            if not accepted:
+                continue
+
+            now = datetime.utcnow()
+            # Reserved inside this transaction, which already holds the write lock
+            new_ids = tourist_ids.take(len(accepted), session=db.session)
+            db.session.execute(insert(Tourist), [
+                dict(values, tourist_id=tourist_id, created_at=now)
+                for (_, values), tourist_id in zip(accepted, new_ids)
+            ])
+            for (number, values), tourist_id in zip(accepted, new_ids):
+                results.append({'row': number, 'success': True, 'tourist_id': tourist_id, 'email': values['email']})
+            imported += len(accepted)
+
+            if group_name:
+                if group is None:
+                    group = Group(name=group_name, created_by=created_by or new_ids[0], group_code=group_codes.take(1, session=db.session)[0])
+                    db.session.add(group)
+                    db.session.flush()
+                    if created_by:
+                        db.session.add(GroupMember(group_id=group.id, tourist_id=created_by, joined_at=now))
+                db.session.execute(insert(GroupMember), [
+                    {'group_id': group.id, 'tourist_id': tourist_id, 'joined_at': now} for tourist_id in new_ids
+                ])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    results.sort(key=lambda result: result['row'])
+    return {
+        'imported': imported,
+        'failed': len(results) - imported,
+        'group_code': group.group_code if group else None,
+        'results': results
+    }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1].startswith('--'):
+        print(__doc__)
+        sys.exit(1)
+
+    from app import app
+
+    args = sys.argv[2:]
+    group_name = args[args.index('--group') + 1] if '--group' in args else None
+    created_by = args[args.index('--created-by') + 1] if '--created-by' in args else None
+    fmt = 'json' if sys.argv[1].endswith('.json') else 'csv'
+
+    with open(sys.argv[1], 'rb') as f, app.app_context():
+        try:
+            summary = import_tourists(read_manifest(f, fmt), group_name=group_name, created_by=created_by)
+        except InvalidGroupLeader as e:
+            print(e)
+            sys.exit(1)
+    for result in summary['results']:
+        if not result['success']:
+            print(f"Row {result['row']}: {result['error']}")
+    print(f"Imported {summary['imported']} tourists, {summary['failed']} rows failed")
+    if summary['group_code']:
+        print(f"Group code: {summary['group_code']}")
@@ -0,0 +1,154 @@
+"""
+Change sequences for the delta-sync APIs
+Every insert or update of a tracked table stamps the row's change_seq with
+the next value of that table's counter in change_counter. Triggers do the
+stamping, so writes from any process or code path (ORM, AI engine text SQL,
+bulk upserts) are covered.
+
+The counter row stays locked until the writing transaction commits (SQLite
+has a single writer anyway), so sequence order is commit order. A reader that
+has seen every change up to N can never later find a committed row at or
+below N. Clients keep the cursor from X-Change-Cursor and send it back as
+?since=<cursor> to get only the rows changed after it.
+
+Tables in COUNTED have no change_seq column; their triggers only bump the
+counter, so other processes (the response cache) can tell they changed.
+"""
+
+from sqlalchemy import text
+
+from pagination import InvalidQuery, decode_cursor, encode_cursor
+
+# Table -> (key column, columns whose changes clients must see)
+TRACKED = {
+    'alert': ('id', ['tourist_id', 'alert_type', 'message', 'latitude', 'longitude', 'timestamp', 'resolved',
+                     'correlation_id']),
+    'latest_location': ('tourist_id', ['latitude', 'longitude', 'timestamp']),
+}
+
+# Tables whose writes only bump their change_counter row
+COUNTED = ['tourist', 'incident']
+
+SQLITE_STAMP = """
+    INSERT INTO change_counter (name, value) VALUES ('{table}', 1)
+        ON CONFLICT (name) DO UPDATE SET value = value + 1;
+    UPDATE {table} SET change_seq = (SELECT value FROM change_counter WHERE name = '{table}')
+        WHERE {key} = NEW.{key};
+"""
+
+POSTGRES_FUNCTION = """
+CREATE OR REPLACE FUNCTION bump_change_seq() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO change_counter (name, value) VALUES (TG_TABLE_NAME, 1)
+        ON CONFLICT (name) DO UPDATE SET value = change_counter.value + 1
+        RETURNING value INTO NEW.change_seq;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+SQLITE_COUNT = """
+    INSERT INTO change_counter (name, value) VALUES ('{table}', 1)
+        ON CONFLICT (name) DO UPDATE SET value = value + 1;
+"""
+
+POSTGRES_COUNT_FUNCTION = """
+CREATE OR REPLACE FUNCTION bump_change_counter() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO change_counter (name, value) VALUES (TG_TABLE_NAME, 1)
+        ON CONFLICT (name) DO UPDATE SET value = change_counter.value + 1;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def counter_statements(dialect, table):
+    if dialect == 'postgresql':
+        # One bump per statement, so a bulk import costs a single counter update
+        return [
+            POSTGRES_COUNT_FUNCTION,
+            f"DROP TRIGGER IF EXISTS {table}_change_counter ON {table}",
+            f"CREATE TRIGGER {table}_change_counter AFTER INSERT OR UPDATE OR DELETE ON {table} "
+            f"FOR EACH STATEMENT EXECUTE PROCEDURE bump_change_counter()",
+        ]
+    count = SQLITE_COUNT.format(table=table)
+    return [f"CREATE TRIGGER IF NOT EXISTS {table}_change_counter_{event.lower()} AFTER {event} ON {table} "
+            f"BEGIN {count} END" for event in ('INSERT', 'UPDATE', 'DELETE')]
+
+
+def trigger_statements(dialect, table):
+    key, columns = TRACKED[table]
+    if dialect == 'postgresql':
+        return [
+            POSTGRES_FUNCTION,
+            f"DROP TRIGGER IF EXISTS {table}_change_seq ON {table}",
+            f"CREATE TRIGGER {table}_change_seq BEFORE INSERT OR UPDATE OF {', '.join(columns)} ON {table} "
+            f"FOR EACH ROW EXECUTE PROCEDURE bump_change_seq()",
+        ]
+    stamp = SQLITE_STAMP.format(table=table, key=key)
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_change_seq_insert AFTER INSERT ON {table} BEGIN {stamp} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_change_seq_update AFTER UPDATE OF {', '.join(columns)} ON {table} "
+        f"BEGIN {stamp} END",
+    ]
+
+
+def install_triggers(connection, table):
+    statements = counter_statements if table in COUNTED else trigger_statements
+    for statement in statements(connection.dialect.name, table):
+        connection.execute(text(statement))
+
+
+def current_seq(session, table):
+    """Highest change_seq handed out for `table` (0 before the first change)
+
+    For COUNTED tables this is just the number of writes so far.
+    """
+    value = session.execute(text("SELECT value FROM change_counter WHERE name = :name"), {'name': table}).scalar()
+    return value or 0
+
+
+def encode_change_cursor(table, seq):
+    return encode_cursor(table, seq)
+
+
+def decode_change_cursor(cursor, table):
+    name, seq = decode_cursor(cursor, str, int)
+    if name != table:
+        raise InvalidQuery('Cursor belongs to a different resource')
+    return seq
+
+
+def is_change_cursor(value):
+    """Change cursors are opaque tokens; ISO timestamps and epoch seconds start with a digit"""
+    return bool(value) and not value[:1].isdigit()
+
+
+def changed_rows(session, table, query, seq_column, since, limit):
+    """Rows of `query` changed after cursor `since`, oldest change first, and the cursor to send back
+
+    `seq_column` is added to the selected columns, so every row has a
+    change_seq. Returns (rows, cursor, more). When nothing in the table
+    changed, only the counter is read.
+    """
+    rows, seq, more = changes_after(session, table, query, seq_column, since, limit)
+    return rows, encode_change_cursor(table, seq), more
+
+
+def changes_after(session, table, query, seq_column, since, limit):
+    """changed_rows with the plain sequence number instead of a cursor (for in-process tailers)"""
+    latest = current_seq(session, table)
+    if latest <= since:
+        return [], since, False
+    query = query.add_columns(seq_column).where(seq_column > since).order_by(seq_column).limit(limit + 1)
+    rows = session.execute(query).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if more:
+        seq = rows[-1].change_seq
+    else:
+        # Every change up to `latest` had committed before the query ran
+        seq = max([latest] + [row.change_seq for row in rows])
+    return rows, seq, more
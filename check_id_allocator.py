@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+ID allocator check
+Several worker processes (each with several threads) allocate IDs from one
+throwaway database at the same time; fails on any duplicate, invalid check
+character or per-thread ordering violation. Also checks on random samples
+that the check character catches single-character errors
+"""
+
+import os
+import random
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'id_allocator.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_FILE}'
+os.environ['LOCATION_BUFFER_ENABLED'] = '0'
+
+WORKERS = 4
+THREADS = 4
+IDS_PER_THREAD = 500
+
+
+def allocate(worker):
+    """IDs from one worker process, as one list per thread in allocation order"""
+    from app import app
+    from id_allocator import tourist_ids, efir_numbers
+
+    rng = random.Random(worker)
+
+    def run(thread):
+        with app.app_context():
+            allocated = []
+            while len(allocated) < IDS_PER_THREAD:
+                allocator = tourist_ids if rng.random() < 0.8 else efir_numbers
+                if rng.random() < 0.1:
+                    allocated.extend(allocator.take(rng.randint(2, 50)))
+                else:
+                    allocated.append(allocator.next())
+            return allocated
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        return list(pool.map(run, range(THREADS)))
+
+
+def counter_part(code, id_format):
+    return code[len(id_format.prefix):len(id_format.prefix) + id_format.width]
+
+
+def check_concurrent():
+    from id_allocator import TOURIST_ID, EFIR_NUMBER
+
+    with ProcessPoolExecutor(WORKERS) as pool:
+        batches = [ids for worker in pool.map(allocate, range(WORKERS)) for ids in worker]
+
+    all_ids = [code for ids in batches for code in ids]
+    duplicates = len(all_ids) - len(set(all_ids))
+    invalid = [code for code in all_ids if not (TOURIST_ID.is_valid(code) or EFIR_NUMBER.is_valid(code))]
+    unordered = 0
+    for ids in batches:
+        for id_format in (TOURIST_ID, EFIR_NUMBER):
+            counters = [counter_part(code, id_format) for code in ids if id_format.is_valid(code)]
+            unordered += sum(1 for a, b in zip(counters, counters[1:]) if a >= b)
+
+    print(f'{len(all_ids)} IDs from {WORKERS} processes x {THREADS} threads: '
+          f'{duplicates} duplicates, {len(invalid)} invalid, {unordered} out of order')
+    return duplicates == 0 and not invalid and unordered == 0
+
+
+def check_error_detection(samples=20000):
+    from id_allocator import TOURIST_ID, EFIR_NUMBER
+
+    rng = random.Random(0)
+    missed = 0
+    for _ in range(samples):
+        id_format = rng.choice((TOURIST_ID, EFIR_NUMBER))
+        code = id_format.format(rng.randrange(len(id_format.alphabet) ** id_format.width))
+        position = rng.randrange(len(id_format.prefix), len(code))
+        replacement = rng.choice([c for c in id_format.alphabet if c != code[position]])
+        typo = code[:position] + replacement + code[position + 1:]
+        missed += id_format.is_valid(typo)
+
+    print(f'{samples} random single-character typos: {missed} passed the check character')
+    return missed == 0
+
+
+def main():
+    from app import app
+    from models import db
+
+    with app.app_context():
+        db.create_all()
+
+    ok = check_concurrent()
+    ok = check_error_detection() and ok
+    if not ok:
+        sys.exit(1)
+    print('ID allocation is collision-free')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Query-count regression check
+Seeds a throwaway database at two sizes and fails if any endpoint issues
+more SQL statements as the result set grows (an N+1 query pattern)
+
+Only statements issued on the request's own thread are counted; the
+position grid and alert tail threads query on their own schedule
+"""
+
+import os
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'query_counts.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_FILE}'
+os.environ['LOCATION_BUFFER_ENABLED'] = '0'
+os.environ['RESPONSE_CACHE_ENABLED'] = '0'
+
+from sqlalchemy import event
+
+from app import app
+from models import db, Tourist, Alert, Group, GroupMember, LatestLocation
+from positions import latest_positions
+from proximity import position_grid
+
+ENDPOINTS = [
+    '/api/alerts',
+    '/api/tourists',
+    '/api/incidents',
+    '/api/locations?latest=1',
+    '/api/nearby?lat=28.6&lng=77.2&radius=1000',
+    '/api/group_locations/Q0',
+    '/api/my_group/Q0',
+    '/api/user_alerts/Q0',
+    '/api/tourist_details/Q0',
+]
+
+
+@contextmanager
+def count_queries():
+    """Count SQL statements executed on the app's engine by this thread"""
+    counter = {'queries': 0}
+    thread = threading.get_ident()
+
+    def before_cursor_execute(*args):
+        if threading.get_ident() == thread:
+            counter['queries'] += 1
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def seed(size):
+    """One group of `size` tourists at one spot, each with a position, a panic alert there and a user alert"""
+    db.drop_all()
+    db.create_all()
+    group = Group(name='Check', group_code='CHECK1', created_by='Q0')
+    db.session.add(group)
+    db.session.flush()
+    now = datetime.utcnow()
+    for i in range(size):
+        tourist_id = f'Q{i}'
+        db.session.add(Tourist(name=f'Tourist {i}', email=f'q{i}@example.com', phone='0', tourist_id=tourist_id))
+        db.session.add(GroupMember(group_id=group.id, tourist_id=tourist_id))
+        db.session.add(LatestLocation(tourist_id=tourist_id, latitude=28.6, longitude=77.2, timestamp=now))
+        db.session.add(Alert(tourist_id=tourist_id, alert_type='panic', message='check', latitude=28.6, longitude=77.2))
+        db.session.add(Alert(tourist_id='Q0', alert_type='user_alert', message='check'))
+    db.session.commit()
+    latest_positions.clear()
+    position_grid.clear()
+    # Requests read the grid as the background sync left it; fill it now so nearby enrichment is exercised
+    position_grid.sync()
+
+
+def measure(size):
+    with app.app_context():
+        seed(size)
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s['police_logged_in'] = True
+
+    counts = {}
+    with app.app_context():
+        for url in ENDPOINTS:
+            with count_queries() as counter:
+                response = client.get(url)
+            if response.status_code != 200:
+                raise SystemExit(f'{url} returned {response.status_code}')
+            counts[url] = counter['queries']
+            if url.startswith('/api/nearby') and not response.get_json():
+                raise SystemExit(f'{url} found nobody; the position grid was not loaded')
+            if url == '/api/alerts' and not all('nearby' in alert for alert in response.get_json()):
+                raise SystemExit(f'{url} returned alerts without nearby tourists')
+    return counts
+
+
+def main():
+    small = measure(3)
+    large = measure(60)
+
+    failed = False
+    for url in ENDPOINTS:
+        status = 'ok' if large[url] <= small[url] else 'GROWS'
+        failed = failed or status != 'ok'
+        print(f'{status:6} {url:44} {small[url]} -> {large[url]} queries')
+
+    if failed:
+        print('Query count grows with result size')
+        sys.exit(1)
+    print('Query counts are independent of result size')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""
+Sharded anomaly detection over a process pool
+Each detector is an independent check with its own interval. A pass of a
+detector runs one task per tourist shard in a pool of worker processes; each
+task opens its own DB connection and reads only its shard's rows. The
+coordinator merges the shards' alert candidates and inserts the new ones in
+one set-based statement (alert_dedup.py).
+
+Usage: python ai_engine.py --workers N [--shards M]
+"""
+
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+from sqlalchemy import text
+
+import metrics
+import storage
+from alert_dedup import raise_alerts
+from ai_engine import AIAnomalyDetector, DEVIATION_WINDOW, INACTIVITY_LIMIT, TIMESTAMP_FORMAT
+from sharding import shard_condition
+from trajectory import Tracks, score_tracks
+
+
+class Detector:
+    """One check over one shard of tourists; returns alert candidates"""
+
+    name = None
+    interval = 60
+
+    def __init__(self, interval=None):
+        if interval is not None:
+            self.interval = interval
+
+    def detect(self, conn, shard, shards, now):
+        """([(tourist_id, alert_type, message, latitude, longitude)], rows scanned)"""
+        raise NotImplementedError
+
+
+class InactivityDetector(Detector):
+    name = 'inactivity'
+
+    def detect(self, conn, shard, shards, now):
+        rows = conn.execute(
+            text("SELECT tourist_id, latitude, longitude FROM latest_location "
+                 "WHERE timestamp < :cutoff AND " + shard_condition(conn)),
+            {'cutoff': (now - INACTIVITY_LIMIT).strftime(TIMESTAMP_FORMAT), 'shard': shard, 'shards': shards}
+        ).all()
+        return [(tourist_id, 'inactivity', f"Tourist {tourist_id} inactive for >15 minutes", lat, lng)
+                for tourist_id, lat, lng in rows], len(rows)
+
+
+class TrajectoryDetector(Detector):
+    """Route deviation and speed anomalies over the last hour of fixes"""
+
+    name = 'trajectory'
+
+    def detect(self, conn, shard, shards, now):
+        tracks = Tracks.load(conn, now - DEVIATION_WINDOW, now, shard=shard, shards=shards)
+        scores = score_tracks(tracks)
+        candidates = []
+        for i in scores.deviations():
+            tourist_id = str(scores.tourist_ids[i])
+            km = scores.displacement_m[i] / 1000
+            candidates.append((tourist_id, 'deviation',
+                               f"Tourist {tourist_id} deviated from expected route ({km:.1f} km from start of last hour)",
+                               float(scores.last_latitude[i]), float(scores.last_longitude[i])))
+        for i in scores.speed_anomalies():
+            tourist_id = str(scores.tourist_ids[i])
+            kmh = scores.sustained_speed_kmh[i]
+            candidates.append((tourist_id, 'speed_anomaly',
+                               f"AI detected speed anomaly for tourist {tourist_id}: moving at {kmh:.0f} km/h",
+                               float(scores.last_latitude[i]), float(scores.last_longitude[i])))
+        return candidates, len(tracks)
+
+
+def run_detector(detector, shard, shards, now):
+    """Pool task: one detector over one shard on this worker's own connection"""
+    with storage.get_engine().connect() as conn:
+        return detector.detect(conn, shard, shards, now)
+
+
+def ignore_interrupts():
+    """Pool initializer: Ctrl-C reaches the whole process group; only the coordinator should react"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class DetectorPass:
+    """One run of a detector across all shards, collected as shard tasks finish"""
+
+    def __init__(self, detector, shards, now):
+        self.detector = detector
+        self.now = now
+        self.started = time.monotonic()
+        self.remaining = shards
+        self.candidates = {}
+        self.scanned = 0
+
+    def add(self, result):
+        candidates, scanned = result
+        for candidate in candidates:
+            # Shards are disjoint; this only merges repeats of one (tourist, type)
+            self.candidates.setdefault(candidate[:2], candidate)
+        self.scanned += scanned
+        self.remaining -= 1
+
+
+class ShardedAnomalyEngine:
+    def __init__(self, engine=None, workers=None, shards=None, detectors=None):
+        self.engine = engine or storage.get_engine()
+        self.workers = workers or os.cpu_count() or 1
+        self.shards = shards or self.workers
+        self.detectors = detectors or [InactivityDetector(), TrajectoryDetector()]
+        self._pool = None
+
+    def pool(self):
+        if self._pool is None:
+            # spawn: the coordinator holds pooled connections (and a retention thread) that must not be forked
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=ignore_interrupts)
+        return self._pool
+
+    def start_pass(self, detector, futures, now=None):
+        detector_pass = DetectorPass(detector, self.shards, now or datetime.utcnow())
+        for shard in range(self.shards):
+            future = self.pool().submit(run_detector, detector, shard, self.shards, detector_pass.now)
+            futures[future] = detector_pass
+        return detector_pass
+
+    def finish_pass(self, detector_pass):
+        """Dedupe and insert a completed pass's candidates; returns the alerts raised"""
+        with self.engine.connect() as conn:
+            raised = raise_alerts(conn, list(detector_pass.candidates.values()), detector_pass.now)
+            conn.commit()
+        counts = {}
+        for _, _, alert_type, _ in raised:
+            counts[alert_type] = counts.get(alert_type, 0) + 1
+        elapsed = time.monotonic() - detector_pass.started
+        metrics.observe_detector(detector_pass.detector.name, elapsed, detector_pass.scanned)
+        summary = ', '.join(f'{n} {alert_type}' for alert_type, n in sorted(counts.items())) or 'no new alerts'
+        print(f"✅ {detector_pass.detector.name}: {detector_pass.scanned} rows over {self.shards} shards "
+              f"in {elapsed:.2f}s, {summary}")
+        return raised
+
+    def run_detectors(self, detectors=None, now=None):
+        """Run each detector once over every shard and wait; returns the alerts raised"""
+        futures = {}
+        for detector in detectors or self.detectors:
+            self.start_pass(detector, futures, now)
+        raised = []
+        for future in list(futures):
+            detector_pass = futures.pop(future)
+            detector_pass.add(future.result())
+            if detector_pass.remaining == 0:
+                raised.extend(self.finish_pass(detector_pass))
+        return raised
+
+    def run_monitoring(self):
+        """Schedule every detector on its own interval; a slow detector does not hold up the others"""
+        print(f"🤖 AI Anomaly Detection Engine Started ({self.workers} workers, {self.shards} shards)")
+        next_due = {detector.name: 0.0 for detector in self.detectors}
+        running = set()
+        futures = {}
+        simulator = AIAnomalyDetector(self.engine)
+        last_simulation = 0.0
+
+        try:
+            while True:
+                now = time.monotonic()
+                for detector in self.detectors:
+                    if detector.name not in running and next_due[detector.name] <= now:
+                        running.add(detector.name)
+                        self.start_pass(detector, futures)
+                if now - last_simulation >= 60:
+                    last_simulation = now
+                    try:
+                        simulator.simulate_random_alerts()
+                    except Exception as e:
+                        print(f"❌ Error in AI engine: {e}")
+
+                idle = [next_due[d.name] for d in self.detectors if d.name not in running]
+                timeout = max(0.0, min(idle) - now) if idle else None
+                if not futures:
+                    time.sleep(timeout)
+                    continue
+                done, _ = wait(list(futures), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    detector_pass = futures.pop(future)
+                    try:
+                        detector_pass.add(future.result())
+                    except Exception as e:
+                        print(f"❌ {detector_pass.detector.name} shard failed: {e}")
+                        detector_pass.remaining -= 1
+                    if detector_pass.remaining == 0:
+                        name = detector_pass.detector.name
+                        try:
+                            self.finish_pass(detector_pass)
+                        except Exception as e:
+                            print(f"❌ Error saving {name} alerts: {e}")
+                        running.discard(name)
+                        next_due[name] = detector_pass.started + detector_pass.detector.interval
+        except KeyboardInterrupt:
+            print("\n🛑 AI Engine stopped by user")
+        finally:
+            self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
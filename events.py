@@ -0,0 +1,141 @@
+"""
+In-process pub/sub hub for pushing alerts to browsers
+Events are kept in a bounded ring buffer so clients can resume from the
+last event id they saw (Server-Sent Events or long-poll)
+"""
+
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import deque
+
+
+class EventHub:
+    """Topic-based event buffer with blocking waits"""
+
+    def __init__(self, history=5000, dedupe_window=20000, max_listeners=16):
+        # Event ids are "<epoch>-<n>"; the epoch changes per process so a
+        # client resuming against a different worker gets told to resync
+        self.epoch = uuid.uuid4().hex[:8]
+        self._events = deque(maxlen=history)
+        self._next_id = 1
+        self._changed = threading.Condition()
+        self._seen_keys = set()
+        self._seen_order = deque(maxlen=dedupe_window)
+        self._tailer = None
+        self._async_waiters = {}  # future -> loop of coroutines parked in wait_async
+        # Every open stream or long poll holds a worker thread; past the cap clients are turned away
+        self._listeners = threading.BoundedSemaphore(max_listeners)
+
+    def publish(self, topics, event, data, key=None):
+        """Publish an event to one or more topics; returns its id (None if a duplicate key)"""
+        with self._changed:
+            if key is not None:
+                if key in self._seen_keys:
+                    return None
+                if len(self._seen_order) == self._seen_order.maxlen:
+                    self._seen_keys.discard(self._seen_order[0])
+                self._seen_order.append(key)
+                self._seen_keys.add(key)
+            event_id = self._next_id
+            self._next_id += 1
+            self._events.append((event_id, frozenset(topics), event, data))
+            self._changed.notify_all()
+            waiters, self._async_waiters = self._async_waiters, {}
+        for waiter, loop in waiters.items():
+            loop.call_soon_threadsafe(_wake, waiter)
+        return f"{self.epoch}-{event_id}"
+
+    def add_listener(self):
+        """Claim a listener slot; False when max_listeners streams and polls are already open"""
+        return self._listeners.acquire(blocking=False)
+
+    def remove_listener(self):
+        self._listeners.release()
+
+    def wait(self, topics, last_event_id, timeout):
+        """Block until there are events newer than last_event_id or the timeout passes"""
+        topics = set(topics)
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                events, resync = self._collect(topics, last_event_id)
+                remaining = deadline - time.monotonic()
+                if events or resync or remaining <= 0:
+                    return events, resync
+                self._changed.wait(remaining)
+
+    async def wait_async(self, topics, last_event_id, timeout):
+        """wait() for an asyncio event loop: the coroutine is parked, no thread is held"""
+        topics = set(topics)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            with self._changed:
+                events, resync = self._collect(topics, last_event_id)
+                remaining = deadline - loop.time()
+                if events or resync or remaining <= 0:
+                    return events, resync
+                waiter = loop.create_future()
+                self._async_waiters[waiter] = loop
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                with self._changed:
+                    self._async_waiters.pop(waiter, None)
+
+    def current_id(self):
+        with self._changed:
+            return f"{self.epoch}-{self._next_id - 1}"
+
+    def _collect(self, topics, last_event_id):
+        after = self._parse_id(last_event_id)
+        if after is None:
+            return [], last_event_id is not None
+        oldest = self._events[0][0] if self._events else self._next_id
+        resync = after < oldest - 1
+        events = [
+            (f"{self.epoch}-{event_id}", event, data)
+            for event_id, event_topics, event, data in self._events
+            if event_id > after and not event_topics.isdisjoint(topics)
+        ]
+        return events, resync
+
+    def _parse_id(self, last_event_id):
+        if not last_event_id:
+            return None
+        epoch, _, number = last_event_id.partition('-')
+        if epoch != self.epoch or not number.isdigit():
+            return None
+        return int(number)
+
+    def start_tailer(self, app, poll, interval=1.0):
+        """Run poll() in an app context every interval seconds on a daemon thread
+
+        Used to pick up rows written by other processes (AI engine, other workers)
+        """
+        if self._tailer is not None and self._tailer.is_alive():
+            return
+
+        def run():
+            while True:
+                try:
+                    with app.app_context():
+                        poll()
+                except Exception as e:
+                    print(f"Event tailer error: {e}")
+                time.sleep(interval)
+
+        self._tailer = threading.Thread(target=run, name='event-tailer', daemon=True)
+        self._tailer.start()
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def format_sse(event_id, event, data):
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
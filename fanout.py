@@ -0,0 +1,208 @@
+"""
+Background group fan-out for panic alerts
+The panic request only commits the police alert and a panic_delivery row;
+this worker then writes one alert per group member in a single bulk insert,
+retrying with backoff and recording the outcome on the delivery row
+"""
+
+import atexit
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, or_
+
+from models import db, Alert, GroupMember, PanicDelivery
+
+STALE_CLAIM = timedelta(minutes=2)  # A 'sending' row older than this belongs to a dead worker
+RECOVER = -1  # Queue entry that runs recover() instead of a delivery
+
+
+class GroupFanout:
+    """Queue of panic_delivery ids processed by one worker thread"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = True
+        self.max_attempts = 5
+        self.retry_base = 0.5
+
+        self._queue = []  # heap of (due, delivery_id)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+        self._stopping = False
+        self._recovered = False
+
+        self.listeners = []  # called with the ids of alerts written by each delivery
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('PANIC_FANOUT_ASYNC', True)
+        self.max_attempts = app.config.get('PANIC_FANOUT_MAX_ATTEMPTS', 5)
+        app.extensions['group_fanout'] = self
+        atexit.register(self.close)
+
+    def start(self):
+        """Start the worker at process startup, so deliveries a crashed process left behind
+        are recovered now rather than when the next panic comes in"""
+        with self._lock:
+            self._ensure_thread()
+
+    def submit(self, delivery_id):
+        """Schedule a committed delivery; runs inline when the worker is disabled"""
+        if not self.enabled:
+            self.deliver(delivery_id)
+            return
+        with self._lock:
+            heapq.heappush(self._queue, (time.monotonic(), delivery_id))
+            self._ensure_thread()
+            self._wakeup.notify()
+
+    def deliver(self, delivery_id):
+        """Claim a delivery and write every member alert; returns False if it should be retried"""
+        claimed_at = datetime.utcnow()
+        claimed = PanicDelivery.query.filter(
+            PanicDelivery.id == delivery_id,
+            or_(PanicDelivery.status == 'pending',
+                (PanicDelivery.status == 'sending') & (PanicDelivery.updated_at < claimed_at - STALE_CLAIM))
+        ).update({'status': 'sending', 'attempts': PanicDelivery.attempts + 1, 'updated_at': claimed_at},
+                 synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return True  # Already delivered, or another worker holds it
+
+        delivery = db.session.get(PanicDelivery, delivery_id)
+        try:
+            sender_group = db.session.query(GroupMember.group_id).filter(
+                GroupMember.tourist_id == delivery.tourist_id
+            ).limit(1).scalar_subquery()
+            members = db.session.query(GroupMember.tourist_id).filter(
+                GroupMember.group_id == sender_group,
+                GroupMember.tourist_id != delivery.tourist_id
+            ).all()
+            rows = [{
+                'tourist_id': tourist_id,
+                'alert_type': 'user_alert',
+                'message': delivery.message,
+                'latitude': delivery.latitude,
+                'longitude': delivery.longitude,
+                'timestamp': delivery.created_at,
+                'resolved': False,
+                'correlation_id': delivery.correlation_id
+            } for tourist_id, in members]
+
+            # Member alerts and the delivery status commit together, so a retry never duplicates them
+            alert_ids = []
+            if rows:
+                alert_ids = list(db.session.scalars(insert(Alert).returning(Alert.id), rows))
+            delivery.status = 'delivered' if rows else 'no_group'
+            delivery.recipients = len(rows)
+            delivery.delivered_at = datetime.utcnow()
+            delivery.last_error = None
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            delivery = db.session.get(PanicDelivery, delivery_id)
+            final = delivery.attempts >= self.max_attempts
+            delivery.status = 'failed' if final else 'pending'
+            delivery.last_error = str(e)[:500]
+            db.session.commit()
+            print(f"Panic fan-out {delivery_id} attempt {delivery.attempts} failed: {e}")
+            return final
+
+        for listener in self.listeners:
+            listener(alert_ids)
+        return True
+
+    def recover(self):
+        """Requeue deliveries left pending (or half-sent) by a previous process"""
+        now = datetime.utcnow()
+        ids = [row.id for row in PanicDelivery.query.filter(or_(
+            PanicDelivery.status == 'pending',
+            (PanicDelivery.status == 'sending') & (PanicDelivery.updated_at < now - STALE_CLAIM)
+        )).with_entities(PanicDelivery.id)]
+        with self._lock:
+            # Ones already queued here keep their retry backoff
+            ids = set(ids).difference(queued for _, queued in self._queue)
+            for delivery_id in ids:
+                heapq.heappush(self._queue, (time.monotonic(), delivery_id))
+        return len(ids)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='panic-fanout', daemon=True)
+            self._thread.start()
+
+    def _next(self):
+        """Wait for the next due delivery id; None when stopping with nothing due"""
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                if self._queue and (self._queue[0][0] <= now or self._stopping):
+                    return heapq.heappop(self._queue)[1]
+                if self._stopping:
+                    return None
+                self._wakeup.wait(self._queue[0][0] - now if self._queue else None)
+
+    def _run(self):
+        with self.app.app_context():
+            if not self._recovered:
+                self._recovered = True
+                with self._lock:
+                    heapq.heappush(self._queue, (time.monotonic(), RECOVER))
+            attempts = {}
+            while True:
+                delivery_id = self._next()
+                if delivery_id is None:
+                    return
+                if delivery_id == RECOVER:
+                    if not self._stopping:
+                        self._recover_periodically()
+                    continue
+                try:
+                    done = self.deliver(delivery_id)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Panic fan-out {delivery_id} error: {e}")
+                    done = False
+                finally:
+                    db.session.remove()
+                if done:
+                    attempts.pop(delivery_id, None)
+                    continue
+                attempts[delivery_id] = attempts.get(delivery_id, 0) + 1
+                if attempts[delivery_id] >= self.max_attempts:
+                    attempts.pop(delivery_id)
+                    continue
+                with self._lock:
+                    if not self._stopping:
+                        delay = self.retry_base * 2 ** (attempts[delivery_id] - 1)
+                        heapq.heappush(self._queue, (time.monotonic() + delay, delivery_id))
+
+    def _recover_periodically(self):
+        """recover(), then again every STALE_CLAIM: a claim left by a crash only goes stale that long after it"""
+        try:
+            self.recover()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Panic fan-out recovery error: {e}")
+        finally:
+            db.session.remove()
+        with self._lock:
+            if not self._stopping:
+                heapq.heappush(self._queue, (time.monotonic() + STALE_CLAIM.total_seconds(), RECOVER))
+
+    def close(self):
+        """Stop the worker once queued deliveries have had one more attempt"""
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify()
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout=10)
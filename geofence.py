@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Geofence engine for restricted and danger zones
+Zones are loaded into an in-memory grid index (fixed-size lat/lng cells) so
+each ingested fix is checked against only the few zones whose bounding box
+overlaps its cell
+
+Usage: python geofence.py import zones.geojson
+"""
+
+import json
+import math
+import os
+import sys
+import threading
+
+from models import db, GeoFence
+
+EARTH_RADIUS_M = 6371000.0
+CELL_DEGREES = 0.01      # ~1.1 km cells
+MAX_CELLS_PER_ZONE = 4096  # Larger zones go in a short list that is always bbox-checked
+ZONE_TYPES = ('restricted', 'danger')
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def point_in_polygon(lat, lng, ring):
+    """Ray casting over a ring of (lat, lng) vertices"""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        lat_i, lng_i = ring[i]
+        lat_j, lng_j = ring[j]
+        if (lat_i > lat) != (lat_j > lat):
+            crossing = (lng_j - lng_i) * (lat - lat_i) / (lat_j - lat_i) + lng_i
+            if lng < crossing:
+                inside = not inside
+        j = i
+    return inside
+
+
+class Zone:
+    __slots__ = ('id', 'name', 'zone_type', 'shape', 'ring', 'center', 'radius_m', 'bbox')
+
+    def __init__(self, fence):
+        self.id = fence.id
+        self.name = fence.name
+        self.zone_type = fence.zone_type
+        self.shape = fence.shape
+        self.ring = None
+        self.center = None
+        self.radius_m = None
+        if fence.shape == 'circle':
+            self.center = (fence.center_latitude, fence.center_longitude)
+            self.radius_m = fence.radius_m
+            dlat = math.degrees(self.radius_m / EARTH_RADIUS_M)
+            dlng = dlat / max(math.cos(math.radians(self.center[0])), 1e-6)
+            self.bbox = (self.center[0] - dlat, self.center[1] - dlng, self.center[0] + dlat, self.center[1] + dlng)
+        else:
+            self.ring = [tuple(p) for p in json.loads(fence.coordinates)]
+            lats = [p[0] for p in self.ring]
+            lngs = [p[1] for p in self.ring]
+            self.bbox = (min(lats), min(lngs), max(lats), max(lngs))
+
+    def contains(self, lat, lng):
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        if not (min_lat <= lat <= max_lat and min_lng <= lng <= max_lng):
+            return False
+        if self.shape == 'circle':
+            return haversine_m(lat, lng, self.center[0], self.center[1]) <= self.radius_m
+        return point_in_polygon(lat, lng, self.ring)
+
+
+def cell_of(lat, lng):
+    return int(math.floor(lat / CELL_DEGREES)), int(math.floor(lng / CELL_DEGREES))
+
+
+class GeofenceIndex:
+    """Grid index from cell -> zones whose bounding box overlaps the cell"""
+
+    def __init__(self, zones):
+        self.zones = zones
+        self.cells = {}
+        self.large = []
+        for zone in zones:
+            min_lat, min_lng, max_lat, max_lng = zone.bbox
+            lo = cell_of(min_lat, min_lng)
+            hi = cell_of(max_lat, max_lng)
+            if (hi[0] - lo[0] + 1) * (hi[1] - lo[1] + 1) > MAX_CELLS_PER_ZONE:
+                self.large.append(zone)
+                continue
+            for x in range(lo[0], hi[0] + 1):
+                for y in range(lo[1], hi[1] + 1):
+                    self.cells.setdefault((x, y), []).append(zone)
+
+    def zones_at(self, lat, lng):
+        candidates = self.cells.get(cell_of(lat, lng), ())
+        found = [zone for zone in candidates if zone.contains(lat, lng)]
+        found.extend(zone for zone in self.large if zone.contains(lat, lng))
+        return found
+
+
+class GeofenceMonitor:
+    """Checks ingested fixes against active zones and reports zone entries
+
+    The index is rebuilt on a background thread after local zone changes and
+    every reload_interval seconds, so zones imported by other workers are
+    picked up. Requests only read the current index and never wait on a reload
+    """
+
+    def __init__(self, reload_interval=60):
+        self.app = None
+        self.reload_interval = reload_interval
+        self._index = GeofenceIndex([])
+        self._lock = threading.Lock()
+        self._inside = {}  # tourist_id -> set of zone ids the tourist is currently in
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        self.app = app
+        self.reload_interval = app.config.get('GEOFENCE_RELOAD_SECONDS', self.reload_interval)
+
+    def start(self, app=None):
+        """Reload from a background thread (the first pass runs at once)
+
+        Safe to call on every request: it only starts a thread if this process has none
+        """
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self.app = app or self.app
+            self._pid = os.getpid()  # A forked worker starts its own thread
+            self._thread = threading.Thread(target=self._run, name='geofence-reload', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    self.reload()
+            except Exception as e:
+                print(f"⚠️ Geofence reload failed: {e}")
+            self._wake.wait(self.reload_interval)
+
+    def invalidate(self):
+        """Rebuild soon after a local zone change"""
+        self._wake.set()
+
+    def reload(self):
+        """Build a new index from the active zones and swap it in"""
+        zones = [Zone(fence) for fence in GeoFence.query.filter_by(active=True)]
+        self._index = GeofenceIndex(zones)
+
+    def index(self):
+        return self._index
+
+    def check(self, fixes):
+        """Return (fix, zone) pairs for fixes that entered a zone they were not already in"""
+        index = self.index()
+        if not index.zones:
+            return []
+        breaches = []
+        with self._lock:
+            for fix in fixes:
+                zones = index.zones_at(fix['latitude'], fix['longitude'])
+                current = {zone.id for zone in zones}
+                previous = self._inside.get(fix['tourist_id'], set())
+                breaches.extend((fix, zone) for zone in zones if zone.id not in previous)
+                if current:
+                    self._inside[fix['tourist_id']] = current
+                else:
+                    self._inside.pop(fix['tourist_id'], None)
+        return breaches
+
+
+geofence_monitor = GeofenceMonitor()
+
+
+def parse_geojson(data):
+    """GeoFence rows from a GeoJSON FeatureCollection
+
+    Polygon features become polygon zones (outer ring only). Point features
+    need a radius_m property and become circles. Properties: name, zone_type
+    """
+    features = data.get('features', []) if isinstance(data, dict) else []
+    fences = []
+    for number, feature in enumerate(features, start=1):
+        geometry = feature.get('geometry') or {}
+        props = feature.get('properties') or {}
+        name = props.get('name') or f'Zone {number}'
+        zone_type = props.get('zone_type', 'restricted')
+        if zone_type not in ZONE_TYPES:
+            raise ValueError(f'Feature {number}: zone_type must be one of {", ".join(ZONE_TYPES)}')
+
+        if geometry.get('type') == 'Polygon':
+            # GeoJSON positions are [lng, lat]
+            ring = [[float(lat), float(lng)] for lng, lat, *_ in geometry['coordinates'][0]]
+            if len(ring) < 3:
+                raise ValueError(f'Feature {number}: polygon needs at least 3 points')
+            fences.append(GeoFence(name=name, zone_type=zone_type, shape='polygon', coordinates=json.dumps(ring)))
+        elif geometry.get('type') == 'Point':
+            lng, lat = geometry['coordinates'][:2]
+            radius = props.get('radius_m')
+            if not radius or float(radius) <= 0:
+                raise ValueError(f'Feature {number}: circle zones need a positive radius_m property')
+            fences.append(GeoFence(name=name, zone_type=zone_type, shape='circle',
+                                   center_latitude=float(lat), center_longitude=float(lng), radius_m=float(radius)))
+        else:
+            raise ValueError(f'Feature {number}: unsupported geometry {geometry.get("type")}')
+    return fences
+
+
+def import_geojson(data, replace=False):
+    """Bulk insert zones from GeoJSON; replace=True deactivates existing zones first"""
+    fences = parse_geojson(data)
+    if replace:
+        GeoFence.query.filter_by(active=True).update({'active': False})
+    db.session.add_all(fences)
+    db.session.commit()
+    geofence_monitor.invalidate()
+    return len(fences)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != 'import':
+        print(__doc__)
+        sys.exit(1)
+
+    from app import app
+
+    with open(sys.argv[2]) as f:
+        data = json.load(f)
+    with app.app_context():
+        count = import_geojson(data, replace='--replace' in sys.argv)
+    print(f"Imported {count} zones")
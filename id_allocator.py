@@ -0,0 +1,139 @@
+"""
+Central ID allocation for tourists, groups and e-FIR numbers
+Each kind of ID has a counter row in id_block. A process reserves a block of
+counter values with one UPDATE and hands them out from memory, so IDs never
+collide and increase over time (new rows land at the right-hand end of the
+unique index). IDs end in a Luhn mod N check character.
+
+Tourist IDs and group codes are also used as login / join secrets, so they
+carry RANDOM_CHARS random characters (50 bits) after the counter; the
+counter prefix is predictable and adds nothing to guessing cost
+"""
+
+import os
+import secrets
+import threading
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+
+BASE32 = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'  # Crockford: no I, L, O, U
+DIGITS = '0123456789'
+RANDOM_CHARS = 10  # 32^10 = 2^50 guesses
+
+
+def check_character(body, alphabet):
+    """Luhn mod N check character; catches any single-character error and most transpositions"""
+    n = len(alphabet)
+    total = 0
+    factor = 2
+    for char in reversed(body):
+        addend = factor * alphabet.index(char)
+        total += addend // n + addend % n
+        factor = 1 if factor == 2 else 2
+    return alphabet[(n - total % n) % n]
+
+
+def encode(value, width, alphabet):
+    n = len(alphabet)
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, n)
+        chars.append(alphabet[digit])
+    if value:
+        raise OverflowError(f'ID counter does not fit in {width} characters')
+    return ''.join(reversed(chars))
+
+
+class IdFormat:
+    """prefix + fixed-width counter + random characters + check character"""
+
+    def __init__(self, prefix, width, random_chars, alphabet):
+        self.prefix = prefix
+        self.width = width
+        self.random_chars = random_chars
+        self.alphabet = alphabet
+
+    def format(self, value):
+        body = encode(value, self.width, self.alphabet)
+        body += ''.join(secrets.choice(self.alphabet) for _ in range(self.random_chars))
+        return self.prefix + body + check_character(body, self.alphabet)
+
+    def is_valid(self, code):
+        if not code.startswith(self.prefix):
+            return False
+        body, check = code[len(self.prefix):-1], code[-1:]
+        if len(body) != self.width + self.random_chars or any(c not in self.alphabet for c in body):
+            return False
+        return check_character(body, self.alphabet) == check
+
+
+class IdAllocator:
+    """Hands out IDs from blocks of counter values reserved in the id_block table"""
+
+    _CREATE = text("INSERT INTO id_block (name, next_value) "
+                   "SELECT :name, 1 WHERE NOT EXISTS (SELECT 1 FROM id_block WHERE name = :name)")
+    _UPDATE = text("UPDATE id_block SET next_value = next_value + :size WHERE name = :name RETURNING next_value")
+
+    def __init__(self, name, id_format, block_size=100):
+        self.name = name
+        self.id_format = id_format
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def next(self):
+        return self.take(1)[0]
+
+    def take(self, count, session=None):
+        """`count` new IDs; reserves more blocks as needed
+
+        With a session, exactly `count` values are reserved inside that
+        session's transaction instead (for callers already holding a write
+        transaction, which on SQLite would block a separate reservation)
+        """
+        if session is not None:
+            session.execute(self._CREATE, {'name': self.name})
+            end = session.execute(self._UPDATE, {'size': count, 'name': self.name}).scalar()
+            return [self.id_format.format(value) for value in range(end - count, end)]
+
+        values = []
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: the parent's block is not ours to use
+                self._pid = os.getpid()
+                self._next = self._end = 0
+            while len(values) < count:
+                if self._next >= self._end:
+                    self._next, self._end = self._reserve(max(self.block_size, count - len(values)))
+                step = min(count - len(values), self._end - self._next)
+                values.extend(range(self._next, self._next + step))
+                self._next += step
+        return [self.id_format.format(value) for value in values]
+
+    def _reserve(self, size):
+        """Claim [start, start + size) in a short transaction of its own"""
+        for _ in range(2):
+            with db.engine.begin() as conn:
+                end = conn.execute(self._UPDATE, {'size': size, 'name': self.name}).scalar()
+            if end is not None:
+                return end - size, end
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(self._CREATE, {'name': self.name})
+            except IntegrityError:
+                pass  # Another process created it first
+        raise RuntimeError(f'Could not reserve {self.name} IDs')
+
+
+TOURIST_ID = IdFormat('', width=7, random_chars=RANDOM_CHARS, alphabet=BASE32)  # 18 characters
+GROUP_CODE = IdFormat('', width=5, random_chars=RANDOM_CHARS, alphabet=BASE32)  # 16 characters
+EFIR_NUMBER = IdFormat('FIR', width=8, random_chars=0, alphabet=DIGITS)  # FIR + 9 digits
+
+tourist_ids = IdAllocator('tourist', TOURIST_ID, block_size=100)
+group_codes = IdAllocator('group', GROUP_CODE, block_size=20)
+efir_numbers = IdAllocator('efir', EFIR_NUMBER, block_size=20)
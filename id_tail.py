@@ -0,0 +1,84 @@
+"""
+High-water marks over autoincrement ids that survive out-of-order commits
+Ids are handed out when a row is inserted but become visible when its
+transaction commits. On PostgreSQL, id 103 can therefore show up after 105
+has been read, and a plain `id > last_id` cursor skips it for good (SQLite's
+single writer commits in id order, so there it never happens).
+
+IdTail remembers ids missing below its high-water mark as gaps and reads them
+again until they appear or `grace` seconds pass (a rolled-back insert never
+appears). Readers that need every row up to a point without re-reading use
+`horizon`, the highest id below which nothing can still be in flight.
+"""
+
+import time
+
+from sqlalchemy import bindparam, text
+
+GRACE_SECONDS = 30.0
+MAX_GAPS = 10000
+SEED_WINDOW = 10000  # ids below the starting mark checked for gaps
+
+
+class IdTail:
+    def __init__(self, table, high_water=0, grace=GRACE_SECONDS):
+        self.table = table
+        self.high_water = high_water
+        self.grace = grace
+        self._gaps = {}  # missing id -> monotonic time it was first missed
+        self._new_ids = text(f"SELECT id FROM {table} WHERE id > :high_water OR id IN :gaps ORDER BY id LIMIT :limit") \
+            .bindparams(bindparam('gaps', expanding=True))
+
+    @property
+    def gaps(self):
+        """Missing ids still worth reading again"""
+        cutoff = time.monotonic() - self.grace
+        for missing in [missing for missing, since in self._gaps.items() if since < cutoff]:
+            del self._gaps[missing]
+        return sorted(self._gaps)
+
+    @property
+    def horizon(self):
+        """Every committed row with id <= horizon has been seen"""
+        gaps = self.gaps
+        return gaps[0] - 1 if gaps else self.high_water
+
+    def seed(self, conn, high_water=None):
+        """Start at `high_water` (default: the current max id), treating ids missing just below it as gaps"""
+        if high_water is None:
+            high_water = conn.execute(text(f"SELECT COALESCE(MAX(id), 0) FROM {self.table}")).scalar()
+        floor = max(high_water - SEED_WINDOW, 0)
+        present = conn.execute(text(f"SELECT id FROM {self.table} WHERE id > :floor AND id <= :high_water"),
+                               {'floor': floor, 'high_water': high_water}).scalars().all()
+        self.high_water = floor
+        self.advance(present)
+        self.high_water = max(self.high_water, high_water)
+
+    def params(self):
+        """Bind parameters for queries filtering on `id > :high_water OR id IN :gaps`"""
+        return {'high_water': self.high_water, 'gaps': self.gaps}
+
+    def advance(self, ids):
+        """Record rows read; ids skipped on the way up become gaps"""
+        now = time.monotonic()
+        seen = set(ids)
+        for found in seen.intersection(self._gaps):
+            del self._gaps[found]
+        top = max(seen, default=self.high_water)
+        if top > self.high_water:
+            skipped = range(max(self.high_water + 1, top - MAX_GAPS), top)
+            self._gaps.update((missing, now) for missing in skipped if missing not in seen)
+            self.high_water = top
+        if len(self._gaps) > MAX_GAPS:
+            for missing in sorted(self._gaps)[:len(self._gaps) - MAX_GAPS]:
+                del self._gaps[missing]
+
+    def refresh(self, conn, limit=100000):
+        """Advance over every id committed so far (for `horizon`); returns how many were new"""
+        count = 0
+        while True:
+            ids = conn.execute(self._new_ids, dict(self.params(), limit=limit)).scalars().all()
+            self.advance(ids)
+            count += len(ids)
+            if len(ids) < limit:
+                return count
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Async ingestion front end for the tourist-facing write endpoints
+Serves /update_location, /api/locations/batch, /panic_alert and
+/api/user_alerts/<tourist_id> on an asyncio event loop (aiohttp), so
+thousands of slow or idle client connections cost no threads. The handlers
+are the same functions the Flask routes call; they run on a small thread
+pool, and panic alerts (the only synchronous commits) go through a single
+dedicated writer thread.
+
+Tourists' alert streams (/api/stream/user_alerts/<tourist_id> and the
+/api/poll/user_alerts/<tourist_id> long poll) wait on the event loop too,
+so an open stream holds no thread; up to INGEST_MAX_STREAMS are served.
+
+Backpressure: once INGEST_MAX_PENDING requests are waiting for a thread (or
+INGEST_MAX_PENDING_WRITES for the writer), new ones get 503 with Retry-After
+straight away instead of queueing without bound.
+
+Run it next to the Flask app and route the endpoints above to it:
+    python ingest_server.py [--host 0.0.0.0] [--port 5001]
+"""
+
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+import metrics
+
+from app import (app, location_buffer, group_fanout, position_grid, geofence_monitor, event_hub, accept_location,
+                 accept_location_batch, raise_panic, user_alert_feed, publish_new_alerts, parse_poll_timeout,
+                 tourist_topic)
+from events import format_sse
+from pagination import InvalidQuery
+
+INGEST_THREADS = int(os.environ.get('INGEST_THREADS', 8))
+INGEST_MAX_PENDING = int(os.environ.get('INGEST_MAX_PENDING', 2000))
+INGEST_MAX_PENDING_WRITES = int(os.environ.get('INGEST_MAX_PENDING_WRITES', 256))
+INGEST_MAX_STREAMS = int(os.environ.get('INGEST_MAX_STREAMS', 20000))
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class Lane:
+    """Thread pool plus a cap on requests waiting for it"""
+
+    def __init__(self, name, threads, max_pending):
+        self.name = name
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self.completed = 0
+        self._executor = ThreadPoolExecutor(threads, thread_name_prefix=f'ingest-{name}')
+
+    async def run(self, handler, *args):
+        """handler(*args) in an app context on the pool; None when the lane is full"""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return None
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, in_app_context, handler, args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def stats(self):
+        return {'pending': self.pending, 'max_pending': self.max_pending,
+                'completed': self.completed, 'rejected': self.rejected}
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def in_app_context(handler, args):
+    with app.app_context():
+        return handler(*args)
+
+
+def user_alerts(tourist_id, query):
+    alerts, headers = user_alert_feed(tourist_id, query.get('since'), query.get('limit'))
+    return alerts, 200, headers
+
+
+class Streams:
+    """Open alert streams and long polls; each is a parked coroutine, the cap only bounds sockets and memory"""
+
+    def __init__(self, max_open):
+        self.max_open = max_open
+        self.open = 0
+        self.rejected = 0
+
+    def stats(self):
+        return {'open': self.open, 'max_open': self.max_open, 'rejected': self.rejected}
+
+    def stream_view(self):
+        async def view(request):
+            if self.open >= self.max_open:
+                self.rejected += 1
+                return busy()
+            self.open += 1
+            try:
+                return await stream_alerts(request, [tourist_topic(request.match_info['tourist_id'])])
+            finally:
+                self.open -= 1
+        return view
+
+    def poll_view(self):
+        async def view(request):
+            try:
+                timeout = parse_poll_timeout(request.query.get('timeout'))
+            except InvalidQuery as e:
+                return web.json_response({'error': str(e)}, status=400)
+            last_event_id = request.query.get('last_event_id')
+            if last_event_id is None:
+                return web.json_response({'events': [], 'last_event_id': event_hub.current_id(), 'resync': False})
+            if self.open >= self.max_open:
+                self.rejected += 1
+                return busy()
+            self.open += 1
+            try:
+                events, resync = await event_hub.wait_async([tourist_topic(request.match_info['tourist_id'])],
+                                                            last_event_id, timeout)
+            finally:
+                self.open -= 1
+            if resync:
+                last_event_id = event_hub.current_id()
+            elif events:
+                last_event_id = events[-1][0]
+            return web.json_response({
+                'events': [{'id': event_id, 'event': event, 'data': data} for event_id, event, data in events],
+                'last_event_id': last_event_id,
+                'resync': resync
+            })
+        return view
+
+
+async def stream_alerts(request, topics):
+    """Server-Sent Events for the topics, the same wire format as app.stream_events"""
+    cursor = request.headers.get('Last-Event-ID') or request.query.get('last_event_id')
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache',
+                                           'X-Accel-Buffering': 'no'})
+    await response.prepare(request)
+    await response.write(b'retry: 3000\n\n')
+    if cursor is None:
+        cursor = event_hub.current_id()
+        await response.write(f'id: {cursor}\n\n'.encode())
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + app.config['SSE_MAX_SECONDS']
+    while loop.time() < deadline:
+        events, resync = await event_hub.wait_async(topics, cursor, min(15, max(deadline - loop.time(), 0)))
+        if resync:
+            cursor = event_hub.current_id()
+            await response.write(format_sse(cursor, 'resync', {}).encode())
+        for event_id, event, data in events:
+            cursor = event_id
+            await response.write(format_sse(event_id, event, data).encode())
+        if not events and not resync:
+            await response.write(b': keepalive\n\n')
+    return response
+
+
+def busy():
+    return web.json_response({'success': False, 'message': 'Server busy, retry later'},
+                             status=503, headers={'Retry-After': '1'})
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def handle(lane, handler, parse_body=True):
+    """aiohttp handler running a shared (body, status[, headers]) handler on `lane`
+
+    Body-less (GET) handlers get the path parameters and then the query string.
+    """
+    async def view(request):
+        if parse_body:
+            data = await read_json(request)
+            if data is None:
+                return web.json_response({'success': False, 'message': 'Invalid JSON'}, status=400)
+            args = (data,)
+        else:
+            args = tuple(request.match_info.values()) + (request.query,)
+        route = request.match_info.route.resource.canonical
+        try:
+            result = await lane.run(metrics.measure, route, handler, *args)
+        except InvalidQuery as e:
+            return web.json_response({'error': str(e)}, status=400)
+        except Exception as e:
+            print(f"❌ Ingest error on {request.path}: {e}")
+            return web.json_response({'success': False, 'message': 'Internal error'}, status=500)
+        if result is None:
+            return busy()
+        body, status, *headers = result
+        return web.json_response(body, status=status, headers=headers[0] if headers else None)
+    return view
+
+
+@web.middleware
+async def record_metrics(request, handler):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else 'unmatched'
+        metrics.observe_request(route, request.method, status, time.perf_counter() - started)
+
+
+async def serve_metrics(request):
+    return web.Response(body=metrics.render(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+def create_app():
+    workers = Lane('worker', INGEST_THREADS, INGEST_MAX_PENDING)
+    writer = Lane('writer', 1, INGEST_MAX_PENDING_WRITES)
+    streams = Streams(INGEST_MAX_STREAMS)
+
+    async def stats(request):
+        return web.json_response({'worker': workers.stats(), 'writer': writer.stats(), 'streams': streams.stats()})
+
+    async def on_cleanup(server):
+        # Finish in-flight work, then write out buffered fixes and queued panic deliveries
+        workers.close()
+        writer.close()
+        location_buffer.close()
+        group_fanout.close()
+
+    middlewares = [record_metrics] if app.config['METRICS_ENABLED'] else []
+    server = web.Application(client_max_size=MAX_BODY_BYTES, middlewares=middlewares)
+    server.add_routes([
+        web.post('/update_location', handle(workers, accept_location)),
+        web.post('/api/locations/batch', handle(workers, accept_location_batch)),
+        web.post('/panic_alert', handle(writer, raise_panic)),
+        web.get('/api/user_alerts/{tourist_id}', handle(workers, user_alerts, parse_body=False)),
+        web.get('/api/stream/user_alerts/{tourist_id}', streams.stream_view()),
+        web.get('/api/poll/user_alerts/{tourist_id}', streams.poll_view()),
+        web.get('/api/ingest/stats', stats),
+        web.get('/metrics', serve_metrics),
+    ])
+    server.on_cleanup.append(on_cleanup)
+    return server
+
+
+def main():
+    args = sys.argv[1:]
+    host = args[args.index('--host') + 1] if '--host' in args else os.environ.get('INGEST_HOST', '0.0.0.0')
+    port = int(args[args.index('--port') + 1]) if '--port' in args else int(os.environ.get('INGEST_PORT', 5001))
+    from migrations import upgrade
+    with app.app_context():
+        upgrade()
+    position_grid.start(app)
+    geofence_monitor.start(app)
+    group_fanout.start()
+    # Alerts committed by the AI engine and the Flask workers reach this process's streams through the tail
+    event_hub.start_tailer(app, publish_new_alerts, app.config['ALERT_TAIL_INTERVAL'])
+    print(f"📥 Ingest server on {host}:{port} ({INGEST_THREADS} threads + 1 writer)")
+    web.run_app(create_app(), host=host, port=port, access_log=None, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""
+Write-behind buffer for tourist location fixes
+Coalesces single-fix posts and writes them with one bulk insert
+"""
+
+import atexit
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert
+
+from models import db, Location
+from positions import latest_positions, newest_by_tourist, upsert_latest
+
+# How far ahead of the server clock a client timestamp may be. A fix from the
+# future would win every later latest_location upsert and pin the position
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+# Fixes are already acknowledged when a flush fails, so transient errors
+# ("database is locked") are retried before the batch counts as failed
+FLUSH_ATTEMPTS = 4
+FLUSH_RETRY_DELAY = 0.1  # seconds, doubled after each failed attempt
+
+
+def parse_fix(data, received_at=None):
+    """Validate one location fix and return a row dict, or None if invalid"""
+    if not isinstance(data, dict):
+        return None
+    tourist_id = data.get('tourist_id')
+    if not tourist_id or not isinstance(tourist_id, str):
+        return None
+    try:
+        latitude = float(data['latitude'])
+        longitude = float(data['longitude'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+        return None
+
+    received_at = received_at or datetime.utcnow()
+    timestamp = received_at
+    if data.get('timestamp') is not None:
+        timestamp = parse_timestamp(data['timestamp'])
+        if timestamp is None or timestamp > received_at + MAX_CLOCK_SKEW:
+            return None
+
+    return {
+        'tourist_id': tourist_id,
+        'latitude': latitude,
+        'longitude': longitude,
+        'timestamp': timestamp
+    }
+
+
+def parse_timestamp(value):
+    """Parse epoch seconds/milliseconds or an ISO string into naive UTC"""
+    if isinstance(value, bool):
+        return None
+    try:
+        if isinstance(value, (int, float)):
+            seconds = value / 1000.0 if value > 1e11 else float(value)
+            return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None)
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class LocationWriteBuffer:
+    """Bounded in-memory queue of fixes flushed every N rows or T milliseconds"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = True
+        self.max_rows = 500
+        self.flush_interval = 0.25
+        self.capacity = 50000
+
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+        self.listeners = []  # called with {tourist_id: newest fix} after each commit
+        self._latencies = deque(maxlen=2048)
+        self._counters = {
+            'received': 0,
+            'written': 0,
+            'dropped': 0,
+            'failed': 0,
+            'retries': 0,
+            'flushes': 0
+        }
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('LOCATION_BUFFER_ENABLED', True)
+        self.max_rows = app.config.get('LOCATION_BUFFER_MAX_ROWS', 500)
+        self.flush_interval = app.config.get('LOCATION_BUFFER_FLUSH_MS', 250) / 1000.0
+        self.capacity = app.config.get('LOCATION_BUFFER_CAPACITY', 50000)
+        app.extensions['location_buffer'] = self
+        atexit.register(self.close)
+
+    def add(self, rows):
+        """Queue validated rows; returns how many were accepted"""
+        now = time.monotonic()
+        with self._lock:
+            self._counters['received'] += len(rows)
+            room = max(self.capacity - len(self._queue), 0)
+            accepted = rows[:room]
+            self._counters['dropped'] += len(rows) - len(accepted)
+            self._queue.extend((now, row) for row in accepted)
+            if self.enabled:
+                self._ensure_thread()
+                if len(self._queue) >= self.max_rows:
+                    self._wakeup.notify()
+
+        if not self.enabled:
+            self.flush()
+        return len(accepted)
+
+    def flush(self):
+        """Write everything queued so far, one bulk insert per max_rows chunk"""
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    if not self._queue:
+                        return
+                    count = min(len(self._queue), self.max_rows)
+                    batch = [self._queue.popleft() for _ in range(count)]
+                for attempt in range(FLUSH_ATTEMPTS):
+                    if attempt:
+                        time.sleep(FLUSH_RETRY_DELAY * 2 ** (attempt - 1))
+                    if self._write(batch):
+                        break
+                else:
+                    with self._lock:
+                        self._counters['failed'] += len(batch)
+
+    def _write(self, batch):
+        """One attempt at writing a batch; False if it failed and nothing was committed"""
+        rows = [row for _, row in batch]
+        newest = newest_by_tourist(rows)
+        try:
+            with self.app.app_context():
+                # History rows and current positions commit together
+                db.session.execute(insert(Location), rows)
+                upsert_latest(db.session, newest)
+                db.session.commit()
+        except Exception as e:
+            print(f"Location buffer flush error: {e}")
+            with self._lock:
+                self._counters['retries'] += 1
+            return False
+
+        latest_positions.put_many(newest)
+        for listener in self.listeners:
+            listener(newest)
+        done = time.monotonic()
+        with self._lock:
+            self._counters['written'] += len(rows)
+            self._counters['flushes'] += 1
+            self._latencies.extend(done - queued for queued, _ in batch)
+        return True
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='location-buffer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if len(self._queue) < self.max_rows and not self._stopping:
+                    self._wakeup.wait(self.flush_interval)
+                stopping = self._stopping
+            self.flush()
+            if stopping:
+                return
+
+    def close(self):
+        """Stop the flush thread and write out whatever is still queued"""
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify()
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout=10)
+        if self.app is not None:
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = dict(self._counters)
+            stats['queued'] = len(self._queue)
+            stats['capacity'] = self.capacity
+
+        def percentile(p):
+            if not latencies:
+                return None
+            index = min(int(len(latencies) * p), len(latencies) - 1)
+            return round(latencies[index] * 1000, 2)
+
+        stats['latency_ms'] = {
+            'p50': percentile(0.50),
+            'p99': percentile(0.99),
+            'max': round(latencies[-1] * 1000, 2) if latencies else None
+        }
+        stats['avg_rows_per_flush'] = round(stats['written'] / stats['flushes'], 1) if stats['flushes'] else 0
+        return stats
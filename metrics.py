@@ -0,0 +1,303 @@
+"""
+Prometheus metrics and a slow-request sampling profiler
+Request latency per route, SQL statements and SQL time per request (counted
+by SQLAlchemy cursor events, so the AI engine's queries count too), and
+detector cycle duration and rows scanned. Everything is kept in this
+process: each gunicorn worker serves its own /metrics, and the AI engine
+serves its own with --metrics-port.
+
+The profiler is off unless PROFILE_SLOW_MS is set. While it is on, a
+background thread samples the stacks of threads that are serving a request;
+a request that takes longer than the threshold has its samples written to
+PROFILE_DIR as folded stacks (one "frame;frame;frame count" line per stack),
+which flamegraph.pl, speedscope and inferno read directly.
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import sqlalchemy
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+CYCLE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+registry = []
+
+
+def format_labels(names, values, extra=''):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{format_labels(self.labels, labels)} {value:g}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # labels -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                bounds = [f'{bound:g}' for bound in self.buckets] + ['+Inf']
+                for bound, count in zip(bounds, series):
+                    bucket_labels = format_labels(self.labels, labels, f'le="{bound}"')
+                    lines.append(f'{self.name}_bucket{bucket_labels} {count}')
+                lines.append(f'{self.name}_sum{format_labels(self.labels, labels)} {series[-1]:g}')
+                lines.append(f'{self.name}_count{format_labels(self.labels, labels)} {series[-2]}')
+        return lines
+
+
+request_latency = Histogram('http_request_duration_seconds', 'Request latency by route', ('route', 'method'))
+requests_total = Counter('http_requests_total', 'Requests by route and status', ('route', 'method', 'status'))
+request_queries = Histogram('http_request_db_queries', 'SQL statements per request', ('route',), QUERY_COUNT_BUCKETS)
+request_db_seconds = Histogram('http_request_db_seconds', 'Time spent in SQL per request', ('route',))
+queries_total = Counter('db_queries_total', 'SQL statements executed')
+query_seconds_total = Counter('db_query_seconds_total', 'Time spent in SQL statements')
+detector_duration = Histogram('detector_cycle_duration_seconds', 'Duration of one detector cycle', ('detector',),
+                              CYCLE_BUCKETS)
+detector_rows = Counter('detector_rows_scanned_total', 'Rows read by detector cycles', ('detector',))
+alerts_raised = Counter('alerts_raised_total', 'Detector alerts inserted after deduplication', ('alert_type',))
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def observe_detector(detector, seconds, rows):
+    detector_duration.observe(seconds, detector)
+    detector_rows.inc(rows, detector)
+
+
+# SQL statements are attributed to the request being served on the same thread
+_local = threading.local()
+
+
+@event.listens_for(sqlalchemy.engine.Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+@event.listens_for(sqlalchemy.engine.Engine, 'after_cursor_execute')
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    queries_total.inc(1)
+    query_seconds_total.inc(elapsed)
+    stats = getattr(_local, 'queries', None)
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+
+
+def start_request():
+    """Begin counting SQL (and sampling stacks, if profiling) for the request on this thread"""
+    _local.queries = [0, 0.0]
+    profiler.begin()
+
+
+def finish_request(route, seconds):
+    stats = getattr(_local, 'queries', None)
+    _local.queries = None
+    if stats is not None:
+        request_queries.observe(stats[0], route)
+        request_db_seconds.observe(stats[1], route)
+    profiler.end(route, seconds)
+
+
+def observe_request(route, method, status, seconds):
+    request_latency.observe(seconds, route, method)
+    requests_total.inc(1, route, method, str(status))
+
+
+def measure(route, handler, *args):
+    """handler(*args) counted as a request on this thread (thread-pool handlers of the ingest server)"""
+    start_request()
+    started = time.perf_counter()
+    try:
+        return handler(*args)
+    finally:
+        finish_request(route, time.perf_counter() - started)
+
+
+def flask_route(request):
+    """Route template rather than the URL, so label values stay few"""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def init_app(app):
+    from flask import g, request
+
+    profiler.configure(app.config.get('PROFILE_SLOW_MS', 0), app.config.get('PROFILE_INTERVAL_MS', 5),
+                       app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles'))
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        start_request()
+
+    @app.after_request
+    def note_response_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    # Teardown runs for every request, including ones whose handler raised and never produced a response
+    @app.teardown_request
+    def record_request_metrics(exc):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            seconds = time.perf_counter() - started
+            route = flask_route(request)
+            finish_request(route, seconds)
+            observe_request(route, request.method, g.pop('metrics_status', 500), seconds)
+
+
+class SlowRequestProfiler:
+    """Samples stacks of in-flight requests; dumps folded stacks of the slow ones"""
+
+    def __init__(self):
+        self.threshold_ms = 0
+        self.interval = 0.005
+        self.directory = None
+        self.written = 0
+        self._active = {}  # thread id -> sampled stacks
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.threshold_ms > 0
+
+    def configure(self, threshold_ms, interval_ms=5, directory=None):
+        self.threshold_ms = threshold_ms
+        self.interval = interval_ms / 1000
+        self.directory = directory or self.directory
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._sample, name='metrics-profiler', daemon=True)
+                    self._thread.start()
+            print(f"🔬 Profiling requests slower than {threshold_ms} ms into {self.directory}")
+
+    def begin(self):
+        if self.enabled:
+            self._active[threading.get_ident()] = StackCounter()
+
+    def end(self, route, seconds):
+        samples = self._active.pop(threading.get_ident(), None)
+        if not samples or seconds * 1000 < self.threshold_ms:
+            return None
+        name = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        path = os.path.join(self.directory,
+                            f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{name}-{seconds * 1000:.0f}ms.folded")
+        with open(path, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        self.written += 1
+        return path
+
+    def _sample(self):
+        me = threading.get_ident()
+        while self.enabled:
+            time.sleep(self.interval)
+            if not self._active:
+                continue
+            frames = sys._current_frames()
+            for ident, samples in list(self._active.items()):
+                frame = frames.get(ident)
+                if frame is not None and ident != me:
+                    samples[fold(frame)] += 1
+        with self._lock:
+            self._thread = None
+
+
+def fold(frame):
+    """Root-first 'file:function:line;...' stack of a frame"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+profiler = SlowRequestProfiler()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host='0.0.0.0'):
+    """Expose /metrics from a process without a web app (the AI engine) on a daemon thread"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    print(f"📈 Metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations for the Smart Tourist Safety System
+Applied migrations are recorded in the schema_version table; every step is
+idempotent so it can run against databases created by db.create_all()
+
+Usage: python migrations.py [status|upgrade]
+"""
+
+import sys
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from changes import COUNTED, TRACKED, install_triggers
+from models import db, DETECTOR_ALERT_TYPES, LatestLocation
+from positions import backfill_latest
+
+
+def create_index(index_name):
+    """Create one of the indexes declared in models.py on a live database
+
+    PostgreSQL builds it CONCURRENTLY so writers are not blocked; SQLite
+    builds it in a single short transaction
+    """
+    index = find_index(index_name)
+    engine = db.engine
+    table = index.table.name
+    if index_name in {ix['name'] for ix in inspect(engine).get_indexes(table)}:
+        return False
+
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect))
+    if engine.dialect.name == 'postgresql':
+        ddl = ddl.replace(' INDEX ', ' INDEX CONCURRENTLY ', 1)
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(ddl))
+    else:
+        with engine.begin() as conn:
+            conn.execute(text(ddl))
+    print(f"   created index {index_name} on {table}")
+    return True
+
+
+def add_column(table_name, column_name):
+    """Add a column declared in models.py to an existing table if it is missing"""
+    engine = db.engine
+    if column_name in {c['name'] for c in inspect(engine).get_columns(table_name)}:
+        return False
+    column = db.metadata.tables[table_name].columns[column_name]
+    column_type = column.type.compile(dialect=engine.dialect)
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"))
+    print(f"   added column {table_name}.{column_name}")
+    return True
+
+
+def find_index(index_name):
+    for table in db.metadata.tables.values():
+        for index in table.indexes:
+            if index.name == index_name:
+                return index
+    raise KeyError(index_name)
+
+
+def migration_base_tables():
+    db.create_all()
+    if LatestLocation.query.first() is None:
+        tourists = backfill_latest()
+        print(f"   backfilled latest_location for {tourists} tourists")
+
+
+# Secondary indexes for the hot queries (bench_indexes.py times them with and without)
+QUERY_INDEXES = [
+    'ix_location_tourist_time',
+    'ix_location_time_id',
+    'ix_alert_resolved_type_time',
+    'ix_alert_tourist_type_resolved',
+    'ix_incident_tourist',
+    'ix_incident_time',
+    'ix_group_member_group',
+    'ix_group_member_tourist',
+    'ix_latest_location_time',
+]
+
+
+def migration_query_indexes():
+    for name in QUERY_INDEXES:
+        create_index(name)
+
+
+def migration_engine_state():
+    db.create_all()
+
+
+def migration_geofences():
+    db.create_all()
+
+
+def migration_panic_delivery():
+    db.create_all()
+
+
+def migration_alert_correlation():
+    add_column('alert', 'correlation_id')
+    add_column('panic_delivery', 'correlation_id')
+    # Older alerts each become their own incident
+    with db.engine.begin() as conn:
+        conn.execute(text("UPDATE alert SET correlation_id = 'alert-' || CAST(id AS VARCHAR(20)) WHERE correlation_id IS NULL"))
+    create_index('ix_alert_correlation')
+
+
+def migration_id_blocks():
+    db.create_all()
+
+
+def migration_location_history():
+    db.create_all()
+
+
+def migration_open_alert_dedup():
+    # Per-tourist existence checks could race into duplicate open alerts; keep the newest of each
+    types = ', '.join(f"'{alert_type}'" for alert_type in DETECTOR_ALERT_TYPES)
+    with db.engine.begin() as conn:
+        resolved = conn.execute(text(
+            f"UPDATE alert SET resolved = true WHERE resolved = false AND alert_type IN ({types}) "
+            f"AND id NOT IN (SELECT MAX(id) FROM alert WHERE resolved = false AND alert_type IN ({types}) "
+            f"GROUP BY tourist_id, alert_type)"
+        )).rowcount
+    if resolved:
+        print(f"   resolved {resolved} duplicate open detector alerts")
+    create_index('ix_alert_open_detector')
+
+
+def migration_change_sequences():
+    db.create_all()
+    add_column('alert', 'change_seq')
+    add_column('latest_location', 'change_seq')
+    # Rows written before this migration keep a NULL change_seq; clients start from a full load
+    with db.engine.begin() as conn:
+        for table in TRACKED:
+            install_triggers(conn, table)
+    for name in ['ix_alert_change_seq', 'ix_alert_tourist_change_seq', 'ix_latest_location_change_seq']:
+        create_index(name)
+
+
+def migration_change_counters():
+    db.create_all()
+    with db.engine.begin() as conn:
+        for table in COUNTED:
+            install_triggers(conn, table)
+
+
+def migration_wide_group_codes():
+    # Group codes grew to 16 characters; SQLite does not enforce VARCHAR lengths
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.begin() as conn:
+            conn.execute(text('ALTER TABLE "group" ALTER COLUMN group_code TYPE VARCHAR(20)'))
+
+
+MIGRATIONS = [
+    (1, 'Base tables and latest_location backfill', migration_base_tables),
+    (2, 'Secondary indexes for hot queries', migration_query_indexes),
+    (3, 'AI engine state table', migration_engine_state),
+    (4, 'Geofence zones table', migration_geofences),
+    (5, 'Panic fan-out delivery status table', migration_panic_delivery),
+    (6, 'Alert correlation ids', migration_alert_correlation),
+    (7, 'ID allocator blocks', migration_id_blocks),
+    (8, 'Downsampled location history table', migration_location_history),
+    (9, 'One open alert per tourist and detector type', migration_open_alert_dedup),
+    (10, 'Change sequences for delta sync', migration_change_sequences),
+    (11, 'Longer group codes', migration_wide_group_codes),
+    (12, 'Change counters for tourists and incidents', migration_change_counters),
+]
+
+
+def ensure_version_table():
+    with db.engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_version ("
+            "version INTEGER PRIMARY KEY, description VARCHAR(200) NOT NULL, applied_at TIMESTAMP NOT NULL)"
+        ))
+
+
+def applied_versions():
+    ensure_version_table()
+    with db.engine.connect() as conn:
+        return {row[0] for row in conn.execute(text("SELECT version FROM schema_version"))}
+
+
+def upgrade():
+    """Apply every pending migration in order; returns the versions applied"""
+    done = applied_versions()
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        print(f"Applying migration {version}: {description}")
+        migrate()
+        with db.engine.begin() as conn:
+            conn.execute(
+                text("INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {'v': version, 'd': description, 't': datetime.utcnow()}
+            )
+        applied.append(version)
+    return applied
+
+
+def status():
+    done = applied_versions()
+    for version, description, _ in MIGRATIONS:
+        print(f"{'[x]' if version in done else '[ ]'} {version}: {description}")
+
+
+if __name__ == '__main__':
+    from app import app
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'upgrade'
+    with app.app_context():
+        if command == 'status':
+            status()
+        elif command == 'upgrade':
+            applied = upgrade()
+            print(f"Applied {len(applied)} migration(s)" if applied else "Database is up to date")
+        else:
+            print(__doc__)
+            sys.exit(1)
@@ -2,9 +2,17 @@ from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 import random
 import string
+import uuid
 
 db = SQLAlchemy()
 
+# Alert types raised by the AI engine; at most one unresolved alert per tourist for each
+DETECTOR_ALERT_TYPES = ('inactivity', 'deviation', 'speed_anomaly')
+
+def new_correlation_id():
+    """Key shared by every alert raised for one incident"""
+    return uuid.uuid4().hex
+
 class Tourist(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -13,6 +21,16 @@ class Tourist(db.Model):
     tourist_id = db.Column(db.String(20), unique=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # tourist_id is the join key everywhere; there is no FK constraint on it
+    locations = db.relationship('Location', lazy='dynamic', viewonly=True,
+                                primaryjoin='Tourist.tourist_id == foreign(Location.tourist_id)')
+    alerts = db.relationship('Alert', lazy='dynamic', viewonly=True,
+                             primaryjoin='Tourist.tourist_id == foreign(Alert.tourist_id)')
+    membership = db.relationship('GroupMember', uselist=False, viewonly=True,
+                                 primaryjoin='Tourist.tourist_id == foreign(GroupMember.tourist_id)')
+    latest_location = db.relationship('LatestLocation', uselist=False, viewonly=True,
+                                      primaryjoin='Tourist.tourist_id == foreign(LatestLocation.tourist_id)')
+    
 class Location(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     tourist_id = db.Column(db.String(20), nullable=False)
@@ -29,6 +47,11 @@ class Alert(db.Model):
     longitude = db.Column(db.Float)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     resolved = db.Column(db.Boolean, default=False)
+    correlation_id = db.Column(db.String(32), default=new_correlation_id)
+    change_seq = db.Column(db.BigInteger)  # Stamped by a trigger on every insert/update (see changes.py)
+    
+    tourist = db.relationship('Tourist', viewonly=True,
+                              primaryjoin='foreign(Alert.tourist_id) == Tourist.tourist_id')
 
 class Incident(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -41,7 +64,7 @@ class Incident(db.Model):
 class Group(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    group_code = db.Column(db.String(10), unique=True, nullable=False)
+    group_code = db.Column(db.String(20), unique=True, nullable=False)
     created_by = db.Column(db.String(20), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -49,4 +72,108 @@ class GroupMember(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False)
     tourist_id = db.Column(db.String(20), nullable=False)
-    joined_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    joined_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    group = db.relationship('Group', backref=db.backref('members', lazy='select'))
+    tourist = db.relationship('Tourist', viewonly=True,
+                              primaryjoin='foreign(GroupMember.tourist_id) == Tourist.tourist_id')
+
+class LatestLocation(db.Model):
+    tourist_id = db.Column(db.String(20), primary_key=True)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    change_seq = db.Column(db.BigInteger)  # Stamped by a trigger on every insert/update (see changes.py)
+
+
+class EngineState(db.Model):
+    """Small key/value store for background jobs (e.g. AI engine high-water marks)"""
+    key = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.String(200), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class GeoFence(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    zone_type = db.Column(db.String(20), nullable=False, default='restricted')  # restricted, danger
+    shape = db.Column(db.String(10), nullable=False)  # polygon, circle
+    coordinates = db.Column(db.Text)  # JSON [[lat, lng], ...] ring for polygons
+    center_latitude = db.Column(db.Float)  # circles only
+    center_longitude = db.Column(db.Float)
+    radius_m = db.Column(db.Float)
+    active = db.Column(db.Boolean, default=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class PanicDelivery(db.Model):
+    """Delivery status of one panic alert's group fan-out"""
+    id = db.Column(db.Integer, primary_key=True)
+    alert_id = db.Column(db.Integer, nullable=False)  # The police panic alert
+    correlation_id = db.Column(db.String(32))  # Stamped on the member alerts
+    tourist_id = db.Column(db.String(20), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, delivered, no_group, failed
+    recipients = db.Column(db.Integer, default=0)
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    delivered_at = db.Column(db.DateTime)
+
+
+class LocationHistory(db.Model):
+    """Per-minute mean position for fixes older than the hot window (see retention.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    tourist_id = db.Column(db.String(20), nullable=False)
+    bucket = db.Column(db.DateTime, nullable=False)  # Start of the minute
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    samples = db.Column(db.Integer, nullable=False)
+
+
+class ChangeCounter(db.Model):
+    """Last change_seq handed out per tracked table (see changes.py)"""
+    name = db.Column(db.String(30), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False)
+
+
+class IdBlock(db.Model):
+    """Next unreserved counter value per ID kind (see id_allocator.py)"""
+    name = db.Column(db.String(20), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False)
+
+
+# Secondary indexes, shaped around the filters in app.py and ai_engine.py.
+# Existing databases get them through migrations.py.
+db.Index('ix_location_tourist_time', Location.tourist_id, Location.timestamp.desc())
+db.Index('ix_location_time_id', Location.timestamp, Location.id)
+db.Index('ix_alert_resolved_type_time', Alert.resolved, Alert.alert_type, Alert.timestamp)
+db.Index('ix_alert_tourist_type_resolved', Alert.tourist_id, Alert.alert_type, Alert.resolved)
+db.Index('ix_alert_correlation', Alert.correlation_id)
+open_detector_alert = db.and_(Alert.resolved == db.false(), Alert.alert_type.in_(DETECTOR_ALERT_TYPES))
+db.Index('ix_alert_open_detector', Alert.tourist_id, Alert.alert_type, unique=True,
+         sqlite_where=open_detector_alert, postgresql_where=open_detector_alert)
+db.Index('ix_incident_tourist', Incident.tourist_id)
+db.Index('ix_incident_time', Incident.timestamp)
+db.Index('ix_group_member_group', GroupMember.group_id)
+db.Index('ix_group_member_tourist', GroupMember.tourist_id)
+db.Index('ix_latest_location_time', LatestLocation.timestamp)
+db.Index('ix_panic_delivery_status', PanicDelivery.status, PanicDelivery.updated_at)
+db.Index('ix_location_history_tourist_bucket', LocationHistory.tourist_id, LocationHistory.bucket, unique=True)
+db.Index('ix_location_history_bucket', LocationHistory.bucket)
+db.Index('ix_alert_change_seq', Alert.change_seq)
+db.Index('ix_alert_tourist_change_seq', Alert.tourist_id, Alert.change_seq)
+db.Index('ix_latest_location_change_seq', LatestLocation.change_seq)
+
+
+def install_change_triggers(target, connection, **kw):
+    from changes import install_triggers
+    install_triggers(connection, target.name)
+
+
+# Tables created by db.create_all() get their change_seq / change_counter triggers straight away
+for model in (Alert, LatestLocation, Tourist, Incident):
+    db.event.listen(model.__table__, 'after_create', install_change_triggers)
@@ -0,0 +1,66 @@
+"""
+Keyset pagination and filter parsing helpers for list APIs
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from location_buffer import parse_timestamp
+
+
+class InvalidQuery(ValueError):
+    """Raised for malformed query parameters"""
+
+
+def encode_cursor(*values):
+    """Opaque cursor from the sort key of the last row returned"""
+    parts = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(parts, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, *types):
+    """Inverse of encode_cursor; types are the expected Python types of each key"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        parts = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if len(parts) != len(types):
+            raise ValueError
+        return tuple(datetime.fromisoformat(p) if t is datetime else t(p) for p, t in zip(parts, types))
+    except (ValueError, TypeError):
+        raise InvalidQuery('Invalid cursor')
+
+
+def parse_limit(value, default=1000, maximum=10000):
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise InvalidQuery('limit must be an integer')
+    if limit < 1:
+        raise InvalidQuery('limit must be positive')
+    return min(limit, maximum)
+
+
+def parse_time(value, name):
+    if value is None:
+        return None
+    parsed = parse_timestamp(float(value) if value.replace('.', '', 1).isdigit() else value)
+    if parsed is None:
+        raise InvalidQuery(f'{name} must be an ISO timestamp or epoch seconds')
+    return parsed
+
+
+def parse_bbox(value):
+    """bbox=min_lat,min_lng,max_lat,max_lng"""
+    if value is None:
+        return None
+    try:
+        min_lat, min_lng, max_lat, max_lng = (float(v) for v in value.split(','))
+    except ValueError:
+        raise InvalidQuery('bbox must be min_lat,min_lng,max_lat,max_lng')
+    if min_lat > max_lat or min_lng > max_lng:
+        raise InvalidQuery('bbox minimums must not exceed maximums')
+    return min_lat, min_lng, max_lat, max_lng
@@ -0,0 +1,154 @@
+"""
+Current position store
+LatestLocation holds one row per tourist and is upserted in the same
+transaction as location ingestion; reads go through an in-process LRU cache
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Location, LatestLocation
+
+_MISSING = object()
+
+
+class LatestPositionCache:
+    """LRU cache of tourist_id -> latest position dict (or None if never seen)"""
+
+    def __init__(self, max_size=100000, ttl=5.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_size = app.config.get('LATEST_CACHE_SIZE', self.max_size)
+        self.ttl = app.config.get('LATEST_CACHE_TTL', self.ttl)
+
+    def get(self, tourist_id):
+        return self.get_many([tourist_id]).get(tourist_id)
+
+    def get_many(self, tourist_ids):
+        """Latest positions for the given tourists; misses are loaded with one IN query"""
+        found = {}
+        misses = []
+        now = time.monotonic()
+        with self._lock:
+            for tourist_id in tourist_ids:
+                entry = self._entries.get(tourist_id, _MISSING)
+                if entry is not _MISSING and now - entry[0] < self.ttl:
+                    self._entries.move_to_end(tourist_id)
+                    found[tourist_id] = entry[1]
+                else:
+                    misses.append(tourist_id)
+
+        if misses:
+            rows = LatestLocation.query.filter(LatestLocation.tourist_id.in_(misses)).all()
+            loaded = {row.tourist_id: to_position(row) for row in rows}
+            for tourist_id in misses:
+                found[tourist_id] = loaded.get(tourist_id)
+            self.put_many({tourist_id: found[tourist_id] for tourist_id in misses})
+
+        return found
+
+    def put_many(self, positions):
+        """Record committed or freshly loaded positions; an older fix never replaces a newer one"""
+        with self._lock:
+            now = time.monotonic()
+            for tourist_id, position in positions.items():
+                entry = self._entries.get(tourist_id)
+                cached = entry[1] if entry is not None else None
+                if cached is not None and (position is None or cached['timestamp'] > position['timestamp']):
+                    continue
+                self._entries[tourist_id] = (now, position)
+                self._entries.move_to_end(tourist_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+latest_positions = LatestPositionCache()
+
+
+def to_position(row):
+    return {
+        'tourist_id': row.tourist_id,
+        'latitude': row.latitude,
+        'longitude': row.longitude,
+        'timestamp': row.timestamp
+    }
+
+
+def newest_by_tourist(rows):
+    """Reduce location rows to the newest fix per tourist"""
+    newest = {}
+    for row in rows:
+        current = newest.get(row['tourist_id'])
+        if current is None or row['timestamp'] >= current['timestamp']:
+            newest[row['tourist_id']] = row
+    return newest
+
+
+def upsert_latest(session, positions):
+    """Upsert LatestLocation rows inside the caller's transaction"""
+    if not positions:
+        return
+    values = [{
+        'tourist_id': p['tourist_id'],
+        'latitude': p['latitude'],
+        'longitude': p['longitude'],
+        'timestamp': p['timestamp']
+    } for p in positions.values()]
+
+    dialect = session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert(LatestLocation).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[LatestLocation.tourist_id],
+            set_={
+                'latitude': stmt.excluded.latitude,
+                'longitude': stmt.excluded.longitude,
+                'timestamp': stmt.excluded.timestamp
+            },
+            where=LatestLocation.timestamp <= stmt.excluded.timestamp
+        )
+        session.execute(stmt)
+        return
+
+    existing = {row.tourist_id: row for row in session.query(LatestLocation).filter(
+        LatestLocation.tourist_id.in_(list(positions))
+    )}
+    for value in values:
+        row = existing.get(value['tourist_id'])
+        if row is None:
+            session.add(LatestLocation(**value))
+        elif row.timestamp <= value['timestamp']:
+            row.latitude = value['latitude']
+            row.longitude = value['longitude']
+            row.timestamp = value['timestamp']
+
+
+def backfill_latest(chunk_size=1000):
+    """Populate LatestLocation from the full location history (one-off, for old databases)"""
+    newest = (db.session.query(Location.tourist_id, func.max(Location.timestamp).label('timestamp'))
+              .group_by(Location.tourist_id)
+              .subquery())
+    query = (db.session.query(Location.tourist_id, Location.latitude, Location.longitude, Location.timestamp)
+             .join(newest, (Location.tourist_id == newest.c.tourist_id) & (Location.timestamp == newest.c.timestamp)))
+
+    positions = newest_by_tourist(row._asdict() for row in query.all())
+    tourist_ids = list(positions)
+    for start in range(0, len(tourist_ids), chunk_size):
+        chunk = tourist_ids[start:start + chunk_size]
+        upsert_latest(db.session, {tourist_id: positions[tourist_id] for tourist_id in chunk})
+    db.session.commit()
+    latest_positions.clear()
+    return len(positions)
@@ -0,0 +1,201 @@
+"""
+Live position grid for proximity queries
+Current tourist positions are bucketed into fixed-size lat/lng cells and kept
+up to date from the ingestion path, so radius, bounding-box and k-nearest
+queries only touch the cells around the query point. Positions written by
+other processes are pulled in by a background thread, never on a request
+"""
+
+import heapq
+import math
+import os
+import threading
+import time
+
+from geofence import haversine_m
+from models import db, LatestLocation
+
+CELL_DEGREES = 0.005  # ~550 m cells
+METERS_PER_DEGREE = 111320.0
+
+
+def cell_of(lat, lng):
+    return int(math.floor(lat / CELL_DEGREES)), int(math.floor(lng / CELL_DEGREES))
+
+
+def ring_cells(center, ring):
+    """Cells on the square ring `ring` cells away from center"""
+    cx, cy = center
+    if ring == 0:
+        yield center
+        return
+    for x in range(cx - ring, cx + ring + 1):
+        yield x, cy - ring
+        yield x, cy + ring
+    for y in range(cy - ring + 1, cy + ring):
+        yield cx - ring, y
+        yield cx + ring, y
+
+
+class LivePositionGrid:
+    """tourist_id -> (lat, lng, timestamp), indexed by grid cell"""
+
+    def __init__(self, sync_interval=2.0):
+        self.sync_interval = sync_interval
+        self._cells = {}
+        self._positions = {}
+        self._lock = threading.RLock()
+        self._watermark = None
+        self._loaded = False
+        self._app = None
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        self.sync_interval = app.config.get('PROXIMITY_SYNC_SECONDS', self.sync_interval)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._positions.clear()
+            self._watermark = None
+            self._loaded = False
+
+    def update(self, positions):
+        """Apply committed positions (dict of tourist_id -> position dict); older fixes are ignored"""
+        with self._lock:
+            for tourist_id, p in positions.items():
+                current = self._positions.get(tourist_id)
+                if current is not None:
+                    if current[3] > p['timestamp']:
+                        continue
+                    bucket = self._cells.get(current[0])
+                    if bucket is not None:
+                        bucket.pop(tourist_id, None)
+                        if not bucket:
+                            del self._cells[current[0]]
+                cell = cell_of(p['latitude'], p['longitude'])
+                self._positions[tourist_id] = (cell, p['latitude'], p['longitude'], p['timestamp'])
+                self._cells.setdefault(cell, {})[tourist_id] = self._positions[tourist_id]
+
+    def start(self, app):
+        """Sync from a background thread every sync_interval (the first pass loads everything)
+
+        Safe to call on every request: it only starts a thread if this process has none
+        """
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._app = app
+            self._pid = os.getpid()  # A forked worker starts its own thread
+            self._thread = threading.Thread(target=self._run, name='position-grid-sync', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with self._app.app_context():
+                    self.sync()
+            except Exception as e:
+                print(f"⚠️ Position grid sync failed: {e}")
+            time.sleep(self.sync_interval)
+
+    def sync(self):
+        """Pull positions written by other processes from latest_location
+
+        The first call loads everything; later calls only read rows whose
+        change_seq (commit ordered, see changes.py) is past the last sync
+        """
+        from changes import current_seq
+
+        # Read before the rows, so a change racing the query is read again next time
+        seq = current_seq(db.session, 'latest_location')
+        query = db.select(LatestLocation.tourist_id, LatestLocation.latitude,
+                          LatestLocation.longitude, LatestLocation.timestamp)
+        if self._loaded:
+            if seq <= self._watermark:
+                return
+            query = query.where(LatestLocation.change_seq > self._watermark)
+        rows = db.session.execute(query).all()
+        self.update({row.tourist_id: {
+            'latitude': row.latitude,
+            'longitude': row.longitude,
+            'timestamp': row.timestamp
+        } for row in rows})
+        self._watermark = seq
+        self._loaded = True
+
+    def _cells_in_box(self, min_lat, min_lng, max_lat, max_lng):
+        lo = cell_of(min_lat, min_lng)
+        hi = cell_of(max_lat, max_lng)
+        if (hi[0] - lo[0] + 1) * (hi[1] - lo[1] + 1) > len(self._cells):
+            # Box covers more cells than are occupied: walk the occupied ones
+            for (x, y), bucket in self._cells.items():
+                if lo[0] <= x <= hi[0] and lo[1] <= y <= hi[1]:
+                    yield bucket
+            return
+        for x in range(lo[0], hi[0] + 1):
+            for y in range(lo[1], hi[1] + 1):
+                bucket = self._cells.get((x, y))
+                if bucket:
+                    yield bucket
+
+    def within_radius(self, lat, lng, radius_m, since=None):
+        """[(distance_m, tourist_id, lat, lng, timestamp)] within radius_m, nearest first"""
+        dlat = radius_m / METERS_PER_DEGREE
+        dlng = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        found = []
+        with self._lock:
+            for bucket in self._cells_in_box(lat - dlat, lng - dlng, lat + dlat, lng + dlng):
+                for tourist_id, (_, p_lat, p_lng, ts) in bucket.items():
+                    if since is not None and ts < since:
+                        continue
+                    distance = haversine_m(lat, lng, p_lat, p_lng)
+                    if distance <= radius_m:
+                        found.append((distance, tourist_id, p_lat, p_lng, ts))
+        found.sort()
+        return found
+
+    def in_box(self, min_lat, min_lng, max_lat, max_lng, since=None):
+        found = []
+        with self._lock:
+            for bucket in self._cells_in_box(min_lat, min_lng, max_lat, max_lng):
+                for tourist_id, (_, p_lat, p_lng, ts) in bucket.items():
+                    if since is not None and ts < since:
+                        continue
+                    if min_lat <= p_lat <= max_lat and min_lng <= p_lng <= max_lng:
+                        found.append((None, tourist_id, p_lat, p_lng, ts))
+        return found
+
+    def nearest(self, lat, lng, k, max_radius_m=50000, since=None):
+        """k nearest positions, searching outward ring by ring of cells"""
+        center = cell_of(lat, lng)
+        cell_m = CELL_DEGREES * METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6)
+        max_ring = int(max_radius_m / cell_m) + 1
+        best = []  # max-heap via negated distance
+        with self._lock:
+            for ring in range(max_ring + 1):
+                # Every point beyond this ring is at least (ring - 1) cells away
+                if len(best) == k and -best[0][0] < (ring - 1) * cell_m:
+                    break
+                for cell in ring_cells(center, ring):
+                    for tourist_id, (_, p_lat, p_lng, ts) in self._cells.get(cell, {}).items():
+                        if since is not None and ts < since:
+                            continue
+                        distance = haversine_m(lat, lng, p_lat, p_lng)
+                        if distance > max_radius_m:
+                            continue
+                        item = (-distance, tourist_id, p_lat, p_lng, ts)
+                        if len(best) < k:
+                            heapq.heappush(best, item)
+                        elif distance < -best[0][0]:
+                            heapq.heapreplace(best, item)
+        return sorted((-d, tourist_id, p_lat, p_lng, ts) for d, tourist_id, p_lat, p_lng, ts in best)
+
+
+position_grid = LivePositionGrid()
@@ -0,0 +1,149 @@
+"""
+Tourist QR codes
+Codes are rendered off the request path in a process pool and stored under
+instance/qr/ named by a hash of their content, so an unchanged tourist is
+never rendered twice and the hash doubles as the HTTP ETag
+"""
+
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import qrcode
+
+FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+RENDER_VERSION = 1  # Bump when the rendering below changes so old files are not reused
+
+
+def qr_payload(tourist):
+    return f"Tourist ID: {tourist.tourist_id}\nName: {tourist.name}\nPhone: {tourist.phone}"
+
+
+def content_key(payload, fmt):
+    return hashlib.sha256(f"{RENDER_VERSION}:{fmt}:{payload}".encode()).hexdigest()[:32]
+
+
+def _matrix(payload):
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    return qr
+
+
+def render_png(payload):
+    img = _matrix(payload).make_image(fill_color="black", back_color="white")
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def render_svg(payload):
+    """One <path> with a subpath per run of dark modules; needs no Pillow"""
+    matrix = _matrix(payload).get_matrix()  # Includes the border
+    size = len(matrix)
+    parts = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            parts.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+            f'shape-rendering="crispEdges"><rect width="{size}" height="{size}" fill="#fff"/>'
+            f'<path d="{"".join(parts)}"/></svg>').encode()
+
+
+def render_to_file(payload, fmt, path):
+    """Pool task: render and write atomically so readers never see a partial file"""
+    data = render_png(payload) if fmt == 'png' else render_svg(payload)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return path
+
+
+class QRStore:
+    """Content-addressed QR files plus a process pool for rendering them"""
+
+    def __init__(self):
+        self.directory = None
+        self.workers = 2
+        self.wait_seconds = 10.0
+        self._pool = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.directory = os.path.join(app.instance_path, 'qr')
+        self.workers = app.config.get('QR_WORKERS', self.workers)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, key, fmt):
+        return os.path.join(self.directory, f"{key}.{fmt}")
+
+    def submit(self, payload, fmt='png'):
+        """Start rendering in the background unless the file exists; returns the content key"""
+        key = content_key(payload, fmt)
+        path = self.path(key, fmt)
+        if os.path.exists(path):
+            return key
+        with self._lock:
+            if key in self._pending:
+                return key
+            try:
+                if self.workers <= 0:
+                    raise RuntimeError('QR process pool disabled')
+                if self._pool is None:
+                    # spawn rather than fork: the server process has threads and open DB connections
+                    self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                future = self._pool.submit(render_to_file, payload, fmt, path)
+            except RuntimeError as e:
+                # No usable pool (disabled, broken or shutting down): render here instead
+                if self.workers > 0:
+                    print(f"QR pool unavailable, rendering inline: {e}")
+                    self._pool = None
+                try:
+                    render_to_file(payload, fmt, path)
+                except Exception as e:
+                    # The caller has committed what the code is for; load() renders it on first request
+                    print(f"⚠️ QR render failed, deferring to first request: {e}")
+                return key
+            self._pending[key] = future
+        future.add_done_callback(lambda f: self._pending.pop(key, None))
+        return key
+
+    def load(self, payload, fmt='png'):
+        """(key, bytes) for a payload, rendering (or waiting for the pool) if needed"""
+        key = content_key(payload, fmt)
+        path = self.path(key, fmt)
+        if not os.path.exists(path):
+            if fmt == 'svg':
+                render_to_file(payload, fmt, path)  # Cheap enough to do inline
+            else:
+                self.submit(payload, fmt)
+                future = self._pending.get(key)
+                if future is not None:
+                    try:
+                        future.result(timeout=self.wait_seconds)
+                    except RuntimeError as e:  # Pool broke under this job
+                        print(f"QR pool render failed, rendering inline: {e}")
+                if not os.path.exists(path):
+                    # The pool broke, or submit() failed to render inline
+                    render_to_file(payload, fmt, path)
+        with open(path, 'rb') as f:
+            return key, f.read()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+qr_store = QRStore()
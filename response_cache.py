@@ -0,0 +1,154 @@
+"""
+Response cache for police read APIs
+Rendered JSON bodies are cached per URL under a namespace (tourists, alerts,
+incidents, locations). Writes bump the namespace version, dropping its
+entries. Every cached response carries a strong ETag, so a matching
+If-None-Match is answered with 304 straight from the cache
+
+A bump only reaches this process. Namespaces registered with track() also
+check a version shared by every process (a change_counter value, see
+changes.py), so writes from other workers, the ingest server, the AI engine
+or bulk_import.py show up within `shared_interval` seconds rather than after
+the TTL. The shared version is read at most once per interval per namespace;
+lookups in between, 304s included, do not touch the database
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, make_response, request
+
+
+class ResponseCache:
+    """LRU + TTL cache of (namespace, url) -> rendered response"""
+
+    def __init__(self, max_size=512, ttl=30.0, shared_interval=0.25):
+        self.enabled = True
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared_interval = shared_interval
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._shared = {}  # namespace -> callable returning the cross-process version
+        self._shared_seen = {}  # namespace -> (monotonic time read, value)
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'not_modified': 0, 'invalidations': 0}
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RESPONSE_CACHE_ENABLED', True)
+        self.max_size = app.config.get('RESPONSE_CACHE_SIZE', self.max_size)
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', self.ttl)
+        self.shared_interval = app.config.get('RESPONSE_CACHE_SHARED_INTERVAL', self.shared_interval)
+
+    def bump(self, *namespaces):
+        """Invalidate every cached response in the given namespaces"""
+        with self._lock:
+            for namespace in namespaces:
+                self._versions[namespace] = self._versions.get(namespace, 0) + 1
+                self._counters['invalidations'] += 1
+                for key in [key for key in self._entries if key[0] == namespace]:
+                    del self._entries[key]
+
+    def track(self, namespace, shared_version):
+        """Also invalidate `namespace` whenever shared_version() changes"""
+        self._shared[namespace] = shared_version
+
+    def shared_version(self, namespace):
+        """The namespace's cross-process version, read again only once it is shared_interval old"""
+        if namespace not in self._shared:
+            return None
+        now = time.monotonic()
+        seen = self._shared_seen.get(namespace)
+        if seen is not None and now - seen[0] < self.shared_interval:
+            return seen[1]
+        value = self._shared[namespace]()
+        self._shared_seen[namespace] = (now, value)
+        return value
+
+    def version(self, namespace):
+        return self._versions.get(namespace, 0)
+
+    def cached(self, namespace):
+        """View decorator; only plain 200 responses are stored"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+                key = (namespace, request.full_path)
+                # Read before the view runs, so a write racing it leaves the entry stale, not wrong
+                shared = self.shared_version(namespace)
+                entry = self._lookup(key, shared)
+                if entry is not None:
+                    return self._respond(entry)
+
+                with self._lock:
+                    version = self.version(namespace)
+                    self._counters['misses'] += 1
+                # Views may return (body, headers) tuples
+                response = make_response(view(*args, **kwargs))
+                if isinstance(response, Response) and response.status_code == 200 and not response.is_streamed:
+                    body = response.get_data()
+                    etag = hashlib.sha1(body).hexdigest()[:20]
+                    headers = [(name, value) for name, value in response.headers
+                               if name.startswith('X-')]
+                    entry = (time.monotonic(), body, etag, response.mimetype, headers, shared)
+                    self._store(key, version, entry)
+                    response.set_etag(etag)
+                    response.headers['Cache-Control'] = 'private, no-cache'
+                    return response.make_conditional(request)
+                return response
+            return wrapper
+        return decorator
+
+    def _lookup(self, key, shared=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] >= self.ttl or entry[5] != shared:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self._counters['hits'] += 1
+            return entry
+
+    def _store(self, key, version, entry):
+        with self._lock:
+            # Skip if a write bumped the namespace while the view was running
+            if self.version(key[0]) != version:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _respond(self, entry):
+        _, body, etag, mimetype, headers, _ = entry
+        response = Response(body, mimetype=mimetype, headers=headers)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            with self._lock:
+                self._counters['not_modified'] += 1
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+            stats['versions'] = dict(self._versions)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else None
+        return stats
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Location retention: hot window, per-minute history and archive segments
+- Fixes newer than LOCATION_HOT_HOURS stay in `location` at full resolution
+- Older fixes are appended to gzip NDJSON segments (one per day) under
+  instance/archive/, folded into per-minute means in `location_history`
+  and deleted from `location`
+- Each chunk is written as one gzip member per bucket of tourists
+  (crc32(tourist_id) % LOCATION_ARCHIVE_BUCKETS), and a `.idx` file next to
+  the segment records where each bucket's members are, so reading one
+  tourist's fixes decompresses about 1/LOCATION_ARCHIVE_BUCKETS of the segment
+- History buckets older than LOCATION_HISTORY_DAYS are deleted; the archive
+  still has every original fix
+
+Work is done in chunks, each in its own short transaction, so writers are
+never blocked for long
+
+Usage: python retention.py run
+       python retention.py query TOURIST_ID [--from ISO_TIME] [--to ISO_TIME]
+"""
+
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+import storage
+from sharding import shard_of
+from models import Location, LocationHistory
+
+HOT_WINDOW = timedelta(hours=float(os.environ.get('LOCATION_HOT_HOURS', 48)))
+HISTORY_RETENTION = timedelta(days=float(os.environ.get('LOCATION_HISTORY_DAYS', 90)))
+ARCHIVE_DIR = os.environ.get('LOCATION_ARCHIVE_DIR', os.path.join(storage.INSTANCE_DIR, 'archive'))
+ARCHIVE_BUCKETS = int(os.environ.get('LOCATION_ARCHIVE_BUCKETS', 64))
+CHUNK_SIZE = 5000
+CHUNK_PAUSE = 0.05  # Seconds between chunks, so queued writers get the lock
+
+location = Location.__table__
+history = LocationHistory.__table__
+
+
+def segment_path(directory, day):
+    return os.path.join(directory, f"location-{day.isoformat()}.ndjson.gz")
+
+
+def index_path(segment):
+    return segment[:-len('.ndjson.gz')] + '.idx'
+
+
+def archive_rows(directory, rows, buckets=ARCHIVE_BUCKETS):
+    """Append fixes to their day's segment; gzip members concatenate into one readable stream
+
+    The segment is synced before its index lines are appended, so the index
+    never points past the data
+    """
+    os.makedirs(directory, exist_ok=True)
+    by_day = {}
+    for row in rows:
+        bucket = shard_of(row.tourist_id, buckets)
+        by_day.setdefault(row.timestamp.date(), {}).setdefault(bucket, []).append(row)
+    for day, by_bucket in by_day.items():
+        path = segment_path(directory, day)
+        entries = []
+        with open(path, 'ab') as f:
+            for bucket, bucket_rows in sorted(by_bucket.items()):
+                lines = ''.join(json.dumps({
+                    'id': row.id,
+                    'tourist_id': row.tourist_id,
+                    'latitude': row.latitude,
+                    'longitude': row.longitude,
+                    'timestamp': row.timestamp.isoformat()
+                }) + '\n' for row in bucket_rows)
+                member = gzip.compress(lines.encode())
+                # The bucket count is recorded so a changed LOCATION_ARCHIVE_BUCKETS still reads old members
+                entries.append([bucket, buckets, f.tell(), len(member)])
+                f.write(member)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(index_path(path), 'a') as f:
+            f.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def minute_buckets(rows):
+    """[{tourist_id, bucket, latitude, longitude, samples}] with the mean position per tourist-minute"""
+    sums = {}
+    for row in rows:
+        key = (row.tourist_id, row.timestamp.replace(second=0, microsecond=0))
+        total = sums.setdefault(key, [0.0, 0.0, 0])
+        total[0] += row.latitude
+        total[1] += row.longitude
+        total[2] += 1
+    return [{
+        'tourist_id': tourist_id,
+        'bucket': bucket,
+        'latitude': lat / n,
+        'longitude': lng / n,
+        'samples': n
+    } for (tourist_id, bucket), (lat, lng, n) in sums.items()]
+
+
+def merge_buckets(conn, buckets):
+    """Upsert buckets; a bucket split across chunks keeps a sample-weighted mean"""
+    dialect = conn.dialect.name
+    insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+    stmt = insert(history).values(buckets)
+    total = history.c.samples + stmt.excluded.samples
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[history.c.tourist_id, history.c.bucket],
+        set_={
+            'latitude': (history.c.latitude * history.c.samples + stmt.excluded.latitude * stmt.excluded.samples) / total,
+            'longitude': (history.c.longitude * history.c.samples + stmt.excluded.longitude * stmt.excluded.samples) / total,
+            'samples': total
+        }
+    )
+    conn.execute(stmt)
+
+
+class RetentionJob:
+    def __init__(self, engine=None, hot_window=HOT_WINDOW, history_retention=HISTORY_RETENTION,
+                 archive_dir=ARCHIVE_DIR, chunk_size=CHUNK_SIZE):
+        self.engine = engine or storage.get_engine()
+        self.hot_window = hot_window
+        self.history_retention = history_retention
+        self.archive_dir = archive_dir
+        self.chunk_size = chunk_size
+
+    def compact_locations(self, now=None):
+        """Archive, downsample and delete fixes older than the hot window; returns rows moved"""
+        cutoff = (now or datetime.utcnow()) - self.hot_window
+        moved = 0
+        while True:
+            with self.engine.begin() as conn:
+                rows = conn.execute(
+                    select(location.c.id, location.c.tourist_id, location.c.latitude,
+                           location.c.longitude, location.c.timestamp)
+                    .where(location.c.timestamp < cutoff)
+                    # Keep the highest id: SQLite hands out max(id) + 1, and ids must never be
+                    # reused because the AI engine and track store read by id high-water mark
+                    .where(location.c.id < select(func.max(location.c.id)).scalar_subquery())
+                    .order_by(location.c.timestamp, location.c.id)
+                    .limit(self.chunk_size)
+                ).all()
+                if not rows:
+                    return moved
+                # The segment is written before the delete commits; readers skip repeated ids
+                archive_rows(self.archive_dir, rows)
+                merge_buckets(conn, minute_buckets(rows))
+                conn.execute(delete(location).where(location.c.id.in_([row.id for row in rows])))
+            moved += len(rows)
+            time.sleep(CHUNK_PAUSE)
+
+    def purge_history(self, now=None):
+        """Delete per-minute buckets past history retention; returns rows deleted"""
+        cutoff = (now or datetime.utcnow()) - self.history_retention
+        deleted = 0
+        while True:
+            with self.engine.begin() as conn:
+                ids = conn.execute(
+                    select(history.c.id).where(history.c.bucket < cutoff).limit(self.chunk_size)
+                ).scalars().all()
+                if not ids:
+                    return deleted
+                conn.execute(delete(history).where(history.c.id.in_(ids)))
+            deleted += len(ids)
+            time.sleep(CHUNK_PAUSE)
+
+    def run(self):
+        started = time.monotonic()
+        moved = self.compact_locations()
+        purged = self.purge_history()
+        if moved or purged:
+            print(f"🗄️ Retention: archived {moved} fixes, purged {purged} history buckets "
+                  f"in {time.monotonic() - started:.1f}s")
+        return moved, purged
+
+    def start(self, interval):
+        """Run every `interval` seconds in a daemon thread"""
+        def loop():
+            while True:
+                try:
+                    self.run()
+                except Exception as e:
+                    print(f"❌ Retention job error: {e}")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=loop, name='location-retention', daemon=True)
+        thread.start()
+        return thread
+
+
+def tourist_members(path, tourist_id):
+    """(offset, length) ranges of a segment that can hold the tourist's fixes
+
+    Data no index line covers (written before the index existed, or an index
+    append cut short) is always included
+    """
+    indexed = []
+    try:
+        with open(index_path(path)) as f:
+            for line in f:
+                try:
+                    indexed.append(json.loads(line))
+                except ValueError:
+                    break  # Partly written last line
+    except FileNotFoundError:
+        pass
+    members = []
+    position = 0
+    for bucket, buckets, offset, length in sorted(indexed, key=lambda entry: entry[2]):
+        if offset > position:
+            members.append((position, offset - position))
+        if shard_of(tourist_id, buckets) == bucket:
+            members.append((offset, length))
+        position = max(position, offset + length)
+    size = os.path.getsize(path)
+    if size > position:
+        members.append((position, size - position))
+    return members
+
+
+def segment_lines(path, tourist_id=None):
+    """NDJSON lines of a segment, only the tourist's members when one is given"""
+    if tourist_id is None:
+        with gzip.open(path, 'rt') as f:
+            yield from f
+        return
+    with open(path, 'rb') as f:
+        for offset, length in tourist_members(path, tourist_id):
+            f.seek(offset)
+            yield from gzip.decompress(f.read(length)).decode().splitlines()
+
+
+def read_archive(directory=ARCHIVE_DIR, tourist_id=None, since=None, until=None):
+    """Yield archived fixes (dicts, timestamps as datetimes) in [since, until), oldest segment first"""
+    if not os.path.isdir(directory):
+        return
+    seen = set()
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith('location-') and name.endswith('.ndjson.gz')):
+            continue
+        day = datetime.strptime(name[len('location-'):-len('.ndjson.gz')], '%Y-%m-%d')
+        if (since and day + timedelta(days=1) <= since) or (until and day >= until):
+            continue
+        for line in segment_lines(os.path.join(directory, name), tourist_id):
+            fix = json.loads(line)
+            if tourist_id and fix['tourist_id'] != tourist_id:
+                continue
+            fix['timestamp'] = datetime.fromisoformat(fix['timestamp'])
+            if (since and fix['timestamp'] < since) or (until and fix['timestamp'] >= until):
+                continue
+            if fix['id'] in seen:
+                continue
+            seen.add(fix['id'])
+            yield fix
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    args = sys.argv[2:]
+    if command == 'run':
+        RetentionJob().run()
+    elif command == 'query' and args:
+        since = datetime.fromisoformat(args[args.index('--from') + 1]) if '--from' in args else None
+        until = datetime.fromisoformat(args[args.index('--to') + 1]) if '--to' in args else None
+        for fix in read_archive(tourist_id=args[0], since=since, until=until):
+            fix['timestamp'] = fix['timestamp'].isoformat()
+            print(json.dumps(fix))
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,34 @@
+"""
+Hash sharding of tourists for parallel detection
+A tourist belongs to shard crc32(tourist_id) % shards. SQLite connections
+get a crc32() SQL function so each shard worker filters in the query; on
+PostgreSQL the built-in hashtext() is used instead, which partitions tourists
+just as evenly (only the query side decides shard membership).
+"""
+
+import sqlite3
+import zlib
+
+import sqlalchemy
+from sqlalchemy import event
+
+
+def crc32(value):
+    return None if value is None else zlib.crc32(value.encode())
+
+
+def shard_of(tourist_id, shards):
+    return crc32(tourist_id) % shards
+
+
+@event.listens_for(sqlalchemy.engine.Engine, 'connect')
+def register_crc32(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function('crc32', 1, crc32, deterministic=True)
+
+
+def shard_condition(conn, column='tourist_id'):
+    """SQL condition selecting the rows of shard :shard out of :shards"""
+    if conn.dialect.name == 'postgresql':
+        return f"((hashtext({column}) % :shards) + :shards) % :shards = :shard"
+    return f"crc32({column}) % :shards = :shard"
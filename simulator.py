@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Walking-tourist traffic simulator
+Each simulated tourist walks a smooth random path (walking pace, gentle
+turns, stops to look around), reports a fix every --update-interval simulated
+seconds, polls its alerts every --poll-interval and presses panic at
+--panic-per-hour. Requests go to the Flask test client (on a throwaway
+synthetic database) or to a local server, so everything runs offline.
+
+Simulated time runs --speedup times faster than the wall clock (0, the
+default, sends as fast as the target answers). Unless it runs in real time,
+fixes carry their simulated timestamps, ending at the present, so the AI
+engine sees walking speeds rather than the compressed ones.
+
+Usage: python simulator.py [--tourists 1000] [--minutes 10] [--seed 42]
+                           [--url http://127.0.0.1:5000] [--concurrency 16] [--speedup 0]
+                           [--output results.json]
+       (with --url, load the server's database with synthetic.py first so the tourists exist)
+"""
+
+import heapq
+import http.client
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from synthetic import DESTINATIONS, EARTH_M_PER_DEGREE, tourist_id
+
+
+def latency_stats(latencies, seconds=None):
+    """Summary of a list of latencies in seconds; ops/s over `seconds` (default: their sum)"""
+    if not latencies:
+        return {'n': 0}
+    values = np.sort(np.asarray(latencies)) * 1000
+    return {
+        'n': len(values),
+        'mean_ms': round(float(values.mean()), 3),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p95_ms': round(float(np.percentile(values, 95)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+        'max_ms': round(float(values[-1]), 3),
+        'ops_per_s': round(len(values) / (seconds or values.sum() / 1000), 1),
+    }
+
+
+class Walker:
+    """One tourist's position along a seeded random walk"""
+
+    def __init__(self, tourist_id, rng):
+        self.tourist_id = tourist_id
+        self.rng = rng
+        latitude, longitude = DESTINATIONS[rng.integers(len(DESTINATIONS))]
+        self.latitude = latitude + rng.normal(0, 0.03)
+        self.longitude = longitude + rng.normal(0, 0.03)
+        self.heading = rng.uniform(0, 2 * math.pi)
+        self.speed = rng.uniform(0.8, 1.6)  # m/s
+
+    def advance(self, seconds):
+        if self.rng.random() < 0.2:
+            return  # Stopped to look around
+        self.heading += self.rng.normal(0, 0.3)
+        meters = self.speed * seconds
+        self.latitude += meters * math.cos(self.heading) / EARTH_M_PER_DEGREE
+        self.longitude += meters * math.sin(self.heading) / (EARTH_M_PER_DEGREE * math.cos(math.radians(self.latitude)))
+
+
+class TestClientTarget:
+    """Requests through the Flask test client (in-process, single-threaded)"""
+
+    concurrency = 1
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None):
+        return self.client.open(path, method=method, json=body).status_code
+
+
+class HttpTarget:
+    """Requests to a running server over keep-alive connections, one per thread"""
+
+    def __init__(self, url, concurrency=16):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.concurrency = concurrency
+        self._local = threading.local()
+
+    def request(self, method, path, body=None):
+        payload = None if body is None else json.dumps(body)
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        for _ in range(2):
+            connection = getattr(self._local, 'connection', None)
+            if connection is None:
+                connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                connection.request(method, path, payload, headers)
+                response = connection.getresponse()
+                response.read()
+                return response.status
+            except (OSError, http.client.HTTPException):
+                # The server may close idle keep-alive connections; reconnect once
+                connection.close()
+                self._local.connection = None
+        return 'error'
+
+
+class Simulation:
+    def __init__(self, target, tourist_ids, seed=42, update_interval=30, poll_interval=60, panic_per_hour=0.01):
+        self.target = target
+        self.update_interval = update_interval
+        self.poll_interval = poll_interval
+        self.panic_chance = panic_per_hour * update_interval / 3600
+        self.rng = np.random.default_rng(seed)
+        self.walkers = [Walker(t, np.random.default_rng([seed, i])) for i, t in enumerate(tourist_ids)]
+        self.latencies = {'update_location': [], 'user_alerts': [], 'panic_alert': []}
+        self.statuses = {name: Counter() for name in self.latencies}
+        self._lock = threading.Lock()
+
+    def schedule(self, seconds):
+        """(simulated second, kind, walker) events for a run of `seconds`, in order"""
+        intervals = {'update_location': self.update_interval, 'user_alerts': self.poll_interval}
+        # Staggered so the tourists do not all report on the same tick
+        events = [(self.rng.uniform(0, interval), kind, index)
+                  for index in range(len(self.walkers)) for kind, interval in intervals.items()]
+        heapq.heapify(events)
+        while events and events[0][0] < seconds:
+            due, kind, index = events[0]
+            yield due, kind, index
+            heapq.heapreplace(events, (due + intervals[kind], kind, index))
+
+    def request_for(self, kind, walker, timestamp):
+        """(method, path, body) of one event, built before the walker moves on"""
+        if kind == 'update_location':
+            body = {'tourist_id': walker.tourist_id, 'latitude': walker.latitude, 'longitude': walker.longitude}
+            if timestamp is not None:
+                body['timestamp'] = timestamp.isoformat()
+            method, path = 'POST', '/update_location'
+        elif kind == 'panic_alert':
+            body = {'tourist_id': walker.tourist_id, 'latitude': walker.latitude, 'longitude': walker.longitude}
+            method, path = 'POST', '/panic_alert'
+        else:
+            body = None
+            method, path = 'GET', f'/api/user_alerts/{walker.tourist_id}'
+        return method, path, body
+
+    def send(self, kind, method, path, body):
+        started = time.perf_counter()
+        status = self.target.request(method, path, body)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies[kind].append(elapsed)
+            self.statuses[kind][status] += 1
+
+    def run(self, seconds, speedup=0):
+        """Play `seconds` of simulated traffic; returns the wall-clock duration"""
+        realtime = speedup == 1
+        origin = datetime.utcnow() - (timedelta(0) if realtime else timedelta(seconds=seconds))
+        pool = ThreadPoolExecutor(self.target.concurrency) if self.target.concurrency > 1 else None
+        in_flight = threading.BoundedSemaphore(self.target.concurrency * 4)
+        started = time.perf_counter()
+
+        def dispatch(kind, walker, timestamp):
+            request = self.request_for(kind, walker, timestamp)
+            if pool is None:
+                self.send(kind, *request)
+                return
+            in_flight.acquire()
+            future = pool.submit(self.send, kind, *request)
+            future.add_done_callback(lambda _: in_flight.release())
+
+        for due, kind, index in self.schedule(seconds):
+            if speedup > 0:
+                delay = started + due / speedup - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            walker = self.walkers[index]
+            timestamp = None if realtime else origin + timedelta(seconds=due)
+            if kind == 'update_location':
+                walker.advance(self.update_interval)
+                if self.rng.random() < self.panic_chance:
+                    dispatch('panic_alert', walker, timestamp)
+            dispatch(kind, walker, timestamp)
+        if pool is not None:
+            pool.shutdown(wait=True)
+        return time.perf_counter() - started
+
+    def summary(self, wall_seconds):
+        return {kind: dict(latency_stats(latencies, wall_seconds),
+                           statuses={str(status): n for status, n in self.statuses[kind].items()})
+                for kind, latencies in self.latencies.items()}
+
+
+def main():
+    args = sys.argv[1:]
+
+    def option(name, default, cast=int):
+        return cast(args[args.index(name) + 1]) if name in args else default
+
+    tourists = option('--tourists', 1000)
+    minutes = option('--minutes', 10, float)
+    seed = option('--seed', 42)
+    speedup = option('--speedup', 0, float)
+
+    if '--url' in args:
+        target = HttpTarget(option('--url', None, str), option('--concurrency', 16))
+    else:
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tempfile.mkdtemp(), "simulation.db")}'
+        os.environ.setdefault('QR_WORKERS', '0')
+        from app import app
+        from models import db
+        from synthetic import generate
+        with app.app_context():
+            generate(db.engine, tourists, seed=seed)
+        target = TestClientTarget(app)
+
+    simulation = Simulation(target, [tourist_id(i) for i in range(tourists)], seed=seed,
+                            update_interval=option('--update-interval', 30, float),
+                            poll_interval=option('--poll-interval', 60, float),
+                            panic_per_hour=option('--panic-per-hour', 0.01, float))
+    wall_seconds = simulation.run(minutes * 60, speedup)
+    summary = simulation.summary(wall_seconds)
+
+    print(f'{tourists} tourists, {minutes:g} simulated minutes in {wall_seconds:.1f}s')
+    print(f'{"endpoint":16} {"requests":>9} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8}  statuses')
+    for kind, stats in summary.items():
+        if stats['n']:
+            print(f'{kind:16} {stats["n"]:9} {stats["ops_per_s"]:8.0f} {stats["p50_ms"]:8.2f} '
+                  f'{stats["p99_ms"]:8.2f}  {stats["statuses"]}')
+    if '--output' in args:
+        with open(option('--output', None, str), 'w') as f:
+            json.dump({'tourists': tourists, 'minutes': minutes, 'seed': seed, 'wall_seconds': wall_seconds,
+                       'results': summary}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+// Delta sync against the APIs that accept ?since=<change cursor>.
+// Calls onChange for every row changed after `cursor` and returns the cursor
+// to poll with next, or null when the client should reload everything.
+async function fetchChanges(url, cursor, onChange) {
+    let more;
+    do {
+        const separator = url.includes('?') ? '&' : '?';
+        const response = await fetch(`${url}${separator}since=${encodeURIComponent(cursor)}`);
+        if (!response.ok) {
+            return null;
+        }
+        (await response.json()).forEach(onChange);
+        cursor = response.headers.get('X-Change-Cursor');
+        more = response.headers.get('X-More-Changes');
+    } while (more);
+    return cursor;
+}
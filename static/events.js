@@ -0,0 +1,60 @@
+// Subscribe to server-pushed alert events.
+// Uses Server-Sent Events when available and falls back to long-polling.
+// When the server turns a stream or poll away (503 once its stream cap is
+// reached, or any other error), onEvent('poll', {}) is called on a timer so
+// the page keeps loading what changed until a long poll gets through again.
+const EVENT_RETRY_MS = 10000;
+
+function subscribeEvents(streamUrl, pollUrl, onEvent) {
+    let lastEventId = null;
+
+    const retryDelay = (response) => {
+        const seconds = parseFloat(response && response.headers.get('Retry-After'));
+        return seconds > 0 ? Math.max(seconds * 1000, EVENT_RETRY_MS) : EVENT_RETRY_MS;
+    };
+
+    const poll = async () => {
+        let response = null;
+        try {
+            const query = lastEventId ? `?last_event_id=${encodeURIComponent(lastEventId)}` : '';
+            response = await fetch(pollUrl + query);
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            const data = await response.json();
+            if (data.resync) {
+                onEvent('resync', {});
+            }
+            data.events.forEach(e => onEvent(e.event, e.data));
+            lastEventId = data.last_event_id;
+            poll();
+        } catch (error) {
+            console.error('Event poll failed:', error);
+            // Nothing is pushed meanwhile: load changes now and keep trying
+            onEvent('poll', {});
+            setTimeout(poll, retryDelay(response));
+        }
+    };
+
+    if (window.EventSource) {
+        const source = new EventSource(streamUrl);
+        ['alert', 'resolved', 'resync'].forEach(name => {
+            source.addEventListener(name, (e) => {
+                lastEventId = e.lastEventId || lastEventId;
+                onEvent(name, JSON.parse(e.data));
+            });
+        });
+        // EventSource reconnects by itself after a dropped connection, but gives up
+        // for good on a non-200 response (such as 503 when the server is at its cap)
+        source.onerror = () => {
+            if (source.readyState === EventSource.CLOSED) {
+                source.close();
+                onEvent('poll', {});
+                setTimeout(poll, EVENT_RETRY_MS);
+            }
+        };
+        return;
+    }
+
+    poll();
+}
@@ -0,0 +1,85 @@
+"""
+Shared storage configuration for the web app, the AI engine and scripts
+Resolves one database URL for every process and tunes the engine for the
+backend: WAL journaling and a busy timeout for SQLite, a sized connection
+pool for PostgreSQL
+"""
+
+import os
+import sqlite3
+
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+INSTANCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+DEFAULT_DATABASE_URL = 'sqlite:///tourist.db'
+
+SQLITE_PRAGMAS = os.environ.get('SQLITE_PRAGMAS', '1') != '0'
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 1000))
+
+
+def database_url():
+    """DATABASE_URL, or the SQLite file in instance/; relative SQLite paths resolve under instance/"""
+    url = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+    if url.startswith('postgres://'):
+        # Heroku-style URLs; SQLAlchemy only accepts postgresql://
+        url = 'postgresql://' + url[len('postgres://'):]
+    parsed = make_url(url)
+    if parsed.get_backend_name() == 'sqlite' and parsed.database and parsed.database != ':memory:' \
+            and not os.path.isabs(parsed.database):
+        os.makedirs(INSTANCE_DIR, exist_ok=True)
+        url = parsed.set(database=os.path.join(INSTANCE_DIR, parsed.database)).render_as_string(hide_password=False)
+    return url
+
+
+def engine_options(url):
+    """create_engine keyword arguments for the backend (also used as SQLALCHEMY_ENGINE_OPTIONS)"""
+    options = {'query_cache_size': DB_STATEMENT_CACHE_SIZE}
+    backend = make_url(url).get_backend_name()
+    if backend == 'sqlite':
+        options['connect_args'] = {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000.0}
+    elif backend == 'postgresql':
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=30,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+    return options
+
+
+@event.listens_for(sqlalchemy.engine.Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL lets readers run alongside the single writer; NORMAL sync is safe with WAL"""
+    if not SQLITE_PRAGMAS or not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.close()
+
+
+def configure_app(app):
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+
+
+_engine = None
+
+
+def get_engine():
+    """Process-wide engine for code running outside the Flask app (AI engine, scripts)"""
+    global _engine
+    if _engine is None:
+        url = database_url()
+        _engine = sqlalchemy.create_engine(url, **engine_options(url))
+    return _engine
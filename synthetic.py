@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Seeded synthetic dataset for benchmarks and load tests
+Tourists walk from points around popular destinations with a fix every
+FIX_INTERVAL seconds; a share of them has gone quiet (inactivity), rides far
+off their route (deviation) or moves implausibly fast (speed anomaly), so
+every detector has work to do. Some tourists have an alert on record and
+about half travel in groups. The same seed and size always give the same rows.
+
+Usage: python synthetic.py --tourists N [--db PATH] [--seed 42]
+       (DATABASE_URL is used when --db is not given)
+"""
+
+import math
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import text
+
+CHUNK = 100000
+FIX_INTERVAL = 600
+EARTH_M_PER_DEGREE = 111320.0
+
+# (latitude, longitude) of the places synthetic tourists start around
+DESTINATIONS = [
+    (28.6139, 77.2090),  # Delhi
+    (27.1751, 78.0421),  # Agra
+    (26.9124, 75.7873),  # Jaipur
+    (15.2993, 74.1240),  # Goa
+    (19.0760, 72.8777),  # Mumbai
+    (25.3176, 82.9739),  # Varanasi
+    (9.9312, 76.2673),   # Kochi
+    (24.5854, 73.7125),  # Udaipur
+]
+ALERT_TYPES = ['panic', 'inactivity', 'deviation', 'speed_anomaly', 'geo_fence_breach']
+
+
+def tourist_id(i):
+    return f'SYN{i:08d}'
+
+
+def insert_rows(conn, table, columns, rows):
+    quote = conn.dialect.identifier_preparer.quote
+    marker = '?' if conn.dialect.paramstyle == 'qmark' else '%s'
+    conn.exec_driver_sql(
+        f"INSERT INTO {quote(table)} ({', '.join(columns)}) VALUES ({', '.join([marker] * len(columns))})", rows)
+
+
+def walk(rng, n, fixes, interval, inactive_share, deviation_share, speeding_share):
+    """Latitude/longitude paths (n x fixes) and seconds before now of each fix"""
+    origin = np.array(DESTINATIONS)[rng.integers(len(DESTINATIONS), size=n)]
+    lat0 = origin[:, 0] + rng.normal(0, 0.03, n)  # ~3 km around the destination
+    lng0 = origin[:, 1] + rng.normal(0, 0.03, n)
+
+    speed = rng.uniform(0.8, 1.6, n)  # Walking, m/s
+    drift = np.full(n, 0.35)  # Heading change per fix, radians
+    kind = rng.random(n)
+    deviating = kind < deviation_share
+    speeding = (kind >= deviation_share) & (kind < deviation_share + speeding_share)
+    speed[deviating] = 8.0  # A taxi ride well off the route
+    speed[speeding] = 60.0  # 216 km/h
+    drift[deviating | speeding] = 0.0
+
+    steps = max(fixes - 1, 0)
+    heading = rng.uniform(0, 2 * math.pi, n)[:, None] + np.cumsum(rng.normal(0, 1, (n, steps)) * drift[:, None], axis=1)
+    moving = rng.random((n, steps)) > 0.2  # Stops to look around
+    moving[deviating | speeding] = True
+    meters = speed[:, None] * interval * moving
+    dlat = meters * np.cos(heading) / EARTH_M_PER_DEGREE
+    dlng = meters * np.sin(heading) / (EARTH_M_PER_DEGREE * np.cos(np.radians(lat0)))[:, None]
+    lat = np.concatenate((lat0[:, None], lat0[:, None] + np.cumsum(dlat, axis=1)), axis=1)
+    lng = np.concatenate((lng0[:, None], lng0[:, None] + np.cumsum(dlng, axis=1)), axis=1)
+
+    last = np.where(rng.random(n) < inactive_share, rng.uniform(1200, 3000, n), rng.uniform(0, 600, n))
+    offsets = last[:, None] + interval * np.arange(steps, -1, -1)[None, :]
+    return lat, lng, offsets
+
+
+def generate(engine, tourists, seed=42, now=None, fixes=3, interval=FIX_INTERVAL, inactive_share=0.05,
+             deviation_share=0.01, speeding_share=0.005, alert_share=0.02, group_share=0.5, group_size=4):
+    """Insert a reproducible dataset of `tourists` tourists; returns row counts per table"""
+    from ai_engine import TIMESTAMP_FORMAT
+    from models import db
+
+    db.metadata.create_all(engine)
+    now = now or datetime.utcnow()
+    counts = dict.fromkeys(['tourist', 'location', 'latest_location', 'alert', 'group', 'group_member'], 0)
+    created = now.strftime(TIMESTAMP_FORMAT)
+    group_number = 0
+    started = time.perf_counter()
+
+    for chunk, start in enumerate(range(0, tourists, CHUNK)):
+        # One generator per chunk: the same seed gives the same rows whatever else has run
+        rng = np.random.default_rng([seed, chunk])
+        n = min(CHUNK, tourists - start)
+        ids = [tourist_id(i) for i in range(start, start + n)]
+        lat, lng, offsets = walk(rng, n, fixes, interval, inactive_share, deviation_share, speeding_share)
+        times = [[(now - timedelta(seconds=float(s))).strftime(TIMESTAMP_FORMAT) for s in row] for row in offsets]
+
+        tourist_rows = [(f'Synthetic Tourist {start + k}', f'synthetic{start + k}@example.com',
+                         f'+91{7000000000 + start + k}', ids[k], created) for k in range(n)]
+        location_rows = [(ids[k], float(lat[k, j]), float(lng[k, j]), times[k][j])
+                         for j in range(fixes) for k in range(n)]
+        latest_rows = [(ids[k], float(lat[k, -1]), float(lng[k, -1]), times[k][-1]) for k in range(n)]
+
+        alerted = np.flatnonzero(rng.random(n) < alert_share)
+        alert_types = rng.integers(len(ALERT_TYPES), size=len(alerted))
+        resolved = rng.random(len(alerted)) < 0.7
+        alert_rows = [(ids[k], ALERT_TYPES[t], f"Synthetic {ALERT_TYPES[t].replace('_', ' ')} alert for {ids[k]}",
+                       float(lat[k, -1]), float(lng[k, -1]), times[k][-1], bool(r), rng.bytes(16).hex())
+                      for k, t, r in zip(alerted.tolist(), alert_types.tolist(), resolved.tolist())]
+
+        grouped = int(n * group_share) // group_size * group_size if group_size > 1 else 0
+        codes = {}
+        group_rows, member_rows = [], []
+        for first in range(0, grouped, group_size):
+            group_number += 1
+            code = f'SG{group_number:08d}'
+            codes[code] = ids[first:first + group_size]
+            group_rows.append((f'Synthetic Group {group_number}', code, ids[first], created))
+
+        with engine.begin() as conn:
+            insert_rows(conn, 'tourist', ('name', 'email', 'phone', 'tourist_id', 'created_at'), tourist_rows)
+            insert_rows(conn, 'location', ('tourist_id', 'latitude', 'longitude', 'timestamp'), location_rows)
+            insert_rows(conn, 'latest_location', ('tourist_id', 'latitude', 'longitude', 'timestamp'), latest_rows)
+            if alert_rows:
+                insert_rows(conn, 'alert', ('tourist_id', 'alert_type', 'message', 'latitude', 'longitude',
+                                            'timestamp', 'resolved', 'correlation_id'), alert_rows)
+            if group_rows:
+                insert_rows(conn, 'group', ('name', 'group_code', 'created_by', 'created_at'), group_rows)
+                group_ids = conn.execute(
+                    text('SELECT id, group_code FROM "group" WHERE group_code BETWEEN :first AND :last'),
+                    {'first': group_rows[0][1], 'last': group_rows[-1][1]}
+                ).all()
+                member_rows = [(group_id, member, created) for group_id, code in group_ids for member in codes[code]]
+                insert_rows(conn, 'group_member', ('group_id', 'tourist_id', 'joined_at'), member_rows)
+        for table, rows in (('tourist', tourist_rows), ('location', location_rows), ('latest_location', latest_rows),
+                            ('alert', alert_rows), ('group', group_rows), ('group_member', member_rows)):
+            counts[table] += len(rows)
+
+    print(f"🧪 Generated {tourists} synthetic tourists ({counts['location']} fixes, {counts['alert']} alerts, "
+          f"{counts['group']} groups) in {time.perf_counter() - started:.1f}s")
+    return counts
+
+
+def main():
+    args = sys.argv[1:]
+    tourists = int(args[args.index('--tourists') + 1]) if '--tourists' in args else 10000
+    seed = int(args[args.index('--seed') + 1]) if '--seed' in args else 42
+    if '--db' in args:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.abspath(args[args.index('--db') + 1])}"
+
+    import storage
+    generate(storage.get_engine(), tourists, seed=seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""
+Compact per-tourist track files for trajectory replay
+Each tourist's fixes are kept in one file under instance/tracks/ as rows of
+three int32 deltas (seconds, latitude and longitude in microdegrees) after a
+small header holding the first and last absolute values. Files are memory-
+mapped and decoded with a cumulative sum, so a 100k point track is 1.2 MB on
+disk and reads in a few milliseconds.
+
+Files are filled lazily from `location` (and the retention archive for fixes
+that have already left it) the first time a track is read, then topped up with
+newer rows at most every TRACK_SYNC_SECONDS. Timestamps are kept to the second.
+Files only take fixes up to the id horizon (id_tail.py), below which no
+insert can still be uncommitted, so a fix that commits out of id order is not
+skipped.
+"""
+
+import fcntl
+import hashlib
+import os
+import re
+import struct
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import select
+
+from id_tail import IdTail
+from models import Location
+import retention
+
+MAGIC = b'TRK1'
+# magic, count, last location id, synced at, first (t, lat, lng), last (t, lat, lng)
+HEADER = struct.Struct('<4sqqqqiiqii4x')
+ROW_DTYPE = np.dtype('<i4')
+ROW_BYTES = 3 * ROW_DTYPE.itemsize
+SAFE_NAME = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+location = Location.__table__
+
+
+def to_micro(degrees):
+    return np.rint(np.asarray(degrees, dtype=np.float64) * 1e6).astype(np.int64)
+
+
+def to_seconds(timestamps):
+    return np.array(timestamps, dtype='datetime64[s]').astype(np.int64)
+
+
+def encode_polyline(latitude, longitude, precision=5):
+    """Google encoded polyline of the points (degrees), built with array operations"""
+    if len(latitude) == 0:
+        return ''
+    factor = 10 ** precision
+    coords = np.empty((len(latitude), 2), dtype=np.int64)
+    coords[:, 0] = np.rint(np.asarray(latitude) * factor)
+    coords[:, 1] = np.rint(np.asarray(longitude) * factor)
+    values = np.diff(coords, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = np.where(values < 0, ~(values << 1), values << 1).astype(np.uint32)
+
+    # Up to 7 five-bit chunks per value, low bits first; all but the last get the 0x20 continuation bit
+    shifts = np.arange(0, 35, 5, dtype=np.uint32)
+    shifted = values[:, None] >> shifts
+    lengths = np.maximum(1, np.count_nonzero(shifted, axis=1))
+    positions = np.arange(len(shifts))
+    chars = (shifted & 31).astype(np.uint8) + 63
+    chars[positions < lengths[:, None] - 1] += 0x20
+    return chars[positions < lengths[:, None]].tobytes().decode('ascii')
+
+
+class Track:
+    """Decoded fixes: epoch seconds plus latitude/longitude in degrees"""
+
+    def __init__(self, seconds, latitude, longitude):
+        self.seconds = seconds
+        self.latitude = latitude
+        self.longitude = longitude
+
+    def __len__(self):
+        return len(self.seconds)
+
+
+EMPTY_TRACK = Track(np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0))
+
+
+class TrackStore:
+    def __init__(self):
+        self.directory = None
+        self.sync_seconds = 2.0
+        self._synced = {}
+        self._lock = threading.Lock()
+        self._tail = None
+        self._tail_refreshed = float('-inf')
+        self._tail_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.directory = os.path.join(app.instance_path, 'tracks')
+        self.sync_seconds = app.config.get('TRACK_SYNC_SECONDS', self.sync_seconds)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, tourist_id):
+        name = tourist_id if SAFE_NAME.match(tourist_id) else hashlib.sha1(tourist_id.encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}.trk")
+
+    def track(self, tourist_id, conn, since=None, until=None):
+        """Fixes with since <= timestamp < until, syncing the file from the database first if due"""
+        now = time.monotonic()
+        with self._lock:
+            due = now - self._synced.get(tourist_id, float('-inf')) >= self.sync_seconds
+            if due:
+                self._synced[tourist_id] = now
+        if due:
+            self.sync(tourist_id, conn)
+        return self.read(tourist_id, since, until)
+
+    def read(self, tourist_id, since=None, until=None):
+        try:
+            f = open(self.path(tourist_id), 'rb')
+        except FileNotFoundError:
+            return EMPTY_TRACK
+        with f:
+            # Shared lock: a rewrite after out-of-order fixes happens in place under the exclusive lock
+            fcntl.flock(f, fcntl.LOCK_SH)
+            header = self._read_header(f)
+            if header is None or header['count'] == 0:
+                return EMPTY_TRACK
+            rows = np.memmap(f, dtype=ROW_DTYPE, mode='r', offset=HEADER.size, shape=(header['count'], 3))
+            seconds = np.cumsum(rows[:, 0], dtype=np.int64) + header['first'][0]
+            lo = np.searchsorted(seconds, to_seconds(since)) if since else 0
+            hi = np.searchsorted(seconds, to_seconds(until)) if until else len(seconds)
+            # Positions are only decoded up to the end of the requested range
+            latitude = np.cumsum(rows[:hi, 1], dtype=np.int64)[lo:] + header['first'][1]
+            longitude = np.cumsum(rows[:hi, 2], dtype=np.int64)[lo:] + header['first'][2]
+            del rows
+        return Track(seconds[lo:hi], latitude / 1e6, longitude / 1e6)
+
+    def horizon(self, conn):
+        """Location id up to which every committed fix has been seen (refreshed at most every sync_seconds)"""
+        with self._tail_lock:
+            now = time.monotonic()
+            if self._tail is None:
+                self._tail = IdTail('location')
+                self._tail.seed(conn)
+                self._tail_refreshed = now
+            elif now - self._tail_refreshed >= self.sync_seconds:
+                self._tail.refresh(conn)
+                self._tail_refreshed = now
+            return self._tail.horizon
+
+    def sync(self, tourist_id, conn):
+        """Append fixes newer than the file's last location id; returns how many were added"""
+        horizon = self.horizon(conn)
+        with open(os.open(self.path(tourist_id), os.O_RDWR | os.O_CREAT, 0o644), 'r+b') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            header = self._read_header(f)
+            last_id = header['last_id'] if header else 0
+            fixes = []
+            if header is None or header['synced_at'] < time.time() - retention.HOT_WINDOW.total_seconds():
+                # Fixes may have moved to the archive since the last sync
+                since = None if header is None else \
+                    datetime.utcfromtimestamp(header['synced_at']) - retention.HOT_WINDOW - timedelta(days=1)
+                fixes.extend((fix['id'], fix['timestamp'], fix['latitude'], fix['longitude'])
+                             for fix in retention.read_archive(tourist_id=tourist_id, since=since)
+                             if fix['id'] > last_id)
+            fixes.extend(conn.execute(
+                select(location.c.id, location.c.timestamp, location.c.latitude, location.c.longitude)
+                .where(location.c.tourist_id == tourist_id, location.c.id > last_id, location.c.id <= horizon)
+            ).all())
+            if fixes:
+                fixes.sort(key=lambda fix: (fix[1], fix[0]))
+                ids, times, lats, lngs = zip(*fixes)
+                new = np.column_stack((to_seconds(times), to_micro(lats), to_micro(lngs)))
+                # Every committed fix of this tourist up to the horizon is now in the file
+                self._write(f, header, new, max(last_id, horizon, max(ids)))
+            else:
+                # Remember the sync so an empty track does not rescan the archive every time
+                header = header or {'count': 0, 'last_id': 0, 'first': np.zeros(3, dtype=np.int64),
+                                    'last': np.zeros(3, dtype=np.int64)}
+                header['synced_at'] = int(time.time())
+                header['last_id'] = max(last_id, horizon)
+                self._write_header(f, header)
+            return len(fixes)
+
+    def _write(self, f, header, new, last_id):
+        if header is not None and header['count'] and new[0, 0] < header['last'][0]:
+            # Fixes arrived out of order: merge with the stored track and rewrite the file
+            f.seek(HEADER.size)
+            rows = np.frombuffer(f.read(header['count'] * ROW_BYTES), dtype=ROW_DTYPE).reshape(-1, 3)
+            old = np.cumsum(rows, axis=0, dtype=np.int64) + header['first']
+            merged = np.concatenate((old, new))
+            new = merged[np.argsort(merged[:, 0], kind='stable')]
+            header = None
+        if header is None or header['count'] == 0:
+            header = {'count': 0, 'first': new[0].copy(), 'last': new[0].copy()}
+            f.truncate(HEADER.size)
+        deltas = np.diff(new, axis=0, prepend=header['last'][None, :]).astype(ROW_DTYPE)
+        f.seek(HEADER.size + header['count'] * ROW_BYTES)
+        f.write(deltas.tobytes())
+        header.update(count=header['count'] + len(new), last_id=last_id, last=new[-1], synced_at=int(time.time()))
+        f.flush()
+        self._write_header(f, header)
+
+    def _read_header(self, f):
+        f.seek(0)
+        data = f.read(HEADER.size)
+        if len(data) < HEADER.size:
+            return None
+        magic, count, last_id, synced_at, t0, lat0, lng0, t1, lat1, lng1 = HEADER.unpack(data)
+        if magic != MAGIC:
+            return None
+        return {
+            'count': count,
+            'last_id': last_id,
+            'synced_at': synced_at,
+            'first': np.array((t0, lat0, lng0), dtype=np.int64),
+            'last': np.array((t1, lat1, lng1), dtype=np.int64)
+        }
+
+    def _write_header(self, f, header):
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, header['count'], header['last_id'], header['synced_at'],
+                            *(int(v) for v in header['first']), *(int(v) for v in header['last'])))
+        f.flush()
+
+
+track_store = TrackStore()
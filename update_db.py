@@ -1,25 +1,22 @@
 #!/usr/bin/env python3
 """
 Database update script for Smart Tourist Safety System
-Adds group functionality tables
+Applies pending schema migrations (tables, backfills and indexes)
 """
 
 from app import app
-from models import db
+from migrations import upgrade
 
 def update_database():
-    """Create new tables for group functionality"""
+    """Bring an existing database up to the current schema"""
     with app.app_context():
         try:
-            # Create all tables (including new Group and GroupMember tables)
-            db.create_all()
+            applied = upgrade()
             print("Database updated successfully!")
-            print("Group and GroupMember tables created")
-            print("\nNew features added:")
-            print("   - Create tourist groups")
-            print("   - Join groups with group codes")
-            print("   - View group member locations")
-            print("   - Group-wide panic alerts")
+            if applied:
+                print(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+            else:
+                print("No pending migrations")
             
         except Exception as e:
             print(f"Error updating database: {e}")